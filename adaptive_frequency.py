@@ -0,0 +1,135 @@
+"""
+AdaptiveFrequency: A class to learn from the time slot history when new slots are usually
+released and to search more often around those times and less often in quiet periods.
+Imports:
+- logging: Logging facility for Python.
+- threading: Used to share the learned profiles between the worker threads.
+- datetime: Used to bucket the release times by time of day.
+
+Example usage:
+adaptive = AdaptiveFrequency(slot_store, scan_budget=120)
+interval = adaptive.get_interval('job', [config_key], base=5, min_interval=2, max_interval=15)
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveFrequency:
+    """
+    Represents the adaptive search frequencies.
+    The day is split in buckets and the first-seen times of the slots of each search are
+    counted per bucket. A bucket with more releases than the daily average (or followed by
+    one) gets a proportionally shorter interval, a bucket without releases twice the
+    configured one, always within the bounds of the search. When the adaptive searches
+    together exceed the scan budget, their intervals are stretched to fit it.
+    Args:
+        slot_store (SlotStore): The time slot history.
+        scan_budget (int): Maximum searches per hour of all adaptive searches, 0 for no limit.
+        bucket_minutes (int): Size of the time of day buckets.
+        history_days (int): Days of history used to learn the release times.
+        refresh (int): Seconds after which a learned profile is read again from the history.
+    Methods:
+        get_interval(job_key, config_keys, base, min_interval, max_interval): Gets the interval.
+        get_profile(job_key, config_keys): Gets the releases per bucket.
+        forget(job_key): Forgets a job that is no longer scheduled.
+    """
+    def __init__(self, slot_store, scan_budget=0, bucket_minutes=30, history_days=14,
+                 refresh=600):
+        """
+        Initializes the AdaptiveFrequency.
+        """
+        self.slot_store = slot_store
+        self.scan_budget = scan_budget
+        self.bucket_minutes = max(1, bucket_minutes)
+        self.history_days = history_days
+        self.refresh = refresh
+        self.__profiles = {}
+        self.__rates = {}
+        self.__intervals = {}
+        self.__lock = threading.Lock()
+
+    def get_interval(self, job_key, config_keys, base, min_interval, max_interval, now=None):
+        """
+        Gets the minutes until the next search of a job.
+        Args:
+        - job_key (str): Identifies the scheduled job.
+        - config_keys (list): The configuration keys whose history drives the job.
+        - base (float): The configured frequency, in minutes.
+        - min_interval (float): The shortest allowed interval, in minutes.
+        - max_interval (float): The longest allowed interval, in minutes.
+        - now (datetime): The current time. Defaults to now.
+        Returns:
+        - float: The interval in minutes.
+        """
+        now = now or datetime.now()
+        profile = self.get_profile(job_key, config_keys, now)
+        buckets = len(profile)
+        total = sum(profile)
+        interval = base
+        if total:
+            bucket = self.__bucket(now) % buckets
+            heat = max(profile[bucket], profile[(bucket + 1) % buckets])
+            mean = total / buckets
+            interval = base * 2 * mean / (heat + mean)
+        interval = min(max(interval, min_interval), max_interval)
+
+        with self.__lock:
+            self.__rates[job_key] = 60 / interval
+            scheduled = sum(self.__rates.values())
+            if self.scan_budget and scheduled > self.scan_budget:
+                interval = min(interval * scheduled / self.scan_budget, max_interval)
+                self.__rates[job_key] = 60 / interval
+            changed = round(self.__intervals.get(job_key, 0), 1) != round(interval, 1)
+            self.__intervals[job_key] = interval
+        if changed:
+            logger.info('Adaptive frequency of %s: every %.1f minutes', job_key, interval)
+        return interval
+
+    def get_profile(self, job_key, config_keys, now=None):
+        """
+        Gets the number of slot releases per time of day bucket, read again from the history
+        once the profile is older than the refresh period.
+        Args:
+        - job_key (str): Identifies the scheduled job.
+        - config_keys (list): The configuration keys whose history is counted.
+        - now (datetime): The current time. Defaults to now.
+        Returns:
+        - list: The releases of each bucket, starting at midnight.
+        """
+        now = now or datetime.now()
+        with self.__lock:
+            learned_at, profile = self.__profiles.get(job_key, (None, None))
+        if learned_at is not None and (now - learned_at).total_seconds() < self.refresh:
+            return profile
+
+        profile = [0] * (24 * 60 // self.bucket_minutes)
+        since = now - timedelta(days=self.history_days)
+        for config_key in config_keys:
+            for first_seen in self.slot_store.get_release_times(config_key, since):
+                profile[self.__bucket(first_seen) % len(profile)] += 1
+        with self.__lock:
+            self.__profiles[job_key] = (now, profile)
+        return profile
+
+    def forget(self, job_key):
+        """
+        Forgets the learned profile and the scan rate of a job that is no longer scheduled.
+        Args:
+        - job_key (str): Identifies the scheduled job.
+        """
+        with self.__lock:
+            self.__profiles.pop(job_key, None)
+            self.__rates.pop(job_key, None)
+            self.__intervals.pop(job_key, None)
+
+    def __bucket(self, moment):
+        """
+        Gets the bucket of a time of day. When bucket_minutes does not divide the day, the last
+        minutes are past the last bucket and are counted in the first one, modulo the buckets.
+        """
+        return (moment.hour * 60 + moment.minute) // self.bucket_minutes
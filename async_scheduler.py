@@ -0,0 +1,294 @@
+"""
+AsyncScheduler: An asyncio scheduler that sleeps exactly until the next eligible run of each job,
+honouring its daily time window, and offloads the blocking searches to an executor.
+Imports:
+- random: Used for the jitter of the runs.
+- signal: Used for the graceful shutdown on SIGINT and SIGTERM.
+- asyncio: The event loop.
+- logging: Logging facility for Python.
+- datetime: Used to compute the next eligible run from the time window.
+
+Example usage:
+scheduler = AsyncScheduler(submit=executor.submit)
+scheduler.add_job('tag', 5, task, config_instance, start_time='07:00', end_time='23:59')
+asyncio.run(scheduler.run())
+"""
+import random
+import signal
+import asyncio
+import logging
+from datetime import datetime, timedelta, time as dt_time
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def parse_time(value):
+    """
+    Parses a time of the day.
+    Args:
+    - value (str or datetime.time): "HH:MM" or an already parsed time.
+    Returns:
+    - datetime.time: The parsed time.
+    """
+    if isinstance(value, dt_time):
+        return value
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def in_time_window(moment, start_time, end_time):
+    """
+    Checks whether a moment falls inside a daily time window.
+    The window includes the whole end minute and may cross midnight (start after end).
+    Args:
+    - moment (datetime): The moment to check.
+    - start_time (datetime.time): Start of the window.
+    - end_time (datetime.time): End of the window.
+    Returns:
+    - bool: True if the moment is inside the window.
+    """
+    start = start_time.replace(second=0, microsecond=0)
+    end = end_time.replace(second=59, microsecond=999999)
+    current = moment.time()
+    if start <= end:
+        return start <= current <= end
+    return current >= start or current <= end
+
+
+def next_eligible(candidate, start_time, end_time):
+    """
+    Gets the first moment at or after candidate that falls inside the daily time window,
+    as checked by in_time_window.
+    Args:
+    - candidate (datetime): The wanted run.
+    - start_time (datetime.time): Start of the window.
+    - end_time (datetime.time): End of the window.
+    Returns:
+    - datetime: The next eligible run.
+    """
+    if in_time_window(candidate, start_time, end_time):
+        return candidate
+    start = start_time.replace(second=0, microsecond=0)
+    day = candidate.date() if candidate.time() < start else candidate.date() + timedelta(days=1)
+    return datetime.combine(day, start)
+
+
+class ScheduledJob:
+    """
+    Represents a job of the scheduler.
+    Attributes:
+        tag (str): Identifies the job.
+        interval (float or callable): Minutes between two runs.
+        fn (callable): The blocking function to run.
+        args (tuple): The arguments of the function.
+        start_time (datetime.time): Start of the daily time window.
+        end_time (datetime.time): End of the daily time window.
+        jitter (float): Maximum seconds randomly added to each run.
+        last_run (datetime): When the job last started, None before the first run.
+        next_run (datetime): When the job runs next.
+    """
+    def __init__(self, tag, interval, fn, args, start_time='00:00', end_time='23:59', jitter=0):
+        """
+        Initializes the ScheduledJob.
+        """
+        self.tag = tag
+        self.interval = interval
+        self.fn = fn
+        self.args = args
+        self.start_time = parse_time(start_time)
+        self.end_time = parse_time(end_time)
+        self.jitter = jitter
+        self.last_run = None
+        self.next_run = None
+
+    def get_interval(self):
+        """
+        Gets the minutes until the next run. The interval may be a callable, asked again
+        before each run, to let the job change its frequency.
+        Returns:
+            float: The interval in minutes.
+        """
+        return self.interval() if callable(self.interval) else self.interval
+
+    def compute_next_run(self, now=None):
+        """
+        Computes the next eligible run, one interval after the previous one (or after now on
+        the first run, like the schedule library did) and moved to the start of the time window
+        when it falls outside it.
+        Args:
+        - now (datetime): The current time. Defaults to now.
+        Returns:
+        - datetime: The next run, jitter included.
+        """
+        now = now or datetime.now()
+        candidate = max(now, (self.last_run or now) + timedelta(minutes=self.get_interval()))
+        self.next_run = next_eligible(candidate, self.start_time, self.end_time)
+        if self.jitter:
+            self.next_run += timedelta(seconds=random.uniform(0, self.jitter))
+        return self.next_run
+
+
+class AsyncScheduler:
+    """
+    Represents an asyncio scheduler of blocking jobs.
+    Each job is an asyncio task that sleeps until its next eligible run and then waits for the
+    blocking function to finish on the executor, so a job never overlaps itself.
+    Args:
+        submit (callable): Runs (key, fn, *args) on an executor and returns a
+                           concurrent.futures.Future, or None when the run is skipped.
+                           Defaults to the default executor of the event loop.
+        jitter (float): Default maximum seconds randomly added to each run.
+        shutdown_timeout (float): Seconds to wait for the running jobs on shutdown.
+    Methods:
+        add_job(tag, interval, fn, *args, ...): Schedules a job.
+        remove_job(tag): Cancels and removes a job.
+        get_jobs(): Returns the scheduled jobs.
+        run(*background): Runs the jobs, and optional background coroutines, until stop().
+        stop(): Requests a graceful shutdown.
+    """
+    def __init__(self, submit=None, jitter=0, shutdown_timeout=60):
+        """
+        Initializes the AsyncScheduler.
+        """
+        self.submit = submit
+        self.jitter = jitter
+        self.shutdown_timeout = shutdown_timeout
+        self.__jobs = {}
+        self.__tasks = {}
+        self.__running = set()
+        self.__loop = None
+        self.__stopping = None
+
+    def add_job(self, tag, interval, fn, *args, start_time='00:00', end_time='23:59',
+                jitter=None):
+        """
+        Schedules a job, replacing any job with the same tag. A replaced job keeps its last
+        run, so rescheduling it does not trigger an extra search.
+        Args:
+        - tag (str): Identifies the job.
+        - interval (float or callable): Minutes between two runs, or a function returning them.
+        - fn (callable): The blocking function to run.
+        - args: The arguments of the function.
+        - start_time (str): Start of the daily time window, "HH:MM".
+        - end_time (str): End of the daily time window, "HH:MM".
+        - jitter (float): Maximum seconds randomly added to each run. Defaults to the scheduler's.
+        Returns:
+        - ScheduledJob: The job.
+        """
+        previous = self.__jobs.get(tag)
+        self.remove_job(tag)
+        job = ScheduledJob(tag, interval, fn, args, start_time, end_time,
+                           self.jitter if jitter is None else jitter)
+        if previous is not None:
+            job.last_run = previous.last_run
+        self.__jobs[tag] = job
+        if self.__loop is not None:
+            self.__start(job)
+        return job
+
+    def remove_job(self, tag):
+        """
+        Cancels and removes a job. A run already in progress is left to finish.
+        Args:
+        - tag (str): Identifies the job.
+        Returns:
+        - bool: True if the job existed.
+        """
+        job = self.__jobs.pop(tag, None)
+        task = self.__tasks.pop(tag, None)
+        if task is not None:
+            task.cancel()
+        return job is not None
+
+    def get_jobs(self):
+        """
+        Returns the scheduled jobs.
+        Returns:
+        - list: The ScheduledJob instances.
+        """
+        return list(self.__jobs.values())
+
+    async def run(self, *background):
+        """
+        Runs the jobs until stop() is called or a shutdown signal is received, then waits up
+        to shutdown_timeout seconds for the running jobs to finish.
+        Args:
+        - background: Coroutines run on the same loop, like the configuration watcher, and
+                      cancelled on shutdown.
+        """
+        self.__loop = asyncio.get_running_loop()
+        self.__stopping = asyncio.Event()
+        self.__install_signal_handlers()
+        for job in self.__jobs.values():
+            self.__start(job)
+        helpers = [self.__loop.create_task(coroutine) for coroutine in background]
+        try:
+            await self.__stopping.wait()
+        finally:
+            logger.info('Scheduler stopping, cancelling %s job(s)', len(self.__tasks))
+            for task in list(self.__tasks.values()) + helpers:
+                task.cancel()
+            await asyncio.gather(*self.__tasks.values(), *helpers, return_exceptions=True)
+            self.__tasks.clear()
+            if self.__running:
+                logger.info('Waiting for %s running job(s) to finish', len(self.__running))
+                await asyncio.wait(self.__running, timeout=self.shutdown_timeout)
+            self.__loop = None
+
+    def stop(self):
+        """
+        Requests a graceful shutdown. Safe to call from any thread.
+        """
+        if self.__loop is None or self.__stopping is None:
+            return
+        self.__loop.call_soon_threadsafe(self.__stopping.set)
+
+    def __start(self, job):
+        """Starts the asyncio task of a job."""
+        self.__tasks[job.tag] = self.__loop.create_task(self.__run_job(job),
+                                                       name=f'job-{job.tag}')
+
+    async def __run_job(self, job):
+        """Sleeps until each eligible run of the job and runs it on the executor."""
+        while True:
+            next_run = job.compute_next_run()
+            delay = (next_run - datetime.now()).total_seconds()
+            logger.debug('Job %s sleeps %.0fs until %s', job.tag, max(0, delay),
+                         next_run.strftime('%Y-%m-%d %H:%M:%S'))
+            if delay > 0:
+                await asyncio.sleep(delay)
+            job.last_run = datetime.now()
+            future = self.__submit(job)
+            if future is None:
+                continue
+            self.__running.add(future)
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex: # pylint: disable=broad-except
+                # A custom executor reports the errors of its own runs
+                if self.submit is None:
+                    logger.error('Job %s failed: %s', job.tag, ex, exc_info=ex)
+            finally:
+                if future.done():
+                    self.__running.discard(future)
+                else:
+                    future.add_done_callback(self.__running.discard)
+
+    def __submit(self, job):
+        """Runs a job on the executor, returning an asyncio future or None if skipped."""
+        if self.submit is None:
+            return self.__loop.run_in_executor(None, job.fn, *job.args)
+        future = self.submit(job.tag, job.fn, *job.args)
+        return asyncio.wrap_future(future) if future is not None else None
+
+    def __install_signal_handlers(self):
+        """Stops the scheduler on SIGINT and SIGTERM where the event loop supports it."""
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.__loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError, ValueError):
+                logger.debug('Signal handlers not supported, use CTRL + C to stop')
+                return
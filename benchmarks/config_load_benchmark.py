@@ -0,0 +1,130 @@
+"""
+Configuration load benchmark.
+Generates configuration files with many searches (one per service desk, like a generated
+configuration would) and measures how long YamlLoader takes to load and validate them: on a
+cold start, with the validation cache on disk, reusing a previous load (the hot reload) and
+with parallel validation. The results are written as JSON to compare runs over time.
+
+Usage:
+python benchmarks/config_load_benchmark.py [--scenarios 100,1000,5000] [--workers 4]
+                                           [--repeat 3] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def write_configs(count, directory):
+    """
+    Writes a configuration file with count searches, one per generated service desk.
+    Returns:
+    - str: The path of the file.
+    """
+    import yaml # pylint: disable=import-outside-toplevel
+    searches = [{'search': {'title': f'Desk {i + 1}', 'start_time': '08:00', 'end_time': '20:00',
+                            'max_days': 30, 'frequency': 2 + i % 9, 'entity_opt': 176,
+                            'service_opt': {'tema': 22002, 'subtema': 22003, 'motivo': 22705},
+                            'location_opt': {'distrito': 1 + i % 18, 'localidade': -1,
+                                             'local_atendimento': 1000 + i},
+                            'wait_opt': {'default': {'timeout': 20}}}}
+                for i in range(count)]
+    path = os.path.join(directory, f'config_{count}.yaml')
+    with open(path, 'w', encoding='utf8') as file:
+        yaml.safe_dump(searches, file, sort_keys=False)
+    return path
+
+
+def timed(repeat, load, prepare=None):
+    """
+    Runs a load several times.
+    Returns:
+    - tuple: The best seconds and the loaded YamlLoader.
+    """
+    best = None
+    loader = None
+    for _ in range(repeat):
+        if prepare:
+            prepare()
+        started = time.perf_counter()
+        loader = load()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, loader
+
+
+def run_scenario(count, workers, repeat, directory):
+    """
+    Measures the loads of a file with count searches.
+    Returns:
+    - dict: The best time of each kind of load, in milliseconds.
+    """
+    from yaml_loader import YamlLoader # pylint: disable=import-outside-toplevel
+    path = write_configs(count, directory)
+    cache = os.path.join(directory, f'config_{count}.cache.json')
+
+    def clear_cache():
+        if os.path.exists(cache):
+            os.remove(cache)
+
+    cold, loader = timed(repeat, lambda: YamlLoader(path), clear_cache)
+    valids = loader.get_len_valid_configs()
+    YamlLoader(path, cache_path=cache)
+    cached, _ = timed(repeat, lambda: YamlLoader(path, cache_path=cache))
+    reused, _ = timed(repeat, lambda: YamlLoader(path, previous=loader))
+    result = {'configs': count, 'valid': valids,
+              'cold_ms': round(cold * 1000, 1),
+              'disk_cache_ms': round(cached * 1000, 1),
+              'reload_ms': round(reused * 1000, 1)}
+    if workers > 1:
+        parallel, _ = timed(repeat, lambda: YamlLoader(path, workers=workers))
+        result[f'parallel_{workers}_ms'] = round(parallel * 1000, 1)
+    return result
+
+
+def main(argv=None):
+    """
+    Runs the benchmark.
+    Returns:
+    - int: 0 if every configuration was valid, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scenarios', default='100,1000,5000',
+                        help='comma separated numbers of configurations')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='processes of the parallel validation, 1 to skip it')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each load, the best is kept')
+    parser.add_argument('--output', help='JSON file to write, defaults to benchmarks/results/')
+    args = parser.parse_args(argv)
+
+    os.chdir(ROOT)
+    import logging # pylint: disable=import-outside-toplevel
+    logging.basicConfig(level=logging.WARNING)
+
+    report = {'started_at': datetime.now().isoformat(timespec='seconds'),
+              'python': sys.version.split()[0], 'platform': sys.platform,
+              'cpus': os.cpu_count(), 'scenarios': []}
+    with tempfile.TemporaryDirectory() as directory:
+        for count in (int(c) for c in args.scenarios.split(',') if c.strip()):
+            result = run_scenario(count, args.workers, max(1, args.repeat), directory)
+            report['scenarios'].append(result)
+            print(json.dumps(result))
+
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results',
+        f'config_load_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf8') as file:
+        json.dump(report, file, indent=2)
+    print(f'Results written to {output}')
+    return 0 if all(s['valid'] == s['configs'] for s in report['scenarios']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
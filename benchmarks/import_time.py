@@ -0,0 +1,70 @@
+"""
+Import-time benchmark of siga.py.
+Imports siga in fresh interpreters, reports the best wall time and fails when it exceeds the
+budget or when any of the heavy modules is loaded by the import.
+
+Usage:
+python benchmarks/import_time.py [--runs 5] [--max-ms 150]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('selenium', 'requests', 'notifypy', 'asyncio', 'cerberus', 'yaml', 'dotenv',
+                 'webdriver_manager')
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import siga
+elapsed = (time.perf_counter() - started) * 1000
+heavy = sorted(m for m in %r if m in sys.modules)
+print(json.dumps({'ms': elapsed, 'heavy': heavy}))
+""" % (HEAVY_MODULES,)
+
+
+def measure(runs):
+    """
+    Imports siga in fresh interpreters.
+    Args:
+    - runs (int): Number of interpreters to start.
+    Returns:
+    - list of dict: The import time in milliseconds and the heavy modules loaded, per run.
+    """
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main(argv=None):
+    """
+    Runs the benchmark.
+    Returns:
+    - int: 0 if the import is within budget and lazy, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=150.0)
+    args = parser.parse_args(argv)
+
+    results = measure(args.runs)
+    best = min(r['ms'] for r in results)
+    heavy = sorted({m for r in results for m in r['heavy']})
+    print(json.dumps({'best_ms': round(best, 2), 'max_ms': args.max_ms, 'runs': args.runs,
+                      'heavy_modules_loaded': heavy}))
+    if heavy:
+        print(f'FAIL: importing siga loaded {", ".join(heavy)}')
+        return 1
+    if best > args.max_ms:
+        print(f'FAIL: importing siga took {best:.1f} ms (budget {args.max_ms} ms)')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
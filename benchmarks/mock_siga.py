@@ -0,0 +1,413 @@
+"""
+Mock SIGA site for the benchmarks.
+Serves trimmed copies of the SIGA booking pages (Entidades, the step 2 and step 3 forms, the
+schedule list and the error message page) from a local HTTP server, so both scan engines can
+run the whole booking flow offline. Dependent dropdowns are filled by JavaScript after the
+configured latency, like the real site does after its AJAX calls. Every page also loads a
+stylesheet, a web font, an image and an analytics script of about the real sizes, and the
+bytes served are counted to compare the browser profiles. The Entidades page starts a session
+cookie and the form submissions of an unknown or expired session are redirected back to it,
+like the real site does. Clicking a time slot opens the booking details form, which books the
+slot when confirmed: booked slots are no longer listed and are counted to test the fast claim.
+
+Catalog:
+- Entity 176 (IRN), category 22002 / subcategory 22003 / motive 22705 and
+  category 22061 / subcategory 22062 / motive 22066.
+- District 11 (Lisboa): localidade 17 with service desk 591 has slots, localidade 6 with
+  service desk 889 answers with the error message, localidade -1 lists every location.
+- Booking details: Nome, Email, Telemovel and NumeroDocumento, all required.
+
+Usage:
+python benchmarks/mock_siga.py [--port 8000] [--latency 50]
+"""
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from datetime import date, timedelta
+from urllib.parse import parse_qs
+from http.cookies import SimpleCookie
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ENTITIES_PATH = '/Marcacao/Entidades'
+SESSION_COOKIE = 'ASP.NET_SessionId'
+
+ENTITIES = {'176': 'IRN - Instituto dos Registos e do Notariado'}
+CATEGORIES = {'22002': 'Cartão de Cidadão', '22061': 'Nacionalidade'}
+SUBCATEGORIES = {'22002': {'22003': 'Pedido / Renovação'},
+                 '22061': {'22062': 'Atribuição'}}
+MOTIVES = {'22003': {'22705': 'Pedido de Cartão de Cidadão'},
+           '22062': {'22066': 'Entrega de processo'}}
+DISTRICTS = {'11': 'Lisboa'}
+LOCALIDADES = {'11': {'-1': 'Todas', '17': 'Lisboa', '6': 'Cascais'}}
+SERVICE_DESKS = {'17': {'591': 'Loja do Cidadão Laranjeiras'},
+                 '6': {'889': 'Conservatória de Cascais'}}
+# Subresources of every page: path to (content type, body)
+ASSETS = {
+    '/static/site.css': ('text/css', b"@font-face { font-family: 'Mock'; "
+                                     b"src: url('/static/font.woff2') format('woff2'); }\n"
+                                     b"body { font-family: 'Mock', sans-serif; }\n" +
+                         b'/* padding */' * 2500),
+    '/static/font.woff2': ('font/woff2', b'wOF2' + bytes(60 * 1024)),
+    '/static/logo.png': ('image/png', b'\x89PNG\r\n\x1a\n' + bytes(150 * 1024)),
+    '/gtag/js': ('application/javascript', b'window.dataLayer = window.dataLayer || [];\n' +
+                 b'// padding\n' * 7000),
+}
+NO_SLOTS_MESSAGE = 'De momento não existem vagas disponíveis, por favor tente mais tarde.'
+DETAILS_FIELDS = ('Nome', 'Email', 'Telemovel', 'NumeroDocumento')
+
+PAGE = """<!DOCTYPE html>
+<html lang="pt"><head><meta charset="utf-8"><title>SIGA - Marcação de Atendimento</title>
+<style>.hidden {{ display: none; }} select {{ display: block; margin: 4px; }}</style>
+<link rel="stylesheet" href="/static/site.css">
+<script async src="/gtag/js?id=G-MOCK"></script>
+</head><body>
+<img src="/static/logo.png" alt="SIGA">
+{body}
+<script>
+var LATENCY = {latency};
+var OPTIONS = {options};
+function fill(id, parent) {{
+    var select = document.getElementById(id);
+    select.disabled = true;
+    select.innerHTML = '<option value="">Selecione</option>';
+    setTimeout(function () {{
+        var options = (OPTIONS[id] || {{}})[parent] || {{}};
+        Object.keys(options).forEach(function (value) {{
+            var option = document.createElement('option');
+            option.value = value;
+            option.text = options[value];
+            select.appendChild(option);
+        }});
+        select.disabled = false;
+    }}, LATENCY);
+}}
+function pick(desk, slot) {{
+    var form = document.getElementById('formHorario');
+    form.elements['IdLocalAtendimento'].value = desk;
+    form.elements['Horario'].value = slot;
+    form.submit();
+    return false;
+}}
+</script>
+</body></html>
+"""
+
+ENTITIES_BODY = """<div class="container"><h3>Selecione a entidade</h3>
+<form action="/Marcacao/Passo1" method="post">
+<input type="hidden" name="__RequestVerificationToken" value="mock-token">
+{buttons}
+</form></div>"""
+
+NEXT_BUTTON = """<ul class="pager"><li id="liProximoButton">
+<a class="set-date-button" href="#" onclick="document.getElementById('{form}').submit(); return false;">Próximo</a>
+</li></ul>"""
+
+STEP_TWO_BODY = """<form id="formPasso2" action="/Marcacao/Passo2" method="post">
+<input type="hidden" name="IdEntidade" value="{entity}">
+<select id="IdCategoria" name="IdCategoria" onchange="fill('IdSubcategoria', this.value)">
+<option value="">Selecione</option>{categories}</select>
+<select id="IdSubcategoria" name="IdSubcategoria" onchange="fill('IdMotivo', this.value)" disabled>
+<option value="">Selecione</option></select>
+<select id="IdMotivo" name="IdMotivo" disabled><option value="">Selecione</option></select>
+</form>""" + NEXT_BUTTON.replace('{form}', 'formPasso2')
+
+STEP_THREE_BODY = """<form id="formPasso3" action="/Marcacao/Passo3" method="post">
+{hidden}
+<select id="IdDistrito" name="IdDistrito" onchange="fill('IdLocalidade', this.value)">
+<option value="">Selecione</option>{districts}</select>
+<select id="IdLocalidade" name="IdLocalidade" onchange="fill('IdLocalAtendimento', this.value)" disabled>
+<option value="">Selecione</option></select>
+<select id="IdLocalAtendimento" name="IdLocalAtendimento" disabled>
+<option value="">Selecione</option></select>
+</form>""" + NEXT_BUTTON.replace('{form}', 'formPasso3')
+
+RESULTS_BODY = """<form id="formAnterior" action="/Marcacao/Passo2" method="post">{hidden}</form>
+<form id="formHorario" action="/Marcacao/Passo4" method="post">{hidden}
+<input type="hidden" name="IdLocalAtendimento" value=""><input type="hidden" name="Horario" value="">
+</form>
+<ul class="pager"><li id="liAnteriorButton">
+<a href="#" onclick="document.getElementById('formAnterior').submit(); return false;">Anterior</a>
+</li></ul>
+{results}"""
+
+SCHEDULE_LIST = """<div class="schedule-list">{slots}</div>"""
+SLOT = """<div class="col-md-5 m-b-10" title="{title}"><a href="#" onclick="return pick('{desk}', '{label}')"><span>{label}</span></a></div>"""
+ERROR_MESSAGE = """<div class="error-message"><div class="col-md-12 no_padding">
+<h5>{message}</h5></div></div>"""
+
+DETAILS_BODY = """<h3>{title}: {slot}</h3>
+<form id="formPasso4" action="/Marcacao/Passo5" method="post">{hidden}
+<input type="text" id="Nome" name="Nome" required>
+<input type="email" id="Email" name="Email" required>
+<input type="tel" id="Telemovel" name="Telemovel" required>
+<input type="text" id="NumeroDocumento" name="NumeroDocumento" required>
+</form>""" + NEXT_BUTTON.replace('{form}', 'formPasso4')
+
+CONFIRMATION_BODY = """<div class="confirmation"><h3>Marcação confirmada</h3>
+<p>{title}: {slot}</p><p>Código: {code}</p></div>"""
+
+
+def options_html(options):
+    """Function to render the options of a select."""
+    return ''.join(f'<option value="{value}">{label}</option>' for value, label in options.items())
+
+
+def hidden_html(fields):
+    """Function to render hidden inputs."""
+    return '\n'.join(f'<input type="hidden" name="{name}" value="{value}">'
+                     for name, value in fields.items())
+
+
+def slot_labels(service_desk, today=None):
+    """
+    Function to get the slots of a service desk, relative to today so the max_days filter of
+    the searches keeps some of them. Both label formats of the SIGA pages are used.
+    """
+    today = today or date.today()
+    labels = []
+    for days, hour in ((1, '09:00'), (3, '10:30'), (6, '14:15'), (20, '11:00'), (120, '16:45')):
+        day = (today + timedelta(days=days)).strftime('%d-%m-%Y')
+        labels.append(f'{day} {hour}' if days % 2 else f'{hour} - {day}')
+    return labels if service_desk != '889' else []
+
+
+class MockSigaHandler(BaseHTTPRequestHandler):
+    """Serves the pages of the mock SIGA site."""
+    server_version = 'MockSIGA/1.0'
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Serves the Entidades page and the subresources of the pages."""
+        path = self.path.split('?')[0]
+        if path in ASSETS:
+            self.__send_asset(*ASSETS[path])
+            return
+        if path != ENTITIES_PATH:
+            self.send_error(404)
+            return
+        buttons = ''.join(f'<button class="btn btn-selecionar-entidade" id="{value}" '
+                          f'title="{label}" name="IdEntidade" value="{value}" '
+                          f'type="submit">{label}</button>' for value, label in ENTITIES.items())
+        session = None
+        if self.__get_session() not in self.server.sessions:
+            session = uuid.uuid4().hex
+            self.server.sessions.add(session)
+        self.__send(ENTITIES_BODY.format(buttons=buttons), session)
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Serves the pages of the booking steps."""
+        length = int(self.headers.get('Content-Length') or 0)
+        fields = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        self.server.requests += 1
+        if self.__get_session() not in self.server.sessions:
+            self.send_response(302)
+            self.send_header('Location', ENTITIES_PATH)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/Marcacao/Passo1':
+            self.__send(STEP_TWO_BODY.format(entity=fields.get('IdEntidade', ''),
+                                             categories=options_html(CATEGORIES)))
+        elif self.path == '/Marcacao/Passo2':
+            hidden = {k: fields.get(k, '') for k in ('IdEntidade', 'IdCategoria',
+                                                      'IdSubcategoria', 'IdMotivo')}
+            self.__send(STEP_THREE_BODY.format(hidden=hidden_html(hidden),
+                                               districts=options_html(DISTRICTS)))
+        elif self.path == '/Marcacao/Passo3':
+            self.__send_results(fields)
+        elif self.path == '/Marcacao/Passo4':
+            self.__send_details(fields)
+        elif self.path == '/Marcacao/Passo5':
+            self.__send_confirmation(fields)
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Keeps the benchmark output clean."""
+
+    def __get_session(self):
+        """Gets the session cookie of the request, or None."""
+        cookie = SimpleCookie(self.headers.get('Cookie') or '')
+        return cookie[SESSION_COOKIE].value if SESSION_COOKIE in cookie else None
+
+    def __send_results(self, fields):
+        """Serves the schedule list, or the error message when there are no slots."""
+        localidade = fields.get('IdLocalidade', '')
+        if localidade == '-1':
+            desks = [d for desks in SERVICE_DESKS.values() for d in desks.items()]
+        else:
+            desks = list(SERVICE_DESKS.get(localidade, {}).items())
+            if fields.get('IdLocalAtendimento'):
+                desks = [d for d in desks if d[0] == fields['IdLocalAtendimento']]
+        slots = ''.join(SLOT.format(title=title, desk=desk, label=label)
+                        for desk, title in desks for label in slot_labels(desk)
+                        if (desk, label) not in self.server.booked)
+        results = SCHEDULE_LIST.format(slots=slots) if slots else \
+            ERROR_MESSAGE.format(message=NO_SLOTS_MESSAGE)
+        hidden = {k: fields.get(k, '') for k in ('IdEntidade', 'IdCategoria',
+                                                  'IdSubcategoria', 'IdMotivo')}
+        self.__send(RESULTS_BODY.format(hidden=hidden_html(hidden), results=results))
+
+    def __send_details(self, fields):
+        """Serves the booking details form of the picked slot."""
+        desk, slot = fields.get('IdLocalAtendimento', ''), fields.get('Horario', '')
+        titles = {d: t for desks in SERVICE_DESKS.values() for d, t in desks.items()}
+        if desk not in titles or slot not in slot_labels(desk) or \
+                (desk, slot) in self.server.booked:
+            self.__send(ERROR_MESSAGE.format(message=NO_SLOTS_MESSAGE))
+            return
+        hidden = {k: fields.get(k, '') for k in ('IdEntidade', 'IdCategoria', 'IdSubcategoria',
+                                                  'IdMotivo', 'IdLocalAtendimento', 'Horario')}
+        self.__send(DETAILS_BODY.format(title=titles[desk], slot=slot, hidden=hidden_html(hidden)))
+
+    def __send_confirmation(self, fields):
+        """Books the slot of the confirmed details, or serves the error message."""
+        desk, slot = fields.get('IdLocalAtendimento', ''), fields.get('Horario', '')
+        titles = {d: t for desks in SERVICE_DESKS.values() for d, t in desks.items()}
+        if desk not in titles or (desk, slot) in self.server.booked or \
+                not all(fields.get(name) for name in DETAILS_FIELDS):
+            self.__send(ERROR_MESSAGE.format(message=NO_SLOTS_MESSAGE))
+            return
+        self.server.booked.add((desk, slot))
+        self.server.bookings.append({'desk': desk, 'slot': slot,
+                                     **{name: fields[name] for name in DETAILS_FIELDS}})
+        self.__send(CONFIRMATION_BODY.format(title=titles[desk], slot=slot,
+                                             code=len(self.server.bookings)))
+
+    def __send_asset(self, content_type, body):
+        """Sends a subresource after the configured latency."""
+        if self.server.latency:
+            time.sleep(self.server.latency / 1000)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.bytes_sent += len(body)
+
+    def __send(self, body, session=None):
+        """Sends a page after the configured latency, starting a session if given."""
+        if self.server.latency:
+            time.sleep(self.server.latency / 1000)
+        options = {'IdSubcategoria': SUBCATEGORIES, 'IdMotivo': MOTIVES,
+                   'IdLocalidade': LOCALIDADES, 'IdLocalAtendimento': SERVICE_DESKS}
+        page = PAGE.format(body=body, latency=self.server.latency,
+                           options=json.dumps(options, ensure_ascii=False)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        if session:
+            self.send_header('Set-Cookie', f'{SESSION_COOKIE}={session}; Path=/; HttpOnly')
+        self.end_headers()
+        self.wfile.write(page)
+        self.server.bytes_sent += len(page)
+
+
+class MockSigaServer:
+    """
+    Represents the mock SIGA site served on a background thread.
+    Args:
+        port (int): The port to listen on, 0 for any free port.
+        latency (int): Milliseconds added to every page and dependent dropdown.
+    Attributes:
+        url (str): The URL of the Entidades page.
+        requests (int): The form submissions served.
+        bytes_sent (int): The bytes of the pages and subresources served.
+        bookings (list): The confirmed bookings, with the service desk, slot and details.
+    Methods:
+        start(): Starts serving.
+        expire_sessions(): Forgets every session, like the site does after a while.
+        stop(): Stops serving.
+    """
+    def __init__(self, port=0, latency=0):
+        """
+        Initializes the MockSigaServer.
+        """
+        self.__server = ThreadingHTTPServer(('127.0.0.1', port), MockSigaHandler)
+        self.__server.latency = latency
+        self.__server.requests = 0
+        self.__server.bytes_sent = 0
+        self.__server.sessions = set()
+        self.__server.booked = set()
+        self.__server.bookings = []
+        self.__thread = None
+
+    @property
+    def url(self):
+        """
+        Gets the URL of the Entidades page.
+        Returns:
+            str: The URL to use as SIGA_URL.
+        """
+        return f'http://127.0.0.1:{self.__server.server_port}{ENTITIES_PATH}'
+
+    @property
+    def requests(self):
+        """
+        Gets the number of form submissions served.
+        Returns:
+            int: The number of POST requests.
+        """
+        return self.__server.requests
+
+    @property
+    def bytes_sent(self):
+        """
+        Gets the number of bytes served, pages and subresources.
+        Returns:
+            int: The bytes of the response bodies.
+        """
+        return self.__server.bytes_sent
+
+    @property
+    def bookings(self):
+        """
+        Gets the confirmed bookings.
+        Returns:
+            list: A dict per booking with the service desk, the slot and the details.
+        """
+        return list(self.__server.bookings)
+
+    def start(self):
+        """
+        Starts serving on a background thread.
+        """
+        self.__thread = threading.Thread(target=self.__server.serve_forever,
+                                         name='mock-siga', daemon=True)
+        self.__thread.start()
+        return self
+
+    def expire_sessions(self):
+        """
+        Forgets every session, so the next form submissions are sent back to the Entidades page.
+        """
+        self.__server.sessions.clear()
+
+    def stop(self):
+        """
+        Stops serving.
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+def main(argv=None):
+    """Serves the mock site until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=int, default=0,
+                        help='milliseconds added to every page and dropdown')
+    args = parser.parse_args(argv)
+    server = MockSigaServer(args.port, args.latency).start()
+    print(f'Mock SIGA site on {server.url} (SIGA_URL={server.url})')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,434 @@
+"""
+End-to-end scan benchmark against the mock SIGA site.
+Serves the mock site locally, runs check_schedule (or the HTTP engine) for 1, 10 and 100
+configurations and reports the latency of each step, the page loads, the bytes served, the
+total wall time, the peak RSS and the CPU time of the browser. The results are written as JSON
+to compare runs over time, e.g. of the lean and full browser profiles. With --ticks each
+configuration is searched several times in a row, and with --sticky the searches after the
+first one submit only the last step again. With --claim every slot found by the Selenium engine
+is booked on the mock site with a throwaway encrypted profile, timing the detect-to-claim step.
+With --parallel the Selenium searches run that many at a time, each in a browser of its own, or
+with --tabs in the tabs of one shared browser, to compare the memory of the browsers.
+
+The browser and webdriver are resolved as in siga.py; set DRIVER_PATH to run offline.
+Peak RSS and browser CPU come from resource.getrusage and are not reported on Windows. The
+peak RSS of every browser process together is sampled from /proc, on Linux only.
+
+Usage:
+python benchmarks/scan_benchmark.py [--scenarios 1,10,100] [--engine selenium|http]
+                                    [--profile lean|full] [--slot-source dom|network]
+                                    [--ticks 1] [--sticky] [--claim] [--latency 50]
+                                    [--parallel 4] [--tabs]
+                                    [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_siga import MockSigaServer # pylint: disable=wrong-import-position
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# Location variants of the generated configurations: slots, error message page, all locations
+LOCATIONS = (
+    {'distrito': 11, 'localidade': 17, 'local_atendimento': 591},
+    {'distrito': 11, 'localidade': 6, 'local_atendimento': 889},
+    {'distrito': 11, 'localidade': -1},
+)
+SERVICES = (
+    {'tema': 22002, 'subtema': 22003, 'motivo': 22705},
+    {'tema': 22061, 'subtema': 22062, 'motivo': 22066},
+)
+
+
+def write_configs(count, directory, claim=False):
+    """
+    Writes a configuration file with count searches, cycling the services and locations.
+    Returns:
+    - str: The path of the file.
+    """
+    import yaml # pylint: disable=import-outside-toplevel
+    searches = [{'search': {'title': f'Benchmark {i + 1}', 'max_days': 30, 'frequency': 3,
+                            'entity_opt': 176, 'service_opt': SERVICES[i % len(SERVICES)],
+                            'location_opt': LOCATIONS[i % len(LOCATIONS)]}}
+                for i in range(count)]
+    if claim:
+        for search in searches:
+            search['search']['claim_opt'] = {'earliest': True}
+    path = os.path.join(directory, f'benchmark_{count}.yaml')
+    with open(path, 'w', encoding='utf8') as file:
+        yaml.safe_dump(searches, file, sort_keys=False)
+    return path
+
+
+def usage():
+    """
+    Gets the resource usage of this process and of its finished children (the browser).
+    Returns:
+    - dict: Peak RSS in MiB and CPU seconds, or an empty dict when not available.
+    """
+    if resource is None:
+        return {}
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {'rss_mib': own.ru_maxrss / scale,
+            'children_rss_mib': children.ru_maxrss / scale,
+            'children_cpu_s': children.ru_utime + children.ru_stime}
+
+
+def browser_rss_mib():
+    """
+    Gets the RSS of every process started by this one (the browsers and their webdrivers).
+    Returns:
+    - float: The RSS in MiB, or None when /proc is not available.
+    """
+    if not os.path.isdir('/proc/self'):
+        return None
+    parents = {}
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/stat', encoding='utf8') as file:
+                parents[int(pid)] = int(file.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    family = {os.getpid()}
+    found = True
+    while found:
+        children = {pid for pid, parent in parents.items()
+                    if parent in family and pid not in family}
+        family |= children
+        found = bool(children)
+    pages = 0
+    for pid in family - {os.getpid()}:
+        try:
+            with open(f'/proc/{pid}/statm', encoding='utf8') as file:
+                pages += int(file.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class RssSampler:
+    """
+    Samples the RSS of the browser processes in the background and keeps its peak.
+    Attributes:
+        peak (float): The highest RSS in MiB, or None when it cannot be sampled.
+    """
+    def __init__(self, interval=0.5):
+        """
+        Initializes the RssSampler.
+        """
+        self.interval = interval
+        self.peak = None
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__sample, daemon=True)
+
+    def __enter__(self):
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.__stop.set()
+        self.__thread.join()
+
+    def __sample(self):
+        """Samples until stopped."""
+        while True:
+            rss = browser_rss_mib()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            if self.__stop.wait(self.interval):
+                return
+
+
+def summarize(samples):
+    """
+    Summarizes latencies in seconds.
+    Returns:
+    - dict: Count, mean, median, p95 and max, in milliseconds.
+    """
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {'count': len(ordered),
+            'mean_ms': round(statistics.fmean(ordered) * 1000, 2),
+            'median_ms': round(statistics.median(ordered) * 1000, 2),
+            'p95_ms': round(p95 * 1000, 2),
+            'max_ms': round(ordered[-1] * 1000, 2)}
+
+
+def new_claimer(claim_slot, directory):
+    """
+    Creates a FastClaimer booking the slots with a throwaway encrypted profile.
+    Returns:
+    - FastClaimer: The claimer.
+    """
+    # pylint: disable=import-outside-toplevel
+    from fast_claim import FastClaimer, encrypt_profile, new_profile_key
+    source = os.path.join(directory, 'profile.yaml')
+    with open(source, 'w', encoding='utf8') as file:
+        file.write("Nome: Benchmark\nEmail: benchmark@example.com\n"
+                   "Telemovel: '910000000'\nNumeroDocumento: '00000000'\n")
+    key = new_profile_key()
+    encrypt_profile(source, os.path.join(directory, 'profile.enc'), key)
+    return FastClaimer(claim_slot, os.path.join(directory, 'profile.enc'), key, confirm=True)
+
+
+def run_selenium(configs, ticks=1, sticky=False, claimer=None):
+    """
+    Runs check_schedule ticks times for every configuration in one browser, reset before each
+    search but the sticky ones, claiming the slots found when a claimer is given.
+    Returns:
+    - tuple: Start-up seconds, scan seconds per config, step timings (with the page load of
+             each search) and failures.
+    """
+    import selenium_engine # pylint: disable=import-outside-toplevel
+    steps = {}
+    scans = []
+    failures = 0
+    started = time.perf_counter()
+    driver = selenium_engine.start_chrome()
+    startup = time.perf_counter() - started
+    steps['page_load'] = []
+    try:
+        for config, tick in ((c, t) for c in configs for t in range(ticks)):
+            if not (sticky and tick):
+                # Loaded again before every search, the first one too, to time each page load
+                started = time.perf_counter()
+                selenium_engine.reset_chrome(driver)
+                steps['page_load'].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            msg_header = selenium_engine.check_schedule(driver, config)
+            scans.append(time.perf_counter() - started)
+            if msg_header is None:
+                failures += 1
+                continue
+            claim = claimer.claim(driver, config, msg_header) if claimer else None
+            if claim:
+                steps.setdefault('claim', []).append(claim['seconds'])
+            for step, seconds in msg_header.get_step_timings().items():
+                steps.setdefault(step, []).append(seconds)
+    finally:
+        selenium_engine.close_chrome(driver)
+    return startup, scans, steps, failures
+
+
+def run_parallel(configs, ticks=1, parallel=4, tabs=False):
+    """
+    Runs check_schedule ticks times for every configuration, parallel searches at a time, each
+    in a browser of its own started beforehand, or with tabs in the tabs of one shared browser.
+    Returns:
+    - tuple: Start-up seconds, scan seconds per config, step timings and failures.
+    """
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor
+    import selenium_engine
+    from driver_pool import DriverPool
+    from tab_browser import TabBrowser
+    steps = {}
+    scans = []
+    failures = 0
+    started = time.perf_counter()
+    if tabs:
+        browser = TabBrowser(selenium_engine.start_chrome, selenium_engine.close_chrome,
+                             selenium_engine.open_tab, selenium_engine.scan_in_tab,
+                             tabs=parallel)
+        # Started on the first search, with the tabs opened as the searches need them
+        scan = browser.scan
+    else:
+        browser = DriverPool(selenium_engine.start_chrome, selenium_engine.reset_chrome,
+                             size=parallel, max_uses=ticks * len(configs) + parallel)
+
+        def scan(config):
+            with browser.lease() as driver:
+                return selenium_engine.check_schedule(driver, config)
+
+        held = [browser.acquire() for _ in range(parallel)]
+        for driver in held:
+            browser.release(driver)
+    startup = time.perf_counter() - started
+
+    def timed_scan(config):
+        scan_started = time.perf_counter()
+        return scan(config), time.perf_counter() - scan_started
+
+    try:
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            for msg_header, seconds in pool.map(timed_scan, [c for c in configs
+                                                             for _ in range(ticks)]):
+                scans.append(seconds)
+                if msg_header is None:
+                    failures += 1
+                    continue
+                for step, step_seconds in msg_header.get_step_timings().items():
+                    steps.setdefault(step, []).append(step_seconds)
+    finally:
+        browser.close()
+    return startup, scans, steps, failures
+
+
+def run_http(configs, url, ticks=1, sticky=False):
+    """
+    Runs the HTTP engine ticks times for every configuration.
+    Returns:
+    - tuple: Start-up seconds, scan seconds per config, step timings and failures.
+    """
+    from http_engine import HttpScanEngine, HttpScanError # pylint: disable=import-outside-toplevel
+    engine = HttpScanEngine(base_url=url, sticky=sticky)
+    steps = {}
+    scans = []
+    failures = 0
+    for config, _ in ((c, t) for c in configs for t in range(ticks)):
+        started = time.perf_counter()
+        try:
+            msg_header, _ = engine.scan(config)
+            for step, seconds in msg_header.get_step_timings().items():
+                steps.setdefault(step, []).append(seconds)
+        except HttpScanError:
+            failures += 1
+        scans.append(time.perf_counter() - started)
+    return 0.0, scans, steps, failures
+
+
+def run_scenario(count, engine, server, directory, profile=None, ticks=1, sticky=False,
+                 claim=False, parallel=1, tabs=False):
+    """
+    Runs a scenario of count configurations.
+    Returns:
+    - dict: The results of the scenario.
+    """
+    from yaml_loader import YamlLoader # pylint: disable=import-outside-toplevel
+    configs = YamlLoader(write_configs(count, directory, claim)).get_instances()
+    bookings_before = len(server.bookings)
+    before = usage()
+    requests_before = server.requests
+    bytes_before = server.bytes_sent
+    started = time.perf_counter()
+    with RssSampler() as sampler:
+        if engine == 'http':
+            startup, scans, steps, failures = run_http(configs, server.url, ticks, sticky)
+        elif parallel > 1 or tabs:
+            startup, scans, steps, failures = run_parallel(configs, ticks, parallel, tabs)
+        else:
+            claimer = None
+            if claim:
+                import selenium_engine # pylint: disable=import-outside-toplevel
+                claimer = new_claimer(selenium_engine.claim_slot, directory)
+            startup, scans, steps, failures = run_selenium(configs, ticks, sticky, claimer)
+    wall = time.perf_counter() - started
+    after = usage()
+
+    result = {'configs': count, 'engine': engine, 'profile': profile, 'ticks': ticks,
+              'sticky': sticky, 'parallel': parallel, 'tabs': tabs, 'failures': failures,
+              'wall_s': round(wall, 3), 'startup_s': round(startup, 3),
+              'scans_per_s': round(len(scans) / wall, 3) if wall else None,
+              'requests': server.requests - requests_before,
+              'bytes_served': server.bytes_sent - bytes_before,
+              'bookings': len(server.bookings) - bookings_before,
+              'scan': summarize(scans),
+              'steps': {step: summarize(samples) for step, samples in steps.items()}}
+    if after:
+        result['peak_rss_mib'] = round(after['rss_mib'], 1)
+    if after and engine == 'selenium':
+        result.update({'browser_peak_rss_mib': round(after['children_rss_mib'], 1),
+                       'browser_cpu_s': round(after['children_cpu_s'] -
+                                              before['children_cpu_s'], 3)})
+    if sampler.peak is not None and engine == 'selenium':
+        result['browsers_peak_rss_mib'] = round(sampler.peak, 1)
+    return result
+
+
+def main(argv=None):
+    """
+    Runs the benchmark.
+    Returns:
+    - int: 0 if every search succeeded, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scenarios', default='1,10,100',
+                        help='comma separated numbers of configurations')
+    parser.add_argument('--engine', choices=('selenium', 'http'), default='selenium')
+    parser.add_argument('--profile', choices=('lean', 'full'),
+                        help='browser profile, defaults to BROWSER_PROFILE')
+    parser.add_argument('--slot-source', choices=('dom', 'network'),
+                        help='where the browser reads the time slots, defaults to SLOT_SOURCE')
+    parser.add_argument('--ticks', type=int, default=1,
+                        help='searches of each configuration in a row')
+    parser.add_argument('--sticky', action='store_true',
+                        help='submit only the last step on the searches after the first one')
+    parser.add_argument('--claim', action='store_true',
+                        help='book the slots found by the Selenium engine on the mock site')
+    parser.add_argument('--latency', type=int, default=0,
+                        help='milliseconds added by the mock site to every page and dropdown')
+    parser.add_argument('--parallel', type=int, default=1,
+                        help='Selenium searches running at the same time, one browser each')
+    parser.add_argument('--tabs', action='store_true',
+                        help='run the parallel searches in the tabs of one shared browser')
+    parser.add_argument('--output', help='JSON file to write, defaults to benchmarks/results/')
+    args = parser.parse_args(argv)
+    if (args.parallel > 1 or args.tabs) and (args.sticky or args.claim or args.engine == 'http'):
+        parser.error('--parallel and --tabs run the Selenium searches without --sticky nor --claim')
+
+    os.chdir(ROOT)
+    import logging # pylint: disable=import-outside-toplevel
+    logging.basicConfig(level=logging.WARNING)
+    from env_vars import EnvironmentVariables # pylint: disable=import-outside-toplevel
+
+    server = MockSigaServer(latency=args.latency).start()
+    env_vars = EnvironmentVariables()
+    env_vars.siga_url = server.url
+    env_vars.screenshot_policy = 'off'
+    if args.profile:
+        env_vars.browser_profile = args.profile
+    if args.slot_source:
+        env_vars.slot_source = args.slot_source
+    env_vars.sticky_sessions = args.sticky
+    env_vars.browser_tabs = max(1, args.parallel) if args.tabs else 0
+    profile = env_vars.browser_profile if args.engine == 'selenium' else None
+    if args.engine == 'selenium':
+        import selenium_engine # pylint: disable=import-outside-toplevel
+        selenium_engine.configure(env_vars)
+
+    report = {'started_at': datetime.now().isoformat(timespec='seconds'),
+              'python': sys.version.split()[0], 'platform': sys.platform,
+              'latency_ms': args.latency, 'scenarios': []}
+    if args.engine == 'selenium':
+        report['slot_source'] = env_vars.slot_source
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for count in (int(c) for c in args.scenarios.split(',') if c.strip()):
+                result = run_scenario(count, args.engine, server, directory, profile,
+                                      max(1, args.ticks), args.sticky, args.claim,
+                                      max(1, args.parallel), args.tabs)
+                report['scenarios'].append(result)
+                print(json.dumps(result))
+    finally:
+        server.stop()
+
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results',
+        f'scan_{args.engine}{"_" + profile if profile else ""}_'
+        f'{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf8') as file:
+        json.dump(report, file, indent=2)
+    print(f'Results written to {output}')
+    return 1 if any(s['failures'] for s in report['scenarios']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
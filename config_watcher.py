@@ -0,0 +1,99 @@
+"""
+ConfigWatcher: A class to watch the configuration file and reload it when its content changes,
+without restarting the searches.
+Imports:
+- os: Used to read the modification time and size of the file.
+- hashlib: Used to tell a real edit from a touch of the file.
+- asyncio: The event loop of the scheduler the watcher runs on.
+- logging: Logging facility for Python.
+
+Example usage:
+watcher = ConfigWatcher('search_config.yaml', load, apply, interval=5)
+asyncio.run(scheduler.run(watcher.watch()))
+"""
+import os
+import hashlib
+import asyncio
+import logging
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class ConfigWatcher:
+    """
+    Represents a watcher of the configuration file.
+    The file is polled with os.stat, which is cheap and works the same on every platform and
+    on mounted volumes. When the modification time or the size changes the content is hashed,
+    and only a different content is loaded again. The load runs on the default executor and the
+    result is applied on the event loop, where the scheduler can be changed safely. A load that
+    raises keeps the last good configuration active.
+    Args:
+        file_path (str): The path of the configuration file.
+        load (callable): Loads the file, returning the new configuration or raising if invalid.
+        apply (callable): Applies a loaded configuration, called on the event loop.
+        interval (float): Seconds between two polls.
+    Methods:
+        changed(): Checks whether the content of the file changed.
+        watch(): Polls the file until cancelled.
+    """
+    def __init__(self, file_path, load, apply, interval=5):
+        """
+        Initializes the ConfigWatcher with the current state of the file.
+        """
+        self.file_path = file_path
+        self.load = load
+        self.apply = apply
+        self.interval = interval
+        self.__stamp = self.__stat()
+        self.__digest = self.__hash()
+
+    def changed(self):
+        """
+        Checks whether the content of the file changed since the last check.
+        Returns:
+        - bool: True if the file has a new content.
+        """
+        stamp = self.__stat()
+        if stamp == self.__stamp:
+            return False
+        self.__stamp = stamp
+        digest = self.__hash()
+        if digest is None or digest == self.__digest:
+            return False
+        self.__digest = digest
+        return True
+
+    async def watch(self):
+        """
+        Polls the file until cancelled, loading and applying each new content.
+        """
+        loop = asyncio.get_running_loop()
+        logger.info('Watching %s for changes every %ss', self.file_path, self.interval)
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.changed():
+                continue
+            logger.info('Configuration file changed: %s', self.file_path)
+            try:
+                config = await loop.run_in_executor(None, self.load)
+                self.apply(config)
+            except Exception as ex: # pylint: disable=broad-except
+                logger.error('Configuration not reloaded, the last good one stays active: %s', ex)
+
+    def __stat(self):
+        """Gets the modification time and size of the file, or None if it is missing."""
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def __hash(self):
+        """Gets the digest of the content of the file, or None if it cannot be read."""
+        try:
+            with open(self.file_path, 'rb') as file:
+                return hashlib.sha1(file.read()).hexdigest()
+        except OSError:
+            return None
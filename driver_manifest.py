@@ -0,0 +1,147 @@
+"""
+DriverManifest: A class to resolve the browser and its webdriver binary once and keep the
+choice in a small on-disk manifest, so the tasks do not probe driver versions on every start.
+Imports:
+- os: Used to check the driver binary and to remove the manifest.
+- json: The manifest format.
+- logging: Logging facility for Python.
+- threading: Used to resolve the driver only once when several tasks start together.
+- datetime: Used to record when the driver was resolved.
+
+Example usage:
+manifest = DriverManifest("driver_manifest.json")
+browser, driver_path = manifest.resolve()
+# ... if the browser does not start with that driver:
+manifest.invalidate()
+browser, driver_path = manifest.resolve(skip=browser)
+"""
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+BROWSERS = ('chrome', 'edge')
+
+
+class DriverManifest:
+    """
+    Represents the resolved browser and webdriver binary.
+    A pinned driver path is used as is and never downloaded nor probed, which allows running
+    fully offline. Otherwise the driver is installed once by webdriver_manager, trying Chrome
+    before Edge, and the result is reused from the manifest until it is invalidated.
+    Args:
+        manifest_path (str): The path to the JSON manifest.
+        pinned_path (str): A local driver binary to use instead of webdriver_manager.
+        pinned_browser (str): The browser of the pinned driver, 'chrome' or 'edge'.
+    Methods:
+        resolve(skip): Gets the browser and the driver path.
+        invalidate(): Forgets the resolved driver.
+    """
+    def __init__(self, manifest_path="driver_manifest.json", pinned_path=None,
+                 pinned_browser='chrome'):
+        """
+        Initializes the DriverManifest.
+        """
+        self.manifest_path = manifest_path
+        self.pinned_path = pinned_path
+        self.pinned_browser = pinned_browser if pinned_browser in BROWSERS else 'chrome'
+        self.__resolved = None
+        self.__lock = threading.Lock()
+
+    @property
+    def pinned(self):
+        """
+        Checks whether a local driver binary was pinned.
+        Returns:
+            bool: True if the driver path is pinned.
+        """
+        return bool(self.pinned_path)
+
+    def resolve(self, skip=None):
+        """
+        Gets the browser and the driver path, resolving them only when there is no manifest.
+        Args:
+        - skip (str): A browser that failed to start and must not be chosen again.
+        Returns:
+        - tuple: The browser ('chrome' or 'edge') and the path of its driver.
+        Raises:
+        - FileNotFoundError: If the pinned driver does not exist.
+        """
+        if self.pinned:
+            if not os.path.isfile(self.pinned_path):
+                raise FileNotFoundError(f"Pinned webdriver not found: {self.pinned_path}")
+            return self.pinned_browser, self.pinned_path
+
+        with self.__lock:
+            if self.__resolved is None:
+                self.__resolved = self.__load()
+            if self.__resolved is None or self.__resolved[0] == skip:
+                self.__resolved = self.__install(skip)
+                self.__save(*self.__resolved)
+            return self.__resolved
+
+    def invalidate(self):
+        """
+        Forgets the resolved driver, removing the manifest.
+        """
+        if self.pinned:
+            return
+        with self.__lock:
+            self.__resolved = None
+            if os.path.isfile(self.manifest_path):
+                os.remove(self.manifest_path)
+        logger.info('Webdriver manifest invalidated')
+
+    def __load(self):
+        """Reads the manifest, ignoring it when the driver binary is gone."""
+        if not os.path.isfile(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, 'r', encoding='utf8') as file:
+                manifest = json.load(file)
+            browser, driver_path = manifest['browser'], manifest['driver_path']
+        except (OSError, ValueError, KeyError) as ex:
+            logger.warning('Ignoring invalid webdriver manifest %s: %s', self.manifest_path, ex)
+            return None
+        if browser not in BROWSERS or not os.path.isfile(driver_path):
+            logger.info('Webdriver in manifest is no longer available: %s', driver_path)
+            return None
+        logger.info('Using %s webdriver from manifest: %s', browser, driver_path)
+        return browser, driver_path
+
+    def __save(self, browser, driver_path):
+        """Writes the manifest."""
+        manifest = {'browser': browser, 'driver_path': driver_path,
+                    'resolved_at': datetime.now().isoformat(timespec='seconds')}
+        try:
+            with open(self.manifest_path, 'w', encoding='utf8') as file:
+                json.dump(manifest, file, indent=2)
+        except OSError as ex:
+            logger.warning('Could not write webdriver manifest %s: %s', self.manifest_path, ex)
+
+    @staticmethod
+    def __install(skip=None):
+        """Installs the driver of the first browser that works, Chrome before Edge."""
+        # Imported here so a pinned or cached driver never loads webdriver_manager
+        # pylint: disable=import-outside-toplevel
+        from webdriver_manager.chrome import ChromeDriverManager
+        from webdriver_manager.microsoft import EdgeChromiumDriverManager
+
+        installers = (('chrome', ChromeDriverManager), ('edge', EdgeChromiumDriverManager))
+        error = None
+        for browser, installer in installers:
+            if browser == skip:
+                continue
+            try:
+                driver_path = installer().install()
+                logger.info('Resolved %s webdriver: %s', browser, driver_path)
+                return browser, driver_path
+            except Exception as ex: # pylint: disable=broad-except
+                logger.warning('Could not resolve %s webdriver: %s', browser, ex)
+                error = ex
+        raise error or RuntimeError('No browser left to resolve a webdriver for.')
@@ -0,0 +1,331 @@
+"""
+DriverPool: A class to keep warm WebDriver instances and lease them to the scheduled tasks.
+Imports:
+- time: Used to measure the age of each driver with a monotonic clock.
+- threading: Used to guard the pool against concurrent leases.
+- logging: Logging facility for Python.
+- contextlib: Used to expose the lease as a context manager.
+
+Example usage:
+pool = DriverPool(start_chrome, reset_chrome, size=2, max_uses=20, max_age=30)
+with pool.lease() as driver:
+    check_schedule(driver, config_instance)
+with pool.lease(affinity=config_instance.digest) as driver:
+    check_schedule(driver, config_instance)  # Left on its results page for the next lease
+pool.close()
+"""
+import time
+import logging
+import threading
+import contextlib
+
+from selenium.common.exceptions import WebDriverException
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class PooledDriver:
+    """
+    Represents a WebDriver kept by the pool, together with its usage bookkeeping.
+    Attributes:
+        driver: The WebDriver instance.
+        created_at (float): Monotonic time of creation.
+        uses (int): How many times the driver was leased.
+        affinity (str): The search the driver was last kept for without a reset, or None.
+        held_until (float): Monotonic time until which the driver is only leased as a last resort.
+    """
+    def __init__(self, driver):
+        """
+        Initializes the PooledDriver with a freshly started WebDriver.
+        Args:
+        - driver: The WebDriver instance.
+        """
+        self.driver = driver
+        self.created_at = time.monotonic()
+        self.uses = 0
+        self.affinity = None
+        self.held_until = 0
+
+    def get_age(self):
+        """
+        Gets the age of the driver.
+        Returns:
+            float: Seconds elapsed since the driver was started.
+        """
+        return time.monotonic() - self.created_at
+
+
+class DriverPool:
+    """
+    Represents a bounded pool of warm WebDriver instances.
+    Drivers are started lazily by the factory, reset after every lease, health-checked
+    before being handed out and recycled after a number of uses or minutes.
+    A lease with an affinity is not reset when released: the driver keeps its page and cookies
+    and is handed out first to the next lease with the same affinity. Other leases start a new
+    driver while the pool has room, and only then get a driver on the start page or else the
+    least recently used one reset. A held driver keeps its page and is neither leased nor
+    recycled until its hold is over: it does not count against the size, so a lease finding
+    every other driver busy starts a temporary extra driver, quit when released if the pool is
+    still over its size.
+    Args:
+        factory (callable): Starts a new WebDriver already navigated to the start page.
+        reset (callable): Brings a used WebDriver back to the start page.
+        size (int): Maximum number of drivers alive at the same time.
+        max_uses (int): Number of leases after which a driver is recycled.
+        max_age (int): Minutes after which a driver is recycled.
+    Methods:
+        lease(affinity): Context manager that leases a driver and gives it back afterwards.
+        acquire(affinity): Leases a driver, blocking while the pool is exhausted.
+        release(driver, discard): Gives a driver back to the pool.
+        hold(driver, seconds): Keeps a leased driver on its page once released.
+        close(): Quits every idle driver.
+    """
+    def __init__(self, factory, reset, size=1, max_uses=20, max_age=30):
+        """
+        Initializes the DriverPool.
+        Args:
+        - factory (callable): Starts a new WebDriver already navigated to the start page.
+        - reset (callable): Brings a used WebDriver back to the start page.
+        - size (int): Maximum number of drivers alive at the same time.
+        - max_uses (int): Number of leases after which a driver is recycled.
+        - max_age (int): Minutes after which a driver is recycled.
+        """
+        self.__factory = factory
+        self.__reset = reset
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.max_age = max_age * 60
+        self.__idle = []
+        self.__leased = {}
+        self.__alive = 0
+        self.__lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(self.size)
+        self.__closed = False
+
+    @contextlib.contextmanager
+    def lease(self, affinity=None):
+        """
+        Leases a driver for the duration of the with block.
+        The driver is discarded instead of reused when the block raises.
+        Args:
+        - affinity (str): Keep the driver as it is left for the next lease with this value.
+        Yields:
+            WebDriver: A warm driver, as the last lease with the same affinity left it or
+                       navigated to the start page.
+        """
+        driver = self.acquire(affinity)
+        try:
+            yield driver
+        except Exception:
+            self.release(driver, discard=True)
+            raise
+        self.release(driver)
+
+    def acquire(self, affinity=None):
+        """
+        Leases a driver, blocking while all the drivers are in use.
+        Args:
+        - affinity (str): Keep the driver as it is left for the next lease with this value.
+        Returns:
+            WebDriver: A warm driver, as the last lease with the same affinity left it or
+                       navigated to the start page.
+        """
+        if self.__closed:
+            raise RuntimeError("The driver pool is closed.")
+
+        self.__slots.acquire()
+        try:
+            pooled = self.__take_idle(affinity)
+            if pooled is None:
+                logger.info('Starting a new pooled webdriver')
+                try:
+                    pooled = PooledDriver(self.__factory())
+                except Exception:
+                    with self.__lock:
+                        self.__alive -= 1
+                    raise
+        except Exception:
+            self.__slots.release()
+            raise
+
+        pooled.uses += 1
+        pooled.affinity = affinity
+        with self.__lock:
+            self.__leased[id(pooled.driver)] = pooled
+        return pooled.driver
+
+    def release(self, driver, discard=False):
+        """
+        Gives a driver back to the pool, resetting or recycling it. A driver leased with an
+        affinity is kept as it is.
+        Args:
+        - driver: The WebDriver previously returned by acquire.
+        - discard (bool): Quit the driver instead of keeping it.
+        """
+        with self.__lock:
+            pooled = self.__leased.pop(id(driver), None)
+        try:
+            if pooled is None:
+                return
+            if discard or self.__closed or self.__is_expired(pooled) or \
+                    self.__is_extra(pooled):
+                self.__quit(pooled)
+                return
+            if pooled.affinity is None and not self.__reset_safely(pooled):
+                return
+            with self.__lock:
+                self.__idle.append(pooled)
+        finally:
+            if pooled is not None:
+                self.__slots.release()
+
+    def hold(self, driver, seconds):
+        """
+        Keeps a leased driver on its current page after it is released, e.g. the booking details
+        of a claimed slot, for the given seconds.
+        Args:
+        - driver: The WebDriver previously returned by acquire.
+        - seconds (float): How long the driver is held.
+        """
+        with self.__lock:
+            pooled = self.__leased.get(id(driver))
+            if pooled is not None:
+                pooled.affinity = ('held', id(driver))
+                pooled.held_until = time.monotonic() + seconds
+        logger.info('Holding pooled webdriver for %s seconds', seconds)
+
+    def close(self):
+        """
+        Quits every idle driver and refuses new leases.
+        Leased drivers are quit as soon as they are released.
+        """
+        self.__closed = True
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+        for pooled in idle:
+            self.__quit(pooled)
+
+    def __take_idle(self, affinity=None):
+        """
+        Takes the most recently used healthy idle driver with the same affinity, quitting the
+        stale ones. Without one, a new driver is started while the pool has room, otherwise an
+        idle driver on the start page is taken, or else the least recently used one is reset.
+        A held driver is never taken, and leaves room for a new driver while held.
+        Args:
+        - affinity (str): The affinity of the lease, None for a driver on the start page.
+        Returns:
+        - PooledDriver or None: A reusable driver, or None when a new one must be started, its
+                                place in the pool being already taken.
+        """
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                free = [i for i, idle in enumerate(self.__idle) if idle.held_until <= now]
+                index = next((i for i in reversed(free)
+                              if self.__idle[i].affinity == affinity), None)
+                if index is None:
+                    if not free or self.__alive - self.__count_held(now) < self.size:
+                        self.__alive += 1
+                        return None
+                    # A driver on the start page needs no reset
+                    index = next((i for i in free if self.__idle[i].affinity is None), free[0])
+                pooled = self.__idle.pop(index)
+            if self.__is_expired(pooled) or not self.__is_healthy(pooled):
+                self.__quit(pooled)
+                continue
+            if pooled.affinity is None or pooled.affinity == affinity or \
+                    self.__reset_safely(pooled):
+                return pooled
+
+    def __reset_safely(self, pooled):
+        """
+        Brings a driver back to the start page, quitting it when the reset fails.
+        Args:
+        - pooled (PooledDriver): The driver to reset.
+        Returns:
+        - bool: True if the driver was reset.
+        """
+        try:
+            self.__reset(pooled.driver)
+        except WebDriverException as wd:
+            logger.warning('Could not reset pooled webdriver, recycling it: %s', wd)
+            self.__quit(pooled)
+            return False
+        pooled.affinity = None
+        return True
+
+    def __count_held(self, now):
+        """
+        Counts the drivers still held, leased or idle. Called with the lock taken.
+        Args:
+        - now (float): The monotonic time.
+        Returns:
+        - int: The number of held drivers.
+        """
+        return sum(1 for pooled in self.__idle + list(self.__leased.values())
+                   if pooled.held_until > now)
+
+    def __is_extra(self, pooled):
+        """
+        Checks whether a released driver is beyond the size of the pool, once the drivers
+        started while others were held are no longer needed.
+        Args:
+        - pooled (PooledDriver): The released driver, not held.
+        Returns:
+        - bool: True if the driver must be quit.
+        """
+        now = time.monotonic()
+        if pooled.held_until > now:
+            return False
+        with self.__lock:
+            return self.__alive - self.__count_held(now) > self.size
+
+    def __is_expired(self, pooled):
+        """
+        Checks whether a driver reached its maximum number of uses or age. A held driver is
+        not recycled before its hold is over.
+        Args:
+        - pooled (PooledDriver): The driver to check.
+        Returns:
+        - bool: True if the driver must be recycled.
+        """
+        if pooled.held_until > time.monotonic():
+            return False
+        if self.max_uses and pooled.uses >= self.max_uses:
+            logger.info('Recycling webdriver after %s uses', pooled.uses)
+            return True
+        if self.max_age and pooled.get_age() >= self.max_age:
+            logger.info('Recycling webdriver after %.0f seconds', pooled.get_age())
+            return True
+        return False
+
+    @staticmethod
+    def __is_healthy(pooled):
+        """
+        Checks whether the browser behind a driver still answers.
+        Args:
+        - pooled (PooledDriver): The driver to check.
+        Returns:
+        - bool: True if the driver can be reused.
+        """
+        try:
+            return bool(pooled.driver.window_handles) and pooled.driver.current_url is not None
+        except WebDriverException as wd:
+            logger.warning('Pooled webdriver failed the health check: %s', wd)
+            return False
+
+    def __quit(self, pooled):
+        """
+        Quits a driver, ignoring a browser that is already gone.
+        Args:
+        - pooled (PooledDriver): The driver to quit.
+        """
+        with self.__lock:
+            self.__alive -= 1
+        logger.info('Quitting pooled webdriver')
+        try:
+            pooled.driver.quit()
+        except WebDriverException as wd:
+            logger.debug('Webdriver was already gone: %s', wd)
@@ -27,10 +27,53 @@ logger = logging.getLogger(__name__)
 
 class EnvironmentVariables:
     """
-    A class to manage environment variables related to a bot.
+    A class to manage environment variables related to a bot and to the search workers.
     Attributes:
         bot_token (str): The bot token.
         bot_chat_id (str): The chat ID of the bot.
+        driver_pool_size (int): Maximum number of browsers kept alive at the same time.
+        driver_max_uses (int): Number of tasks after which a browser is recycled.
+        driver_max_age (int): Minutes after which a browser is recycled.
+        worker_pool_size (int): Maximum number of searches running at the same time.
+        slot_store_path (str): The SQLite file keeping the history of the time slots.
+        notify_queue_size (int): Maximum number of notifications waiting to be delivered.
+        notify_max_retries (int): Maximum number of retries of a Telegram message.
+        screenshot_policy (str): When screenshots are written: off, on-error or always.
+        screenshot_buffer (int): Number of step screenshots kept in memory per browser.
+        screenshot_dir (str): Where the screenshots are written.
+        screenshot_compress (bool): Write JPEG screenshots instead of full PNGs.
+        screenshot_retention (int): Maximum number of screenshot files kept.
+        driver_path (str): A local webdriver binary to use without downloading one.
+        browser (str): The browser of the local webdriver, chrome or edge.
+        driver_manifest_path (str): The file keeping the resolved browser and webdriver.
+        schedule_jitter (int): Maximum seconds randomly added to each scheduled search.
+        scan_budget (int): Maximum searches per hour of the adaptive searches, 0 for no limit.
+        siga_url (str): The URL of the SIGA Entidades page, overridable to search a mock site.
+        metrics_port (int): The port of the metrics endpoint, 0 to disable it.
+        metrics_host (str): The address of the metrics endpoint.
+        log_config (str): The dictConfig YAML file of the logging pipeline.
+        log_format (str): The format of the log file: text or json.
+        config_reload_interval (int): Seconds between two checks of the configuration file,
+                                      0 (the default) to disable the reload.
+        config_cache_path (str): The file keeping the validated configurations, unset to disable it.
+        config_workers (int): Processes validating large configuration files.
+        fan_out_workers (int): Maximum service desks of a fan_out search searched at the same time.
+        fan_out_retries (int): Times a failed service desk of a fan_out search is searched again.
+        browser_profile (str): full, or lean to block the resources the search does not need.
+        browser_allow (tuple): Kinds of resources the lean profile lets through: images, fonts,
+                               stylesheets, media or analytics.
+        slot_source (str): Where the browser reads the time slots: dom, or network to read the
+                           response of the results page and fall back to the page.
+        sticky_sessions (bool): Keep the session of each search on its results page and submit
+                                only the last step on the next searches.
+        sticky_session_max_age (int): Minutes after which a sticky session is started again.
+        fast_claim (bool): Claim the slots matching the claim_opt of a search as soon as found.
+        fast_claim_confirm (bool): Confirm the claimed bookings instead of holding them.
+        fast_claim_hold (int): Seconds a browser is held on the booking details of a claim.
+        claim_profile_path (str): The encrypted profile with the booking details.
+        claim_profile_key (str): The key of the encrypted profile.
+        browser_tabs (int): Searches run at the same time in the tabs of one shared browser,
+                            0 to run each search in a browser of the pool.
     """
     def __init__(self):
         """
@@ -39,6 +82,81 @@ class EnvironmentVariables:
         load_dotenv(override=True)
         self.bot_token = os.getenv("BOT_TOKEN")
         self.bot_chat_id = os.getenv("BOT_CHAT_ID")
+        self.driver_pool_size = self.get_int("DRIVER_POOL_SIZE", 1)
+        self.driver_max_uses = self.get_int("DRIVER_MAX_USES", 20)
+        self.driver_max_age = self.get_int("DRIVER_MAX_AGE", 30)
+        self.worker_pool_size = self.get_int("WORKER_POOL_SIZE", 4)
+        self.slot_store_path = os.getenv("SLOT_STORE_PATH", "siga_slots.db")
+        self.notify_queue_size = self.get_int("NOTIFY_QUEUE_SIZE", 100)
+        self.notify_max_retries = self.get_int("NOTIFY_MAX_RETRIES", 3)
+        self.screenshot_policy = os.getenv("SCREENSHOT_POLICY", "on-error").strip().lower()
+        self.screenshot_buffer = self.get_int("SCREENSHOT_BUFFER", 5)
+        self.screenshot_dir = os.getenv("SCREENSHOT_DIR", ".")
+        self.screenshot_compress = self.get_bool("SCREENSHOT_COMPRESS", False)
+        self.screenshot_retention = self.get_int("SCREENSHOT_RETENTION", 50)
+        self.driver_path = os.getenv("DRIVER_PATH")
+        self.browser = os.getenv("BROWSER", "chrome").strip().lower()
+        self.driver_manifest_path = os.getenv("DRIVER_MANIFEST_PATH", "driver_manifest.json")
+        self.schedule_jitter = self.get_int("SCHEDULE_JITTER", 0)
+        self.scan_budget = self.get_int("SCAN_BUDGET", 0)
+        self.siga_url = os.getenv("SIGA_URL",
+                                  "https://siga.marcacaodeatendimento.pt/Marcacao/Entidades")
+        self.metrics_port = self.get_int("METRICS_PORT", 0)
+        self.metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.log_config = os.getenv("LOG_CONFIG", "logging_config.yaml")
+        self.log_format = os.getenv("LOG_FORMAT", "text").strip().lower()
+        self.config_reload_interval = self.get_int("CONFIG_RELOAD_INTERVAL", 0)
+        self.config_cache_path = os.getenv("CONFIG_CACHE_PATH")
+        self.config_workers = self.get_int("CONFIG_WORKERS", 1)
+        self.fan_out_workers = self.get_int("FAN_OUT_WORKERS", 4)
+        self.fan_out_retries = self.get_int("FAN_OUT_RETRIES", 1)
+        self.browser_profile = os.getenv("BROWSER_PROFILE", "full").strip().lower()
+        self.browser_allow = tuple(kind.strip().lower()
+                                   for kind in os.getenv("BROWSER_ALLOW", "").split(",")
+                                   if kind.strip())
+        self.slot_source = os.getenv("SLOT_SOURCE", "dom").strip().lower()
+        self.sticky_sessions = self.get_bool("STICKY_SESSIONS", False)
+        self.sticky_session_max_age = self.get_int("STICKY_SESSION_MAX_AGE", 30)
+        self.fast_claim = self.get_bool("FAST_CLAIM", False)
+        self.fast_claim_confirm = self.get_bool("FAST_CLAIM_CONFIRM", False)
+        self.fast_claim_hold = self.get_int("FAST_CLAIM_HOLD", 600)
+        self.claim_profile_path = os.getenv("CLAIM_PROFILE_PATH", "claim_profile.enc")
+        self.claim_profile_key = os.getenv("CLAIM_PROFILE_KEY")
+        self.browser_tabs = self.get_int("BROWSER_TABS", 0)
+
+    @staticmethod
+    def get_int(name, default):
+        """
+        Get an environment variable as an integer.
+        Args:
+            name (str): The name of the environment variable.
+            default (int): The value used when the variable is unset or invalid.
+        Returns:
+            int: The value of the environment variable.
+        """
+        value = os.getenv(name)
+        if value is None or value.strip() == '':
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            logger.warning("Invalid integer for %s: %s. Using %s", name, value, default)
+            return default
+
+    @staticmethod
+    def get_bool(name, default):
+        """
+        Get an environment variable as a boolean.
+        Args:
+            name (str): The name of the environment variable.
+            default (bool): The value used when the variable is unset.
+        Returns:
+            bool: True for "1", "true", "yes" or "on", False otherwise.
+        """
+        value = os.getenv(name)
+        if value is None or value.strip() == '':
+            return default
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
 
     def validate(self):
         """
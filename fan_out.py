@@ -0,0 +1,252 @@
+"""
+FanOutScanner: A class to split a search of every local of a district into one search per
+service desk, run them concurrently and merge their results back under the configuration.
+Imports:
+- time: Used to expire the discovered locations.
+- logging: Logging facility for Python.
+- threading: Used to share the discovered locations between the worker threads.
+- concurrent.futures: Runs the searches of the service desks concurrently.
+
+Example usage:
+scanner = FanOutScanner(discover_locations, run_scan, workers=4)
+msg_header, failed_locations = scanner.scan(config_instance)
+"""
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from notif_data import NotificationData
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+WILDCARD_LOCAL = -1
+
+
+def is_fan_out(config_instance):
+    """
+    Checks whether a configuration searches every local of its district split by service desk.
+    Args:
+    - config_instance (YamlConfigItem): The search configuration.
+    Returns:
+    - bool: True if fan_out is set and the localidade is the wildcard.
+    """
+    return config_instance.fan_out and \
+        config_instance.location_opt.get('localidade') == WILDCARD_LOCAL
+
+
+def expand_locations(config_instance, locations):
+    """
+    Creates one configuration per service desk of the discovered locations, or per local when
+    the local has no service desk to choose.
+    Args:
+    - config_instance (YamlConfigItem): The configuration of every local.
+    - locations (dict): Local to {'label': str, 'desks': {service desk: label}}.
+    Returns:
+    - list: Tuples of (YamlConfigItem, location label, local label).
+    """
+    distrito = config_instance.location_opt.get('distrito')
+    expanded = []
+    for localidade, local in locations.items():
+        targets = local['desks'].items() if local['desks'] else [(None, local['label'])]
+        for desk, label in targets:
+            location_opt = {'distrito': distrito, 'localidade': localidade}
+            if desk is not None:
+                location_opt['local_atendimento'] = desk
+            expanded.append((config_instance.replace(title=f'{config_instance.title} - {label}',
+                                                     location_opt=location_opt,
+                                                     fan_out=False),
+                             label, local['label']))
+    return expanded
+
+
+def merge_results(msg_headers, local_labels=None):
+    """
+    Merges the results of the service desk searches into one notification header.
+    Args:
+    - msg_headers (list): The NotificationData of the searches that read their results.
+    - local_labels (list): The label of the local of each search, used instead of the local
+                           of its header, which the HTTP engine only knows by value.
+    Returns:
+    - NotificationData: The service of the searches, the locals with time slots, every time
+                        slot by location and the slowest time of each step.
+    """
+    merged = NotificationData()
+    first = msg_headers[0]
+    merged.set_entity(first.get_entity())
+    merged.set_category(first.get_category())
+    merged.set_subcategory(first.get_subcategory())
+    merged.set_motive(first.get_motive())
+    merged.set_district(first.get_district())
+
+    time_slots = {}
+    locals_with_slots = []
+    local_labels = local_labels or [msg_header.get_local() for msg_header in msg_headers]
+    for msg_header, local in zip(msg_headers, local_labels):
+        for location, labels in msg_header.get_time_slots().items():
+            known = time_slots.setdefault(location, [])
+            known.extend(label for label in labels if label not in known)
+        if msg_header.get_time_slots() and local not in locals_with_slots:
+            locals_with_slots.append(local)
+        for step, seconds in msg_header.get_step_timings().items():
+            merged.set_step_timing(step, max(seconds, merged.get_step_timings().get(step, 0)))
+    merged.set_local(', '.join(map(str, filter(None, locals_with_slots))) or local_labels[0])
+    merged.set_time_slots(time_slots)
+    merged.set_results_read(True)
+    return merged
+
+
+class FanOutScanner:
+    """
+    Represents the split searches of configurations with a wildcard local.
+    The locals and service desks of each district are discovered once (the browser is needed
+    to fill the dependent dropdowns) and kept for ttl seconds. Each service desk is then searched
+    on its own, concurrently, and the failed ones are searched again on their own before the
+    results are merged. The results page names a location by the title of its schedule list,
+    not by the label of the dropdown, so the titles each service desk returned are kept to tell
+    which known slots belong to a service desk that failed.
+    Args:
+        discover (callable): Gets the locations of a configuration, see expand_locations.
+        scan (callable): Searches a configuration, returning a NotificationData or None.
+        workers (int): Maximum number of service desks searched at the same time.
+        retries (int): Times a failed service desk is searched again.
+        ttl (int): Seconds the discovered locations are kept.
+    Methods:
+        scan(config_instance): Searches every service desk of a configuration.
+        get_locations(config_instance): Gets the discovered locations of a configuration.
+        get_location_keys(desk_config, label): Gets the location titles of a service desk.
+    """
+    def __init__(self, discover, scan, workers=4, retries=1, ttl=86400):
+        """
+        Initializes the FanOutScanner.
+        """
+        self.discover = discover
+        self.scan_one = scan
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.ttl = ttl
+        self.__locations = {}
+        self.__discovering = {}
+        self.__desk_titles = {}
+        self.__lock = threading.Lock()
+
+    def scan(self, config_instance):
+        """
+        Searches every service desk of a configuration and merges the results.
+        Falls back to a single search of every local when no location could be discovered.
+        Args:
+        - config_instance (YamlConfigItem): The configuration with the wildcard local.
+        Returns:
+        - tuple: The merged NotificationData, or None if every search failed, and the location
+                 titles of the service desks that could not be searched.
+        """
+        if not is_fan_out(config_instance):
+            return self.__scan_safely(config_instance), []
+        locations = self.get_locations(config_instance)
+        if not locations:
+            logger.warning('No locations discovered for %s, searching every local at once',
+                           config_instance.title)
+            return self.__scan_safely(config_instance), []
+
+        targets = expand_locations(config_instance, locations)
+        logger.info('Searching %s on %s service desk(s)', config_instance.title, len(targets))
+        results = [None] * len(targets)
+        pending = list(range(len(targets)))
+        for attempt in range(self.retries + 1):
+            if attempt:
+                logger.info('Searching %s failed service desk(s) of %s again', len(pending),
+                            config_instance.title)
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(pending)),
+                                    thread_name_prefix='siga-fan-out') as pool:
+                for index, msg_header in zip(pending, pool.map(
+                        lambda i: self.__scan_safely(targets[i][0]), pending)):
+                    results[index] = msg_header
+            pending = [i for i in pending if results[i] is None]
+            if not pending:
+                break
+
+        succeeded = [i for i, msg_header in enumerate(results) if msg_header is not None]
+        with self.__lock:
+            for i in succeeded:
+                self.__desk_titles.setdefault(targets[i][0].key, set()) \
+                    .update(results[i].get_time_slots())
+        if pending:
+            logger.warning('Could not search %s: %s', config_instance.title,
+                           ', '.join(targets[i][1] for i in pending))
+        failed = []
+        for i in pending:
+            failed.extend(key for key in self.get_location_keys(*targets[i][:2])
+                          if key not in failed)
+        if not succeeded:
+            return None, failed
+        return merge_results([results[i] for i in succeeded],
+                             [targets[i][2] for i in succeeded]), failed
+
+    def get_location_keys(self, desk_config, label):
+        """
+        Gets the titles under which the time slots of a service desk are kept, as returned by
+        its previous searches, and its dropdown label, the only name known before any of them.
+        Args:
+        - desk_config (YamlConfigItem): The configuration of the service desk.
+        - label (str): The label of the service desk in the dropdown.
+        Returns:
+        - list: The location titles, sorted.
+        """
+        with self.__lock:
+            titles = set(self.__desk_titles.get(desk_config.key, ()))
+        return sorted(titles | {label})
+
+    def get_locations(self, config_instance):
+        """
+        Gets the locals and service desks of the district and service of a configuration,
+        discovering them again once they are older than the ttl. The discovery runs outside
+        the lock, so other districts are discovered at the same time; the searches asking for
+        the district being discovered wait for that discovery instead of starting another.
+        Args:
+        - config_instance (YamlConfigItem): The search configuration.
+        Returns:
+        - dict: The locations, empty if they could not be discovered.
+        """
+        service_opt = config_instance.service_opt
+        key = (config_instance.entity_opt, service_opt.get('tema'), service_opt.get('subtema'),
+               service_opt.get('motivo'), config_instance.location_opt.get('distrito'))
+        with self.__lock:
+            discovered_at, locations = self.__locations.get(key, (None, None))
+            if discovered_at is not None and time.monotonic() - discovered_at < self.ttl:
+                return locations
+            discovery = self.__discovering.get(key)
+            owner = discovery is None
+            if owner:
+                discovery = self.__discovering[key] = Future()
+        if not owner:
+            return discovery.result()
+
+        locations = {}
+        try:
+            locations = self.discover(config_instance) or {}
+        except Exception as ex: # pylint: disable=broad-except
+            logger.error('Location discovery failed for %s: %s', config_instance.title, ex)
+        finally:
+            with self.__lock:
+                if locations:
+                    self.__locations[key] = (time.monotonic(), locations)
+                del self.__discovering[key]
+            discovery.set_result(locations)
+        return locations
+
+    def __scan_safely(self, config_instance):
+        """
+        Searches a configuration, turning an unexpected error or a search that did not reach
+        the results page into a failed search.
+        """
+        try:
+            msg_header = self.scan_one(config_instance)
+        except Exception as ex: # pylint: disable=broad-except
+            logger.error('Search of %s failed: %s', config_instance.title, ex)
+            return None
+        if msg_header is not None and not msg_header.get_results_read():
+            logger.warning('Search of %s did not reach the results page', config_instance.title)
+            return None
+        return msg_header
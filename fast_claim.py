@@ -0,0 +1,290 @@
+"""
+FastClaimer: A class to claim a time slot as soon as a search finds it, on the browser that
+found it, filling the booking details from an encrypted local profile.
+Imports:
+- os: Used to write the encrypted profile readable by its owner only.
+- json: The format of the decrypted profile.
+- time: Used to measure the claim with a monotonic clock.
+- logging: Logging facility for Python.
+- threading: Used to run one claim at a time across the worker threads.
+- datetime: Used to compare the time slots with the claim rules.
+- cryptography: Encrypts and decrypts the profile, imported only when a profile is used.
+
+Example usage:
+claimer = FastClaimer(claim_slot, 'claim_profile.enc', profile_key, hold=pool.hold)
+with pool.lease() as driver:
+    msg_header = check_schedule(driver, config_instance)
+    claimer.claim(driver, config_instance, msg_header)
+"""
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from metrics import METRICS, config_labels
+from slot_parser import parse_slot_datetime
+from yaml_loader import parse_time
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class ClaimError(Exception):
+    """Raised when the profile of the fast claim cannot be written or read."""
+
+
+def import_fernet():
+    """
+    Imports the Fernet module of cryptography, which only the fast claim needs.
+    Returns:
+    - module: cryptography.fernet.
+    Raises:
+    - ClaimError: If cryptography is not installed.
+    """
+    try:
+        from cryptography import fernet # pylint: disable=import-outside-toplevel
+    except ImportError as ex:
+        raise ClaimError("The fast claim needs the cryptography package: "
+                         "pip install -r requirements.txt") from ex
+    return fernet
+
+
+def get_fernet(key):
+    """
+    Gets the cipher of the profile.
+    Args:
+    - key (str): The Fernet key, as written by new_profile_key.
+    Returns:
+    - Fernet: The cipher.
+    Raises:
+    - ClaimError: If cryptography is not installed or the key is not valid.
+    """
+    fernet = import_fernet()
+    if not key:
+        raise ClaimError("CLAIM_PROFILE_KEY is not set.")
+    try:
+        return fernet.Fernet(key.encode() if isinstance(key, str) else key)
+    except ValueError as ex:
+        raise ClaimError(f"CLAIM_PROFILE_KEY is not a valid key: {ex}") from ex
+
+
+def new_profile_key():
+    """
+    Creates a new key for the profile.
+    Returns:
+    - str: A Fernet key.
+    Raises:
+    - ClaimError: If cryptography is not installed.
+    """
+    return import_fernet().Fernet.generate_key().decode()
+
+
+def encrypt_profile(source_path, profile_path, key):
+    """
+    Encrypts a YAML profile with the booking details.
+    Args:
+    - source_path (str): A YAML mapping of the booking form fields to their values.
+    - profile_path (str): The encrypted profile to write.
+    - key (str): The Fernet key.
+    Raises:
+    - ClaimError: If the source is not a mapping of fields to values.
+    """
+    import yaml # pylint: disable=import-outside-toplevel
+    with open(source_path, 'r', encoding='utf8') as file:
+        profile = yaml.safe_load(file)
+    if not isinstance(profile, dict) or not profile or \
+            any(isinstance(v, (dict, list)) for v in profile.values()):
+        raise ClaimError(f"{source_path} must map each booking form field to a value.")
+    token = get_fernet(key).encrypt(json.dumps({str(k): str(v) for k, v in profile.items()})
+                                    .encode('utf-8'))
+    descriptor = os.open(profile_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'wb') as file:
+        file.write(token)
+
+
+def load_profile(profile_path, key):
+    """
+    Decrypts the profile with the booking details.
+    Args:
+    - profile_path (str): The encrypted profile.
+    - key (str): The Fernet key.
+    Returns:
+    - dict: The booking form fields and their values.
+    Raises:
+    - ClaimError: If the profile is missing or cannot be decrypted.
+    """
+    cipher = get_fernet(key)
+    try:
+        with open(profile_path, 'rb') as file:
+            return json.loads(cipher.decrypt(file.read()).decode('utf-8'))
+    except OSError as ex:
+        raise ClaimError(f"Cannot read the claim profile: {ex}") from ex
+    except import_fernet().InvalidToken as ex:
+        raise ClaimError("The claim profile does not match CLAIM_PROFILE_KEY.") from ex
+
+
+class ClaimRules:
+    """
+    Represents the rules choosing the time slot to claim among the ones found by a search.
+    Args:
+        claim_opt (Mapping): The claim options of the configuration.
+    Attributes:
+        earliest (bool): Prefer the earliest slot over the preferred service desk.
+        start_time (datetime.time): The earliest time of the day of a slot.
+        end_time (datetime.time): The latest time of the day of a slot.
+        max_days (int or None): The latest day of a slot, in days from today.
+        desks (tuple): Parts of the titles of the accepted service desks, by preference.
+    Methods:
+        select(time_slots, now): Chooses the slot to claim.
+    """
+    def __init__(self, claim_opt):
+        """
+        Initializes the ClaimRules.
+        """
+        self.earliest = bool(claim_opt.get('earliest', True))
+        self.start_time = parse_time(claim_opt.get('start_time', '00:00'))
+        self.end_time = parse_time(claim_opt.get('end_time', '23:59'))
+        self.max_days = claim_opt.get('max_days')
+        self.desks = tuple(str(d).lower() for d in claim_opt.get('desks') or ())
+
+    def select(self, time_slots, now=None):
+        """
+        Chooses the slot to claim: the earliest one, or the one of the most preferred service
+        desk when earliest is off, among the slots matching the rules.
+        Args:
+        - time_slots (dict): The slot labels by location title.
+        - now (datetime): The current time.
+        Returns:
+        - tuple: The location title and the slot label, or None if no slot matches.
+        """
+        now = now or datetime.now()
+        latest = now + timedelta(days=self.max_days) if self.max_days is not None else None
+        candidates = []
+        for location, labels in time_slots.items():
+            rank = self.__get_rank(location)
+            if rank is None:
+                continue
+            for label in labels:
+                try:
+                    moment = parse_slot_datetime(label)
+                except ValueError:
+                    continue
+                if moment < now or (latest is not None and moment > latest) or \
+                        not self.start_time <= moment.time() <= self.end_time:
+                    continue
+                key = (moment, rank) if self.earliest else (rank, moment)
+                candidates.append((key, location, label))
+        if not candidates:
+            return None
+        _, location, label = min(candidates, key=lambda candidate: candidate[0])
+        return location, label
+
+    def __get_rank(self, location):
+        """Gets the preference of a service desk, 0 being the best, or None if not accepted."""
+        if not self.desks:
+            return 0
+        title = location.lower()
+        return next((rank for rank, desk in enumerate(self.desks) if desk in title), None)
+
+
+class FastClaimer:
+    """
+    Represents the fast claim of the time slots found by the searches.
+    The claim runs on the driver of the search, still on its results page: the chosen slot is
+    clicked and the booking details are filled from the profile. The booking is then either
+    confirmed, or the driver is held on the booking details for hold_seconds. Claims run one at
+    a time, a slot is claimed once, and a confirmed booking stops the claims of its service.
+    Args:
+        claim (callable): Opens and fills the booking details of a slot on a driver, returning
+                          True on success: (driver, config_instance, location, label, profile,
+                          confirm).
+        profile_path (str): The encrypted profile with the booking details.
+        profile_key (str): The key of the profile.
+        confirm (bool): Confirm the booking instead of holding it.
+        hold_seconds (int): Seconds a held driver is kept on the booking details.
+        hold (callable): Keeps a driver out of the pool: (driver, seconds).
+        notify (callable): Reports a claim: (msg_header, result).
+    Methods:
+        claim(driver, config_instance, msg_header): Claims a slot of a search, if any matches.
+    """
+    def __init__(self, claim, profile_path, profile_key, confirm=False, hold_seconds=600,
+                 hold=None, notify=None):
+        """
+        Initializes the FastClaimer.
+        """
+        self.claim_slot = claim
+        self.profile_path = profile_path
+        self.profile_key = profile_key
+        self.confirm = confirm
+        self.hold_seconds = hold_seconds
+        self.hold = hold
+        self.notify = notify
+        self.__profile = None
+        self.__claimed = set()
+        self.__booked = set()
+        self.__lock = threading.Lock()
+
+    def claim(self, driver, config_instance, msg_header):
+        """
+        Claims the slot chosen by the claim rules of a configuration among the slots of a search.
+        Args:
+        - driver: The WebDriver of the search, on its results page.
+        - config_instance (YamlConfigItem): The search configuration.
+        - msg_header (NotificationData): The results of the search.
+        Returns:
+        - dict: The location, label, confirmed flag and seconds of the claim, or None.
+        """
+        if config_instance.claim_opt is None or not msg_header.get_time_slots():
+            return None
+        picked = ClaimRules(config_instance.claim_opt).select(msg_header.get_time_slots())
+        if picked is None:
+            return None
+        location, label = picked
+        service = (config_instance.entity_opt, tuple(sorted(config_instance.service_opt.items())))
+        with self.__lock:
+            if service in self.__booked or (config_instance.key, location, label) in self.__claimed:
+                return None
+            profile = self.__get_profile()
+            if profile is None:
+                return None
+
+            logger.info('Claiming %s at %s for %s', label, location, config_instance.title)
+            started = time.monotonic()
+            try:
+                claimed = self.claim_slot(driver, config_instance, location, label, profile,
+                                          self.confirm)
+            except Exception as ex: # pylint: disable=broad-except
+                logger.error('Claim of %s at %s failed: %s', label, location, ex)
+                claimed = False
+            seconds = time.monotonic() - started
+            outcome = 'failed' if not claimed else 'confirmed' if self.confirm else 'held'
+            METRICS.observe('siga_step_duration_seconds', seconds,
+                            **config_labels(config_instance), step='claim')
+            METRICS.inc('siga_claims_total', **config_labels(config_instance), result=outcome)
+            if not claimed:
+                return None
+            self.__claimed.add((config_instance.key, location, label))
+            if self.confirm:
+                self.__booked.add(service)
+
+        logger.info('Slot %s at %s %s in %.1fs', label, location, outcome, seconds)
+        result = {'location': location, 'label': label, 'confirmed': self.confirm,
+                  'seconds': seconds}
+        if self.notify is not None:
+            self.notify(msg_header, result)
+        if not self.confirm and self.hold is not None:
+            self.hold(driver, self.hold_seconds)
+        return result
+
+    def __get_profile(self):
+        """Decrypts the profile on the first claim, or None when it cannot be read."""
+        if self.__profile is None:
+            try:
+                self.__profile = load_profile(self.profile_path, self.profile_key)
+            except ClaimError as ex:
+                logger.error('Fast claim skipped: %s', ex)
+                return None
+        return self.__profile
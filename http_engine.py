@@ -0,0 +1,554 @@
+"""
+HttpScanEngine: A class to scan the SIGA booking flow without a browser.
+It replays the form submissions of the three booking steps with a pooled requests.Session
+and parses the schedule list from the returned HTML. In sticky mode the session of each search
+is kept and only the last step is submitted again on the next searches.
+Imports:
+- time: Used to measure the duration of each step with a monotonic clock.
+- logging: Logging facility for Python.
+- threading: Used to share the sticky sessions between the worker threads.
+- urllib.parse: Used to resolve the form actions against the page URL.
+- html.parser: Used to parse the forms and the schedule list of the SIGA pages.
+- requests: Used to submit the forms through a keep-alive connection pool.
+
+Example usage:
+engine = HttpScanEngine(sticky=True)
+msg_header, time_slots = engine.scan(config_instance)
+"""
+import time
+import logging
+import threading
+from urllib.parse import urljoin
+from html.parser import HTMLParser
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from notif_data import NotificationData
+from slot_parser import filter_time_slots
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = 'https://siga.marcacaodeatendimento.pt/Marcacao/Entidades'
+DEFAULT_TIMEOUT = 20
+
+
+class HttpScanError(Exception):
+    """Raised when a SIGA page does not contain what the booking flow expects."""
+
+
+class SigaForm:
+    """
+    Represents a form found on a SIGA page.
+    Attributes:
+        action (str): The form action, empty when the form posts to the page itself.
+        method (str): The HTTP method of the form.
+        fields (dict): The values of the inputs that are sent with the form.
+        selects (dict): The options of each select, as a dict of value to label.
+        buttons (list): The buttons of the form, as dicts of their attributes.
+    """
+    def __init__(self, action='', method='post'):
+        """
+        Initializes the SigaForm.
+        Args:
+        - action (str): The form action.
+        - method (str): The HTTP method of the form.
+        """
+        self.action = action
+        self.method = (method or 'post').lower()
+        self.fields = {}
+        self.selects = {}
+        self.buttons = []
+
+    def get_label(self, name, value):
+        """
+        Gets the label of an option of a select.
+        Args:
+        - name (str): The name of the select.
+        - value: The value of the option.
+        Returns:
+        - str: The option label, or the value itself when the option is not on the page.
+        """
+        return self.selects.get(name, {}).get(str(value), str(value))
+
+
+class SigaPageParser(HTMLParser):
+    """
+    Parses the forms, the entity buttons, the schedule list and the error message of a SIGA page.
+    Attributes:
+        forms (list): The SigaForm instances found on the page.
+        entity_buttons (list): Pairs of (SigaForm or None, attributes) of the entity buttons.
+        slots (list): Pairs of (location title, slot label) of the schedule list.
+        error_message (str): The text of the error message, if any.
+    """
+    def __init__(self):
+        """
+        Initializes the SigaPageParser.
+        """
+        super().__init__(convert_charrefs=True)
+        self.forms = []
+        self.entity_buttons = []
+        self.slots = []
+        self.error_message = ''
+        self.__form = None
+        self.__select = None
+        self.__option = None
+        self.__divs = []
+        self.__slot = None
+        self.__capture = None
+
+    def handle_starttag(self, tag, attrs):
+        """Handles an opening tag."""
+        attrs = {k: (v if v is not None else '') for k, v in attrs}
+        css = attrs.get('class', '')
+        if tag == 'form':
+            self.__form = SigaForm(attrs.get('action', ''), attrs.get('method', 'post'))
+            self.forms.append(self.__form)
+        elif tag == 'input':
+            self.__handle_input(attrs)
+        elif tag == 'select':
+            name = attrs.get('name') or attrs.get('id', '')
+            self.__select = {'name': name, 'options': {}, 'selected': None}
+        elif tag == 'option' and self.__select is not None:
+            self.__option = {'value': attrs.get('value', ''), 'text': ''}
+            if 'selected' in attrs:
+                self.__select['selected'] = self.__option['value']
+        elif tag == 'button':
+            self.__handle_button(attrs, css)
+        elif tag == 'div':
+            self.__handle_div(attrs, css)
+        elif tag == 'span' and self.__slot is not None and self.__slot['text'] is None:
+            self.__slot['text'] = ''
+            self.__capture = 'slot'
+        elif tag == 'h5' and self.__in_div('error-message') and not self.error_message:
+            self.__capture = 'error'
+
+    def handle_endtag(self, tag):
+        """Handles a closing tag."""
+        if tag == 'form':
+            self.__form = None
+        elif tag == 'option' and self.__option is not None:
+            self.__select['options'][self.__option['value']] = self.__option['text'].strip()
+            self.__option = None
+        elif tag == 'select' and self.__select is not None:
+            self.__close_select()
+        elif tag in ('span', 'h5'):
+            self.__capture = None
+        elif tag == 'div' and self.__divs:
+            if self.__divs.pop() == 'slot':
+                self.slots.append((self.__slot['title'], (self.__slot['text'] or '').strip()))
+                self.__slot = None
+
+    def handle_data(self, data):
+        """Handles the text between tags."""
+        if self.__option is not None:
+            self.__option['text'] += data
+        if self.__capture == 'slot':
+            self.__slot['text'] += data
+        elif self.__capture == 'error':
+            self.error_message += data
+
+    def get_form_with(self, name):
+        """
+        Gets the form that has a field or select with the given name.
+        Args:
+        - name (str): The field name.
+        Returns:
+        - SigaForm or None: The form, if any.
+        """
+        for form in self.forms:
+            if name in form.fields or name in form.selects:
+                return form
+        return None
+
+    def __handle_input(self, attrs):
+        """Keeps the value of an input of the current form."""
+        if self.__form is None or not attrs.get('name'):
+            return
+        if attrs.get('type', '').lower() in ('checkbox', 'radio') and 'checked' not in attrs:
+            return
+        if attrs.get('type', '').lower() in ('submit', 'button', 'image'):
+            return
+        self.__form.fields[attrs['name']] = attrs.get('value', '')
+
+    def __handle_button(self, attrs, css):
+        """Keeps the buttons, remembering the entity ones."""
+        if self.__form is not None:
+            self.__form.buttons.append(attrs)
+        if 'btn-selecionar-entidade' in css.split():
+            self.entity_buttons.append((self.__form, attrs))
+
+    def __handle_div(self, attrs, css):
+        """Tracks the divs of the schedule list and of the error message."""
+        if css == 'schedule-list':
+            self.__divs.append('schedule-list')
+        elif css.startswith('col-md-5 m-') and self.__in_div('schedule-list'):
+            self.__slot = {'title': attrs.get('title', ''), 'text': None}
+            self.__divs.append('slot')
+        elif css == 'error-message':
+            self.__divs.append('error-message')
+        else:
+            self.__divs.append('div')
+
+    def __close_select(self):
+        """Stores the options and the selected value of the current select."""
+        options = self.__select['options']
+        if self.__form is not None and self.__select['name']:
+            self.__form.selects[self.__select['name']] = options
+            selected = self.__select['selected']
+            if selected is None and options:
+                selected = next(iter(options))
+            self.__form.fields[self.__select['name']] = selected or ''
+        self.__select = None
+
+    def __in_div(self, kind):
+        """Checks whether the parser is inside a div of the given kind."""
+        return kind in self.__divs
+
+
+def create_session(pool_size=10):
+    """
+    Creates a requests.Session with a keep-alive connection pool.
+    Args:
+    - pool_size (int): Maximum number of connections kept per host.
+    Returns:
+    - requests.Session: The session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Windows NT 4.0; WOW64) AppleWebKit/537.36 '
+                      '(KHTML, like Gecko) Chrome/37.0.2049.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml',
+    })
+    return session
+
+
+class StickySession:
+    """
+    Represents the session of a search left on its results page.
+    Attributes:
+        session (requests.Session): The session holding the cookies of the search.
+        action (str): The URL the last step is submitted to.
+        data (dict): The fields of the last step.
+        labels (tuple): The entity, category, subcategory, motive, district, local and
+                        service desk labels of the search.
+        created_at (float): Monotonic time of the whole search that started the session.
+    """
+    def __init__(self, session, action, data, msg_header):
+        """
+        Initializes the StickySession after a whole search.
+        Args:
+        - session (requests.Session): The session of the search.
+        - action (str): The URL the last step was submitted to.
+        - data (dict): The fields of the last step.
+        - msg_header (NotificationData): The header of the search, to copy the labels from.
+        """
+        self.session = session
+        self.action = action
+        self.data = data
+        self.labels = (msg_header.get_entity(), msg_header.get_category(),
+                       msg_header.get_subcategory(), msg_header.get_motive(),
+                       msg_header.get_district(), msg_header.get_local(),
+                       msg_header.get_service_desk())
+        self.created_at = time.monotonic()
+
+    def new_header(self):
+        """
+        Creates the header of a search submitted again on this session.
+        Returns:
+            NotificationData: A header with the labels of the whole search.
+        """
+        msg_header = NotificationData()
+        entity, category, subcategory, motive, district, local, service_desk = self.labels
+        msg_header.set_entity(entity)
+        msg_header.set_category(category)
+        msg_header.set_subcategory(subcategory)
+        msg_header.set_motive(motive)
+        msg_header.set_district(district)
+        msg_header.set_local(local)
+        msg_header.set_service_desk(service_desk)
+        return msg_header
+
+    def close(self):
+        """
+        Closes the session of the search, dropping its cookies.
+        The adapters are unmounted first: they belong to the connection pool of the engine,
+        which stays open for the other searches.
+        """
+        self.session.adapters.clear()
+        self.session.close()
+
+
+class HttpScanEngine:
+    """
+    Represents a browserless scan of the SIGA booking flow.
+    Each scan uses its own cookie jar on top of a shared connection pool, so the engine
+    can be used by several tasks at the same time.
+    In sticky mode the cookie jar and the last step of each search are kept by the digest of
+    its configuration, and the next search submits that step alone. A response without a
+    schedule list nor an error message means the session expired or the form was reset, and
+    the whole booking flow runs again.
+    Args:
+        base_url (str): The URL of the Entidades page.
+        timeout (int): Timeout in seconds of each request.
+        sticky (bool): Keep the session of each search and submit only the last step again.
+        max_age (int): Minutes after which a sticky session is started again.
+    Methods:
+        scan(config_instance): Runs the booking flow for a configuration.
+        close(): Closes the sticky sessions and the connection pool.
+    """
+    def __init__(self, base_url=DEFAULT_URL, timeout=DEFAULT_TIMEOUT, sticky=False, max_age=30):
+        """
+        Initializes the HttpScanEngine.
+        Args:
+        - base_url (str): The URL of the Entidades page.
+        - timeout (int): Timeout in seconds of each request.
+        - sticky (bool): Keep the session of each search and submit only the last step again.
+        - max_age (int): Minutes after which a sticky session is started again.
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.sticky = sticky
+        self.max_age = max_age * 60
+        self.__pool = create_session()
+        self.__sessions = {}
+        self.__lock = threading.Lock()
+
+    def scan(self, config_instance):
+        """
+        Runs the booking flow for a configuration.
+        Args:
+        - config_instance (YamlConfigItem): The search configuration.
+        Returns:
+        - tuple: The NotificationData header and the time slot mapping.
+        Raises:
+        - HttpScanError: If a page does not contain the expected form or a request fails.
+        """
+        try:
+            if self.sticky:
+                result = self.__refresh(config_instance)
+                if result is not None:
+                    return result
+            return self.__scan(config_instance)
+        except requests.RequestException as ex:
+            raise HttpScanError(f"Request failed: {ex}") from ex
+
+    def close(self):
+        """
+        Closes the sticky sessions and the connection pool.
+        """
+        with self.__lock:
+            sessions = list(self.__sessions.values())
+            self.__sessions.clear()
+        for sticky in sessions:
+            sticky.close()
+        self.__pool.close()
+
+    def __scan(self, config_instance):
+        """
+        Runs the booking flow for a configuration, letting the request errors through.
+        """
+        msg_header = NotificationData()
+        service_opt = config_instance.service_opt
+        location_opt = config_instance.location_opt
+        localidade = location_opt.get('localidade', '')
+        local_atendimento = location_opt.get('local_atendimento', '')
+
+        session = requests.Session()
+        for prefix, adapter in self.__pool.adapters.items():
+            session.mount(prefix, adapter)
+        session.headers.update(self.__pool.headers)
+
+        # Step 1: Set entity
+        started = time.monotonic()
+        url, page = self.__get(session, self.base_url)
+        url, page = self.__submit_entity(session, url, page,
+                                         config_instance.entity_opt,
+                                         msg_header)
+        started = self.__timed(msg_header, 'entity', started)
+
+        # Step 2: Set category, subcategory, and motive
+        values = {'IdCategoria': service_opt.get('tema', ''),
+                  'IdSubcategoria': service_opt.get('subtema', ''),
+                  'IdMotivo': service_opt.get('motivo', '')}
+        form = self.__require_form(page, 'IdCategoria')
+        msg_header.set_category(form.get_label('IdCategoria', values['IdCategoria']))
+        msg_header.set_subcategory(form.get_label('IdSubcategoria', values['IdSubcategoria']))
+        msg_header.set_motive(form.get_label('IdMotivo', values['IdMotivo']))
+        url, page = self.__submit(session, url, form, values)
+        started = self.__timed(msg_header, 'step_two', started)
+
+        # Step 3: Set district, local, and service desk
+        values = {'IdDistrito': location_opt.get('distrito', ''), 'IdLocalidade': localidade}
+        form = self.__require_form(page, 'IdDistrito')
+        msg_header.set_district(form.get_label('IdDistrito', values['IdDistrito']))
+        msg_header.set_local(form.get_label('IdLocalidade', localidade))
+        if localidade > 0 and local_atendimento:
+            values['IdLocalAtendimento'] = local_atendimento
+            msg_header.set_service_desk(form.get_label('IdLocalAtendimento', local_atendimento))
+        action, data = self.__get_form_data(url, form, values)
+        url, page = self.__submit(session, url, form, values)
+        started = self.__timed(msg_header, 'step_three', started)
+
+        if self.sticky and form.method != 'get' and self.__has_results(page):
+            self.__keep(config_instance, StickySession(session, action, data, msg_header))
+        return msg_header, self.__read_results(page, config_instance, msg_header, started)
+
+    def __refresh(self, config_instance):
+        """
+        Submits the last step again on the sticky session of a configuration.
+        Returns:
+        - tuple: The NotificationData header and the time slot mapping, or None when there is
+                 no live session and the whole booking flow must run.
+        """
+        now = time.monotonic()
+        with self.__lock:
+            sticky = self.__sessions.pop(config_instance.digest, None)
+            expired = [self.__sessions.pop(d) for d, s in list(self.__sessions.items())
+                       if now - s.created_at >= self.max_age]
+        for old in expired:
+            old.close()
+        if sticky is None:
+            return None
+        if now - sticky.created_at >= self.max_age:
+            logger.info('Sticky session of %s is %.0f seconds old, starting a new one',
+                        config_instance.title, now - sticky.created_at)
+            sticky.close()
+            return None
+
+        try:
+            response = sticky.session.post(sticky.action, data=sticky.data, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as ex:
+            logger.info('Sticky session of %s failed, running the whole search: %s',
+                        config_instance.title, ex)
+            sticky.close()
+            return None
+        page = self.__parse(response.text)
+        if not self.__has_results(page):
+            logger.info('Sticky session of %s expired, running the whole search',
+                        config_instance.title)
+            sticky.close()
+            return None
+
+        msg_header = sticky.new_header()
+        started = self.__timed(msg_header, 'refresh', now)
+        self.__keep(config_instance, sticky)
+        return msg_header, self.__read_results(page, config_instance, msg_header, started)
+
+    def __keep(self, config_instance, sticky):
+        """
+        Keeps the sticky session of a configuration for its next search, closing the one it
+        replaces.
+        """
+        with self.__lock:
+            old = self.__sessions.get(config_instance.digest)
+            self.__sessions[config_instance.digest] = sticky
+        if old is not None and old is not sticky:
+            old.close()
+
+    def __read_results(self, page, config_instance, msg_header, started):
+        """
+        Reads the time slots of the results page.
+        Returns:
+        - dict: The time slot mapping.
+        """
+        if page.error_message.strip():
+            logger.info('%s', page.error_message.strip())
+        msg_header.set_results_read(self.__has_results(page))
+        time_slots = filter_time_slots(page.slots, config_instance.max_days)
+        self.__timed(msg_header, 'time_slots', started)
+        return time_slots
+
+    @staticmethod
+    def __has_results(page):
+        """
+        Checks whether a page is the results page: a schedule list or the error message.
+        """
+        return bool(page.slots or page.error_message.strip())
+
+    @staticmethod
+    def __timed(msg_header, step, started):
+        """
+        Keeps how long a step took.
+        Returns:
+        - float: The monotonic time at the end of the step.
+        """
+        ended = time.monotonic()
+        msg_header.set_step_timing(step, ended - started)
+        logger.info('Step "%s" took %.3fs', step, ended - started)
+        return ended
+
+    def __get(self, session, url):
+        """
+        Loads and parses a page.
+        Returns:
+        - tuple: The final URL and the parsed page.
+        """
+        response = session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.url, self.__parse(response.text)
+
+    def __submit_entity(self, session, url, page, entity, msg_header):
+        """
+        Submits the form of the entity button.
+        Returns:
+        - tuple: The final URL and the parsed page of step 2.
+        """
+        for form, attrs in page.entity_buttons:
+            if attrs.get('id') == str(entity):
+                msg_header.set_entity(attrs.get('title', ''))
+                values = {attrs.get('name') or 'IdEntidade': attrs.get('value') or entity}
+                logger.info('Botão "%s" submetido com sucesso!', attrs.get('title', ''))
+                return self.__submit(session, url, form or SigaForm(), values)
+        raise HttpScanError(f"Cannot find Entity '{entity}' button.")
+
+    def __submit(self, session, url, form, values):
+        """
+        Submits a form with the given values on top of its current fields.
+        Returns:
+        - tuple: The final URL and the parsed page.
+        """
+        action, data = self.__get_form_data(url, form, values)
+        if form.method == 'get':
+            response = session.get(action, params=data, timeout=self.timeout)
+        else:
+            response = session.post(action, data=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response.url, self.__parse(response.text)
+
+    @staticmethod
+    def __get_form_data(url, form, values):
+        """
+        Gets the URL and the fields a form is submitted with.
+        Returns:
+        - tuple: The resolved action and the current fields updated with the given values.
+        """
+        data = dict(form.fields)
+        data.update({k: str(v) for k, v in values.items()})
+        return (urljoin(url, form.action) if form.action else url), data
+
+    @staticmethod
+    def __require_form(page, name):
+        """
+        Gets the form that has the given field, failing when the page does not have it.
+        """
+        form = page.get_form_with(name)
+        if form is None:
+            raise HttpScanError(f"Cannot find the form with '{name}'.")
+        return form
+
+    @staticmethod
+    def __parse(html):
+        """
+        Parses a SIGA page.
+        """
+        parser = SigaPageParser()
+        parser.feed(html)
+        parser.close()
+        return parser
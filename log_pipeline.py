@@ -0,0 +1,138 @@
+"""
+The logging pipeline of siga.py: the handlers of a dictConfig YAML file run on a QueueListener
+thread, so writing the log to a slow disk never blocks a search. The log file is rotated on
+time and the rotated files are compressed with gzip.
+Imports:
+- os: Used to compress and remove the rotated log files.
+- gzip: Used to compress the rotated log files.
+- json: Used by the JSON lines formatter.
+- queue: Provides the queue between the loggers and the handlers.
+- copy: Used to hand a copy of each record to the listener thread.
+- atexit: Used to flush the queued records on exit.
+- shutil: Used to copy the rotated log files into their gzip archive.
+- logging: Logging facility for Python.
+- datetime: Used for the timestamps of the JSON lines.
+
+Example usage:
+listener = setup_logging('logging_config.yaml', log_format='json')
+"""
+import os
+import gzip
+import json
+import copy
+import queue
+import atexit
+import shutil
+import logging as log
+import logging.config
+import logging.handlers
+from datetime import datetime
+
+# Used when the logging configuration file is missing
+DEFAULT_CONFIG = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {'simple': {
+        'format': '%(asctime)s - %(name)-12s - %(levelname)-8s:[%(filename)s:%(lineno)-04d]: '
+                  '%(message)s',
+        'datefmt': '%Y-%m-%d %H:%M:%S'}},
+    'handlers': {'console': {'class': 'logging.StreamHandler', 'level': 'INFO',
+                             'formatter': 'simple', 'stream': 'ext://sys.stdout'}},
+    'root': {'level': 'INFO', 'handlers': ['console']},
+}
+
+LISTENER = None
+
+
+class GZipRotator:
+    """Compresses a rotated log file."""
+    def __call__(self, source, dest):
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+
+class GZipTimedRotatingFileHandler(log.handlers.TimedRotatingFileHandler):
+    """A TimedRotatingFileHandler that compresses the rotated files with gzip."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rotator = GZipRotator()
+        self.namer = lambda name: name + '.gz'
+
+
+class LocalQueueHandler(log.handlers.QueueHandler):
+    """
+    A QueueHandler for a listener in the same process: the message is merged with its
+    arguments, but the exception is kept so each formatter renders it its own way.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonFormatter(log.Formatter):
+    """Formats each record as one JSON object per line, for machine ingestion."""
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'file': record.filename,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(config_path='logging_config.yaml', log_format='text'):
+    """
+    Configures logging from a dictConfig YAML file and moves its root handlers to a
+    QueueListener thread, leaving only a QueueHandler on the root logger.
+    Args:
+    - config_path (str): The dictConfig YAML file.
+    - log_format (str): 'text', or 'json' to write JSON lines to the log file.
+    Returns:
+    - QueueListener: The listener, stopped by stop_logging() or automatically on exit.
+    """
+    global LISTENER # pylint: disable=global-statement
+    stop_logging()
+
+    config = DEFAULT_CONFIG
+    if os.path.isfile(config_path):
+        import yaml # pylint: disable=import-outside-toplevel
+        with open(config_path, 'r', encoding='utf8') as file:
+            config = yaml.safe_load(file)
+    if log_format == 'json' and 'json' in config.get('formatters', {}):
+        for name, handler in config.get('handlers', {}).items():
+            if name != 'console':
+                handler['formatter'] = 'json'
+    logging.config.dictConfig(config)
+    if config is DEFAULT_CONFIG:
+        log.warning('Logging configuration %s not found, logging to the console only',
+                    config_path)
+
+    root = log.getLogger()
+    handlers = list(root.handlers)
+    records = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(LocalQueueHandler(records))
+    LISTENER = log.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    LISTENER.start()
+    atexit.register(stop_logging)
+    return LISTENER
+
+
+def stop_logging():
+    """
+    Writes the queued records and stops the listener thread.
+    """
+    global LISTENER # pylint: disable=global-statement
+    if LISTENER is not None:
+        LISTENER.stop()
+        LISTENER = None
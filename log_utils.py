@@ -0,0 +1,32 @@
+"""
+Logging helpers shared by siga.py and the scan engines.
+Imports:
+- traceback: Used to log the traceback of an exception.
+- logging: Logging facility for Python.
+"""
+import traceback
+import logging as log
+
+
+def word_in_center(string):
+    """Function to print a string in center."""
+    return f'{string:-^100}'
+
+
+def print_log_schedule(time_slot):
+    """Function to log the time slots found."""
+    if time_slot:
+        log.info('Run! There are time slots available that matches your search')
+        for key, values in sorted(time_slot.items()):
+            log.info('Location: %s - Dates: %s', key, sorted(values))
+
+
+def log_exception(exception):
+    """
+    Log an exception.
+    Args:
+        exception: The exception to log.
+    """
+    log.error(exception.__class__.__name__)
+    log.error(exception)
+    log.error(traceback.format_exc())
@@ -0,0 +1,264 @@
+"""
+MetricsRegistry: A class to keep the step latencies and the search counters in memory and to
+serve them in the Prometheus text format from a small local HTTP endpoint.
+Imports:
+- bisect: Used to find the histogram bucket of a sample.
+- logging: Logging facility for Python.
+- threading: Used to share the metrics between the worker threads and to run the endpoint.
+- http.server: Serves the metrics endpoint, imported only when it is enabled.
+
+Example usage:
+METRICS.observe('siga_step_duration_seconds', 1.2, **config_labels(config_instance),
+                step='district')
+record_scan(config_instance, 'selenium', 'success', msg_header.get_step_timings())
+METRICS.serve(9100)
+# curl http://127.0.0.1:9100/metrics
+"""
+import bisect
+import logging
+import threading
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HELP = {
+    'siga_step_duration_seconds': 'Duration of each step of a search.',
+    'siga_scans_total': 'Searches by result: success, timeout, webdriver_error or error.',
+    'siga_slots_found_total': 'Time slots returned by the searches.',
+    'siga_slots_new_total': 'Time slots that were not available on the previous search.',
+    'siga_claims_total': 'Claims of time slots by result: held, confirmed or failed.',
+}
+
+
+def format_labels(labels):
+    """
+    Formats the labels of a sample.
+    Args:
+    - labels (tuple): Pairs of label name and value.
+    Returns:
+    - str: The labels between braces, or an empty string.
+    """
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+class Histogram:
+    """
+    Represents a cumulative histogram of samples.
+    Attributes:
+        buckets (tuple): The upper bounds of the buckets.
+        counts (list): The samples per bucket, the last one for samples beyond every bound.
+        total (float): The sum of the samples.
+        count (int): The number of samples.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initializes the Histogram.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Adds a sample.
+        Args:
+        - value (float): The sample.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels):
+        """
+        Renders the histogram in the Prometheus text format.
+        Args:
+        - name (str): The metric name.
+        - labels (tuple): Pairs of label name and value.
+        Returns:
+        - list: The sample lines.
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+        lines.append(f'{name}_sum{format_labels(labels)} {self.total}')
+        lines.append(f'{name}_count{format_labels(labels)} {self.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Represents the metrics of the searches.
+    Counters and histograms are created on first use and keyed by name and labels. Other
+    components, like the notification dispatcher, can add collectors that are read on
+    each scrape.
+    Methods:
+        inc(name, amount, **labels): Increments a counter.
+        observe(name, value, **labels): Adds a sample to a histogram.
+        add_collector(collector): Adds a function returning extra samples.
+        render(): Returns the metrics in the Prometheus text format.
+        serve(port, host): Serves the metrics over HTTP.
+        shutdown(): Stops the HTTP endpoint.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initializes the MetricsRegistry.
+        """
+        self.buckets = buckets
+        self.__counters = {}
+        self.__histograms = {}
+        self.__collectors = []
+        self.__lock = threading.Lock()
+        self.__server = None
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Increments a counter.
+        Args:
+        - name (str): The metric name.
+        - amount (float): The increment.
+        - labels: The labels of the sample.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """
+        Adds a sample to a histogram.
+        Args:
+        - name (str): The metric name.
+        - value (float): The sample.
+        - labels: The labels of the sample.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def add_collector(self, collector):
+        """
+        Adds a function read on each scrape.
+        Args:
+        - collector (callable): Returns an iterable of (name, type, help, labels, value), where
+                                type is 'counter' or 'gauge' and labels is a dict.
+        """
+        self.__collectors.append(collector)
+
+    def render(self):
+        """
+        Renders every metric in the Prometheus text format.
+        Returns:
+        - str: The exposition text.
+        """
+        families = {}
+        with self.__lock:
+            for (name, labels), value in self.__counters.items():
+                families.setdefault((name, 'counter'), []).append(
+                    f'{name}{format_labels(labels)} {value}')
+            for (name, labels), histogram in self.__histograms.items():
+                families.setdefault((name, 'histogram'), []).extend(
+                    histogram.render(name, labels))
+        for collector in self.__collectors:
+            try:
+                for name, kind, help_text, labels, value in collector():
+                    HELP.setdefault(name, help_text)
+                    families.setdefault((name, kind), []).append(
+                        f'{name}{format_labels(tuple(sorted(labels.items())))} {value}')
+            except Exception as ex: # pylint: disable=broad-except
+                logger.warning('Metrics collector failed: %s', ex)
+
+        lines = []
+        for (name, kind), samples in sorted(families.items()):
+            if name in HELP:
+                lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serves the metrics on http://host:port/metrics from a background thread.
+        Args:
+        - port (int): The port to listen on.
+        - host (str): The address to listen on, local only by default.
+        """
+        # pylint: disable=import-outside-toplevel
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            """Serves the metrics."""
+            def do_GET(self): # pylint: disable=invalid-name
+                """Answers a scrape."""
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # pylint: disable=redefined-builtin
+                """Keeps the scrapes out of the log."""
+
+        self.__server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.__server.serve_forever, name='siga-metrics',
+                         daemon=True).start()
+        logger.info('Metrics served on http://%s:%s/metrics', host, self.__server.server_port)
+
+    def shutdown(self):
+        """
+        Stops the HTTP endpoint.
+        """
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+
+METRICS = MetricsRegistry()
+
+
+def config_labels(config_instance):
+    """
+    Gets the labels of the samples of a configuration: its stable key, which tells apart the
+    configurations sharing a title or left untitled, and its title to read the metrics by.
+    Args:
+    - config_instance (YamlConfigItem): The search configuration.
+    Returns:
+    - dict: The config and title labels.
+    """
+    return {'config': config_instance.key, 'title': config_instance.title}
+
+
+def record_scan(config_instance, engine, result, step_timings=None, seconds=None):
+    """
+    Records the outcome and the step latencies of a search.
+    Args:
+    - config_instance (YamlConfigItem): The search configuration.
+    - engine (str): The engine that ran the search, 'selenium' or 'http'.
+    - result (str): 'success', 'timeout', 'webdriver_error' or 'error'.
+    - step_timings (dict): The seconds taken by each step.
+    - seconds (float): The duration of the whole search.
+    """
+    labels = config_labels(config_instance)
+    for step, elapsed in (step_timings or {}).items():
+        METRICS.observe('siga_step_duration_seconds', elapsed, **labels, step=step)
+    if seconds is not None:
+        METRICS.observe('siga_step_duration_seconds', seconds, **labels, step='total')
+    METRICS.inc('siga_scans_total', **labels, engine=engine, result=result)
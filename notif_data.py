@@ -12,6 +12,9 @@ class NotificationData:
             _district: District information.
             _local: Local information.
             _service_desk: Service desk information.
+            _time_slots: Time slots found, grouped by location.
+            _step_timings: Seconds taken by each step of the search.
+            _results_read: Whether the search reached the results page.
         """
         self._entity = None
         self._category = None
@@ -20,6 +23,9 @@ class NotificationData:
         self._district = None
         self._local = None
         self._service_desk = None
+        self._time_slots = {}
+        self._step_timings = {}
+        self._results_read = False
 
     # Getter methods
     def get_entity(self):
@@ -50,6 +56,18 @@ class NotificationData:
         """Get service desk information."""
         return self._service_desk
 
+    def get_time_slots(self):
+        """Get time slots found, grouped by location."""
+        return self._time_slots
+
+    def get_step_timings(self):
+        """Get seconds taken by each step of the search."""
+        return self._step_timings
+
+    def get_results_read(self):
+        """Get whether the search reached the results page."""
+        return self._results_read
+
     # Setter methods
     def set_entity(self, entity):
         """
@@ -106,3 +124,28 @@ class NotificationData:
             service_desk: Service desk information to set.
         """
         self._service_desk = service_desk
+
+    def set_time_slots(self, time_slots):
+        """
+        Set time slots found, grouped by location.
+        Args:
+            time_slots: Mapping of location to the list of time slots to set.
+        """
+        self._time_slots = time_slots
+
+    def set_step_timing(self, step, seconds):
+        """
+        Set seconds taken by a step of the search.
+        Args:
+            step: Name of the step.
+            seconds: Seconds taken by the step.
+        """
+        self._step_timings[step] = seconds
+
+    def set_results_read(self, results_read):
+        """
+        Set whether the search reached the results page.
+        Args:
+            results_read: True if a schedule list or the error message was read.
+        """
+        self._results_read = results_read
@@ -0,0 +1,324 @@
+"""
+NotificationDispatcher: A class to deliver the Telegram and desktop notifications on a
+background thread, so a slow Telegram API or notification daemon never stalls a search.
+Imports:
+- time: Used for the backoff, the rate limits and the latency measurements.
+- queue: Provides the bounded queue between the searches and the dispatcher.
+- logging: Logging facility for Python.
+- threading: Runs the dispatcher thread.
+- collections: Used to group the queued messages by chat.
+- requests: Used to call the Telegram API through a keep-alive session.
+
+Example usage:
+dispatcher = NotificationDispatcher(bot_token)
+dispatcher.start()
+dispatcher.enqueue_telegram(chat_id, "Time slots available")
+dispatcher.enqueue_desktop("SIGA", "Time slots available")
+dispatcher.stop()
+"""
+import time
+import queue
+import logging
+import threading
+import collections
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+TELEGRAM_URL = 'https://api.telegram.org/bot{}/sendMessage'
+TELEGRAM_MAX_LENGTH = 4096
+_STOP = object()
+
+
+class LatencyStats:
+    """
+    Represents a simple thread-safe summary of latencies.
+    Attributes:
+        count (int): Number of samples.
+        total (float): Sum of the samples, in seconds.
+        maximum (float): Largest sample, in seconds.
+    """
+    def __init__(self):
+        """
+        Initializes the LatencyStats.
+        """
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.__lock = threading.Lock()
+
+    def add(self, seconds):
+        """
+        Adds a sample.
+        Args:
+        - seconds (float): The latency to add.
+        """
+        with self.__lock:
+            self.count += 1
+            self.total += seconds
+            self.maximum = max(self.maximum, seconds)
+
+    def as_dict(self):
+        """
+        Gets the summary.
+        Returns:
+        - dict: The count, total, average and maximum of the samples.
+        """
+        with self.__lock:
+            return {'count': self.count, 'total': self.total, 'maximum': self.maximum,
+                    'average': self.total / self.count if self.count else 0.0}
+
+
+class NotificationDispatcher:
+    """
+    Represents a background dispatcher of notifications.
+    Messages queued for the same chat within the coalescing window are sent as a single
+    Telegram message. Failed calls are retried with exponential backoff and the Telegram
+    rate limits (one message per second per chat, retry_after on HTTP 429) are respected.
+    Args:
+        bot_token (str): The Telegram bot token.
+        max_queue (int): Maximum number of queued notifications; new ones are dropped beyond it.
+        max_retries (int): Maximum number of retries of a Telegram call.
+        backoff (float): Seconds of the first retry delay, doubled on each retry.
+        coalesce_window (float): Seconds to wait for more messages to the same chat.
+        timeout (int): Timeout in seconds of each Telegram call.
+    Methods:
+        start(): Starts the dispatcher thread.
+        enqueue_telegram(chat_id, text): Queues a Telegram message.
+        enqueue_desktop(title, message): Queues a desktop notification.
+        get_metrics(): Returns the queue and latency metrics.
+        collect_metrics(): Returns the metrics as samples of a MetricsRegistry collector.
+        stop(timeout): Delivers the queued notifications and stops the thread.
+    """
+    def __init__(self, bot_token, max_queue=100, max_retries=3, backoff=1.0,
+                 coalesce_window=1.0, timeout=10):
+        """
+        Initializes the NotificationDispatcher.
+        """
+        self.bot_token = bot_token
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.coalesce_window = coalesce_window
+        self.timeout = timeout
+        self.enqueue_latency = LatencyStats()
+        self.delivery_latency = LatencyStats()
+        self.dropped = 0
+        self.failed = 0
+        self.__queue = queue.Queue(maxsize=max_queue)
+        self.__thread = None
+        self.__last_sent = {}
+        self.__session = requests.Session()
+        self.__session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+    def start(self):
+        """
+        Starts the dispatcher thread.
+        """
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name='siga-notifier',
+                                             daemon=True)
+            self.__thread.start()
+
+    def enqueue_telegram(self, chat_id, text):
+        """
+        Queues a Telegram message.
+        Args:
+        - chat_id (str): The chat to send the message to.
+        - text (str): The Markdown text of the message.
+        Returns:
+        - bool: False if the queue is full and the message was dropped.
+        """
+        return self.__enqueue(('telegram', chat_id, text))
+
+    def enqueue_desktop(self, title, message):
+        """
+        Queues a desktop notification.
+        Args:
+        - title (str): The title of the notification.
+        - message (str): The body of the notification.
+        Returns:
+        - bool: False if the queue is full and the notification was dropped.
+        """
+        return self.__enqueue(('desktop', title, message))
+
+    def get_metrics(self):
+        """
+        Returns the queue and latency metrics.
+        Returns:
+        - dict: Queue size, dropped and failed counts and the enqueue and delivery latencies.
+        """
+        return {'queued': self.__queue.qsize(), 'dropped': self.dropped, 'failed': self.failed,
+                'enqueue_latency': self.enqueue_latency.as_dict(),
+                'delivery_latency': self.delivery_latency.as_dict()}
+
+    def collect_metrics(self):
+        """
+        Returns the metrics as samples of a MetricsRegistry collector.
+        Returns:
+        - list: Tuples of (name, type, help, labels, value).
+        """
+        delivery = self.delivery_latency.as_dict()
+        return [
+            ('siga_notifications_queued', 'gauge', 'Notifications waiting to be delivered.',
+             {}, self.__queue.qsize()),
+            ('siga_notifications_dropped_total', 'counter',
+             'Notifications dropped because the queue was full.', {}, self.dropped),
+            ('siga_notifications_failed_total', 'counter',
+             'Notifications that could not be delivered.', {}, self.failed),
+            ('siga_notifications_delivered_total', 'counter',
+             'Notifications delivered.', {}, delivery['count']),
+            ('siga_notification_delivery_seconds_total', 'counter',
+             'Seconds between queueing and delivering the notifications.', {}, delivery['total']),
+        ]
+
+    def stop(self, timeout=30):
+        """
+        Delivers the queued notifications and stops the thread.
+        Args:
+        - timeout (float): Maximum seconds to wait for the queue to be delivered.
+        """
+        if self.__thread is None:
+            return
+        try:
+            self.__queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning('Notification queue still full, stopping without draining it')
+            return
+        self.__thread.join(timeout)
+        self.__thread = None
+        self.__session.close()
+
+    def __enqueue(self, item):
+        """Queues an item with its enqueue time, measuring how long the search was held."""
+        started = time.monotonic()
+        try:
+            self.__queue.put_nowait((started,) + item)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning('Notification queue is full, dropping a %s notification', item[0])
+            return False
+        self.enqueue_latency.add(time.monotonic() - started)
+        return True
+
+    def __run(self):
+        """Delivers the queued notifications until stopped."""
+        stopping = False
+        while not stopping:
+            batch = [self.__queue.get()]
+            deadline = time.monotonic() + self.coalesce_window
+            while batch[-1] is not _STOP:
+                try:
+                    batch.append(self.__queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                stopping = True
+                batch.pop()
+            self.__deliver(batch)
+
+    def __deliver(self, batch):
+        """Sends a batch, coalescing the Telegram messages per chat."""
+        chats = collections.OrderedDict()
+        for item in batch:
+            if item[1] == 'telegram':
+                chats.setdefault(item[2], []).append(item)
+            else:
+                self.__send_desktop(item)
+
+        for chat_id, items in chats.items():
+            texts = [item[3] for item in items]
+            sent = [self.__send_telegram(chat_id, text)
+                    for text in self.__split('\n\n'.join(texts))]
+            if not all(sent):
+                continue
+            delivered = time.monotonic()
+            for item in items:
+                self.delivery_latency.add(delivered - item[0])
+
+    def __send_desktop(self, item):
+        """Shows a desktop notification."""
+        # Imported here so a missing notification backend never breaks the searches
+        from notifypy import Notify # pylint: disable=import-outside-toplevel
+        enqueued, _, title, message = item
+        try:
+            notification = Notify()
+            notification.title = title
+            notification.message = message
+            notification.urgency = "critical"
+            notification.send()
+            self.delivery_latency.add(time.monotonic() - enqueued)
+        except Exception as ex: # pylint: disable=broad-except
+            self.failed += 1
+            logger.error('Could not show desktop notification: %s', ex)
+
+    def __send_telegram(self, chat_id, text):
+        """
+        Sends a Telegram message, retrying with backoff and respecting the rate limits.
+        A message Telegram refuses (a 4xx other than 429, or an answer that is not ok, e.g. a
+        Markdown parse error) fails at once: sending it again would be refused again.
+        """
+        url = TELEGRAM_URL.format(self.bot_token)
+        params = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            wait = self.__last_sent.get(chat_id, 0) + 1.0 - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                response = self.__session.post(url, data=params, timeout=self.timeout)
+                self.__last_sent[chat_id] = time.monotonic()
+                if response.status_code == 429:
+                    retry_after = response.json().get('parameters', {}).get('retry_after', delay)
+                    logger.warning('Telegram rate limit reached, retrying in %ss', retry_after)
+                    time.sleep(retry_after)
+                    continue
+                if response.status_code >= 500:
+                    raise requests.HTTPError(f'Telegram answered {response.status_code}')
+                if response.ok:
+                    answer = response.json()
+                    if answer.get('ok'):
+                        logger.info('Message sent to Telegram')
+                        return True
+                else:
+                    answer = self.__read_answer(response)
+                self.failed += 1
+                logger.error('Telegram refused the message (%s): %s', response.status_code,
+                             answer.get('description', 'no description'))
+                return False
+            except (requests.RequestException, ValueError) as ex:
+                if attempt == self.max_retries:
+                    break
+                logger.warning('Telegram call failed (%s), retrying in %ss', ex, delay)
+                time.sleep(delay)
+                delay *= 2
+        self.failed += 1
+        logger.error('Could not send the message to Telegram after %s attempts',
+                     self.max_retries + 1)
+        return False
+
+    @staticmethod
+    def __read_answer(response):
+        """Reads the JSON answer of a refused Telegram call, empty when it is not JSON."""
+        try:
+            answer = response.json()
+        except ValueError:
+            return {}
+        return answer if isinstance(answer, dict) else {}
+
+    @staticmethod
+    def __split(text):
+        """Splits a text in chunks that fit a Telegram message, on line boundaries."""
+        chunks = []
+        current = ''
+        for line in text.splitlines(keepends=True):
+            if current and len(current) + len(line) > TELEGRAM_MAX_LENGTH:
+                chunks.append(current)
+                current = ''
+            current += line[:TELEGRAM_MAX_LENGTH]
+        if current:
+            chunks.append(current)
+        return chunks
@@ -0,0 +1,157 @@
+"""
+ScreenshotRecorder: A class to capture the browser screen at each step of a search following
+a capture policy, keeping the last captures in memory and writing them to disk only when needed.
+Imports:
+- os: Used to write and prune the screenshot files.
+- glob: Used to find the screenshot files kept in the log directory.
+- base64: Used to decode the compressed captures returned by the DevTools protocol.
+- logging: Logging facility for Python.
+- threading: Used to guard the buffers shared by the worker threads.
+- collections: Provides the deque used as ring buffer.
+- datetime: Used to name the screenshot files.
+
+Example usage:
+recorder = ScreenshotRecorder(policy='on-error', capacity=5)
+recorder.capture(driver, 'step1')
+recorder.capture_error(driver, 'set_district')
+recorder.discard(driver)
+"""
+import os
+import glob
+import base64
+import logging
+import threading
+import collections
+from datetime import datetime
+
+from selenium.common.exceptions import WebDriverException
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+POLICIES = ('off', 'on-error', 'always')
+FILE_PREFIX = 'log_'
+
+
+class ScreenshotRecorder:
+    """
+    Represents the screenshot policy of the searches.
+    Policies:
+        off: No screenshot is taken, not even on errors.
+        on-error: The last captures of each browser are kept in memory and written to disk,
+                  together with a capture of the failure, only when a step raises.
+        always: Every capture is written to disk immediately.
+    Args:
+        policy (str): One of 'off', 'on-error' or 'always'.
+        capacity (int): Number of captures kept in memory per browser.
+        directory (str): Where the screenshot files are written.
+        compress (bool): Capture JPEG images through DevTools instead of full PNGs.
+        retention (int): Maximum number of screenshot files kept in the directory.
+    Methods:
+        capture(driver, name): Captures a step.
+        capture_error(driver, name): Captures a failure and writes the buffered captures.
+        discard(driver): Forgets the buffered captures of a browser.
+    """
+    def __init__(self, policy='on-error', capacity=5, directory='.', compress=False,
+                 retention=50):
+        """
+        Initializes the ScreenshotRecorder.
+        """
+        if policy not in POLICIES:
+            logger.warning('Unknown screenshot policy "%s", using "on-error"', policy)
+            policy = 'on-error'
+        self.policy = policy
+        self.capacity = max(1, capacity)
+        self.directory = directory
+        self.compress = compress
+        self.retention = retention
+        self.__buffers = {}
+        self.__lock = threading.Lock()
+
+    def capture(self, driver, name):
+        """
+        Captures a step of the search according to the policy.
+        Args:
+        - driver: The WebDriver to capture.
+        - name (str): The name of the step, used in the file name.
+        """
+        if self.policy == 'off':
+            return
+        image = self.__grab(driver)
+        if image is None:
+            return
+        capture = (datetime.now(), name, image)
+        if self.policy == 'always':
+            self.__write([capture])
+            return
+        with self.__lock:
+            buffer = self.__buffers.setdefault(id(driver),
+                                               collections.deque(maxlen=self.capacity))
+            buffer.append(capture)
+
+    def capture_error(self, driver, name):
+        """
+        Captures a failure and writes it to disk together with the buffered captures.
+        Args:
+        - driver: The WebDriver to capture.
+        - name (str): The name of the failing step, used in the file name.
+        """
+        if self.policy == 'off':
+            return
+        image = self.__grab(driver)
+        with self.__lock:
+            captures = list(self.__buffers.pop(id(driver), []))
+        if image is not None:
+            captures.append((datetime.now(), f'{name}_error', image))
+        self.__write(captures)
+
+    def discard(self, driver):
+        """
+        Forgets the buffered captures of a browser, usually after a successful search.
+        Args:
+        - driver: The WebDriver whose captures are dropped.
+        """
+        with self.__lock:
+            self.__buffers.pop(id(driver), None)
+
+    def __grab(self, driver):
+        """Takes a capture of the browser, as JPEG when compressing and PNG otherwise."""
+        try:
+            if self.compress:
+                try:
+                    result = driver.execute_cdp_cmd('Page.captureScreenshot',
+                                                    {'format': 'jpeg', 'quality': 50})
+                    return ('jpg', base64.b64decode(result['data']))
+                except (AttributeError, KeyError, WebDriverException):
+                    logger.debug('DevTools capture not available, falling back to PNG')
+            return ('png', driver.get_screenshot_as_png())
+        except WebDriverException as wd:
+            logger.warning('Could not take a screenshot: %s', wd)
+            return None
+
+    def __write(self, captures):
+        """Writes the captures to disk and prunes the oldest files beyond the retention."""
+        if not captures:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for taken_at, name, (extension, data) in captures:
+            file_name = os.path.join(self.directory, f'{FILE_PREFIX}{name}_'
+                                     f'{taken_at.strftime("%d%m%Y_%H%M%S_%f")}.{extension}')
+            with open(file_name, 'wb') as file:
+                file.write(data)
+            logger.info('Screenshot written: %s', file_name)
+        self.__prune()
+
+    def __prune(self):
+        """Deletes the oldest screenshot files beyond the retention."""
+        if not self.retention:
+            return
+        files = [f for pattern in ('*.png', '*.jpg')
+                 for f in glob.glob(os.path.join(self.directory, FILE_PREFIX + pattern))]
+        files.sort(key=os.path.getmtime)
+        for file_name in files[:max(0, len(files) - self.retention)]:
+            try:
+                os.remove(file_name)
+            except OSError as ex:
+                logger.debug('Could not remove %s: %s', file_name, ex)
@@ -0,0 +1,1113 @@
+"""
+The Selenium scan engine: drives a headless browser through the SIGA booking flow.
+It is imported only by the code paths that need a browser, so loading siga.py,
+validating the configuration or running the HTTP engine never pays for Selenium.
+Imports:
+- time: Used to measure the duration of each step with a monotonic clock.
+- json, base64: Used to read the responses captured in the performance log.
+- contextlib: Used for the step timing context manager.
+- weakref: Used to keep the sticky session of each browser while it is alive.
+- logging: Logging facility for Python.
+- selenium: Drives the browser.
+"""
+import time
+import json
+import base64
+import weakref
+import contextlib
+from datetime import datetime
+
+import logging as log
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.select import Select
+from selenium.webdriver.support.wait import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (NoSuchElementException,
+                                        TimeoutException,
+                                        WebDriverException,
+                                        NoSuchDriverException,
+                                        StaleElementReferenceException,
+                                        ElementClickInterceptedException)
+
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium.webdriver.edge.service import Service as EdgeService
+
+# Local libraries and Classes
+from notif_data import NotificationData
+from slot_parser import filter_time_slots, get_max_date
+from screenshots import ScreenshotRecorder
+from driver_manifest import DriverManifest
+from log_utils import log_exception, print_log_schedule
+from metrics import record_scan
+
+SIGA_URL = 'https://siga.marcacaodeatendimento.pt/Marcacao/Entidades'
+
+OPT_SELECT_MSG = 'Opção "%s" selecionada com sucesso!'
+NO_ELEMENT_MSG = "No element found for: %s\\n%s was raised: %s"
+NO_BUTTON_MSG = "No button %s available at the moment"
+
+# Reads the location title and label of every slot plus the error message in one call
+SCHEDULE_LIST_SCRIPT = """
+var result = {slots: [], error: null};
+document.querySelectorAll('div[class="schedule-list"] div[class^="col-md-5 m-"]')
+    .forEach(function (slot) {
+        var span = slot.querySelector('span');
+        result.slots.push([slot.getAttribute('title') || '', span ? span.innerText : '']);
+    });
+var h5 = document.querySelector('div[class="error-message"] div[class="col-md-12 no_padding"] h5');
+if (h5 && h5.offsetParent !== null) {
+    result.error = h5.innerText;
+}
+return result;
+"""
+
+# Reads the options of an enabled dropdown, leaving out the placeholder and the "all" option
+READ_OPTIONS_SCRIPT = """
+var select = document.getElementById(arguments[0]);
+if (!select || select.disabled) {
+    return null;
+}
+var options = {};
+var found = false;
+for (var i = 0; i < select.options.length; i++) {
+    var value = select.options[i].value;
+    if (value && value !== '-1') {
+        options[value] = select.options[i].text.trim();
+        found = true;
+    }
+}
+return found ? options : null;
+"""
+
+# Empties a dependent dropdown, so its next options can be told from the previous ones
+CLEAR_OPTIONS_SCRIPT = """
+var select = document.getElementById(arguments[0]);
+while (select && select.options.length > 1) {
+    select.remove(1);
+}
+"""
+
+# Reads the action and the encoded fields of the form of an element, as they would be submitted
+READ_FORM_SCRIPT = """
+var element = document.getElementById(arguments[0]);
+if (!element || !element.form) {
+    return null;
+}
+return [element.form.action, new URLSearchParams(new FormData(element.form)).toString()];
+"""
+
+# Submits encoded form fields from the page, answering the response HTML or null on failure
+SUBMIT_FORM_SCRIPT = """
+var done = arguments[arguments.length - 1];
+var controller = new AbortController();
+setTimeout(function () { controller.abort(); }, arguments[2] * 1000);
+fetch(arguments[0], {method: 'POST', body: arguments[1], credentials: 'same-origin',
+                     headers: {'Content-Type': 'application/x-www-form-urlencoded'},
+                     signal: controller.signal})
+    .then(function (response) { return response.ok ? response.text() : null; })
+    .then(done, function () { done(null); });
+"""
+
+# Submits encoded form fields as a page navigation, like the form itself would
+OPEN_FORM_SCRIPT = """
+var form = document.createElement('form');
+form.method = 'post';
+form.action = arguments[0];
+new URLSearchParams(arguments[1]).forEach(function (value, name) {
+    var input = document.createElement('input');
+    input.type = 'hidden';
+    input.name = name;
+    input.value = value;
+    form.appendChild(input);
+});
+document.body.appendChild(form);
+form.submit();
+"""
+
+# Clicks the slot of a location on the results page, answering whether it was found
+CLICK_SLOT_SCRIPT = """
+var slots = document.querySelectorAll('div[class="schedule-list"] div[class^="col-md-5 m-"]');
+for (var i = 0; i < slots.length; i++) {
+    var span = slots[i].querySelector('span');
+    if ((slots[i].getAttribute('title') || '') === arguments[0] && span &&
+            span.innerText.indexOf(arguments[1]) >= 0) {
+        (slots[i].querySelector('a') || span).click();
+        return true;
+    }
+}
+return false;
+"""
+
+# Fills the fields of the page by name or id, answering the names of the filled ones
+FILL_FORM_SCRIPT = """
+var values = arguments[0];
+var filled = [];
+Object.keys(values).forEach(function (name) {
+    var field = document.getElementsByName(name)[0] || document.getElementById(name);
+    if (field) {
+        field.value = values[name];
+        field.dispatchEvent(new Event('input', {bubbles: true}));
+        field.dispatchEvent(new Event('change', {bubbles: true}));
+        filled.push(name);
+    }
+});
+return filled;
+"""
+
+# Leaves the page of a tab of the tab browser, marking it so the next page is told apart
+LEAVE_PAGE_SCRIPT = """
+window.sigaLeaving = true;
+window.location.assign(arguments[0]);
+"""
+
+# Whether a tab of the tab browser left its previous page for the loaded Entidades page
+ENTIDADES_READY_SCRIPT = """
+return !window.sigaLeaving &&
+    document.getElementsByClassName('btn-selecionar-entidade').length > 0;
+"""
+
+# URL patterns blocked by the lean browser profile, by kind of resource. The search only needs
+# the DOM of the buttons, dropdowns and schedule list.
+BLOCKED_RESOURCES = {
+    'images': ['*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.svg*', '*.webp*', '*.ico*', '*.bmp*'],
+    'fonts': ['*.woff*', '*.woff2*', '*.ttf*', '*.otf*', '*.eot*'],
+    'stylesheets': ['*.css*'],
+    'media': ['*.mp4*', '*.webm*', '*.mp3*', '*.ogg*'],
+    'analytics': ['*google-analytics.com*', '*googletagmanager.com*', '*/gtag/js*',
+                  '*doubleclick.net*', '*hotjar.com*', '*clarity.ms*', '*facebook.net*'],
+}
+
+# Default (timeout, poll interval) in seconds of each step; overridable per config by wait_opt
+STEP_WAIT_DEFAULTS = {
+    'entity': (20, 0.25),
+    'category': (40, 0.25),
+    'subcategory': (40, 0.25),
+    'motive': (40, 0.25),
+    'step_two': (30, 0.25),
+    'district': (40, 0.25),
+    'local': (40, 0.25),
+    'service_desk': (20, 0.25),
+    'step_three': (30, 0.25),
+    'claim': (20, 0.1),
+}
+
+
+SCREENSHOTS = ScreenshotRecorder()
+DRIVER_MANIFEST = DriverManifest()
+BROWSER_PROFILE = 'full'
+BROWSER_ALLOW = ()
+SLOT_SOURCE = 'dom'
+STICKY_SESSIONS = False
+STICKY_MAX_AGE = 30 * 60
+# Browser to the search left on its results page: digest, action, fields, labels, created at
+STICKY_STATE = weakref.WeakKeyDictionary()
+BROWSER_TABS = 0
+NEXT_BUTTON_XPATH = "//li[@id='liProximoButton']//a[@class='set-date-button']"
+
+
+def configure(env_vars):
+    """
+    Function to configure the SIGA URL, the screenshots, the browser profile, the sticky
+    sessions, the tab browser and the webdriver resolution from the env variables.
+    """
+    global SIGA_URL, SCREENSHOTS, DRIVER_MANIFEST # pylint: disable=global-statement
+    global BROWSER_PROFILE, BROWSER_ALLOW, SLOT_SOURCE # pylint: disable=global-statement
+    global STICKY_SESSIONS, STICKY_MAX_AGE, BROWSER_TABS # pylint: disable=global-statement
+    SIGA_URL = env_vars.siga_url
+    BROWSER_PROFILE = env_vars.browser_profile
+    BROWSER_ALLOW = env_vars.browser_allow
+    SLOT_SOURCE = env_vars.slot_source
+    STICKY_SESSIONS = env_vars.sticky_sessions
+    STICKY_MAX_AGE = env_vars.sticky_session_max_age * 60
+    BROWSER_TABS = env_vars.browser_tabs
+    SCREENSHOTS = ScreenshotRecorder(policy=env_vars.screenshot_policy,
+                                     capacity=env_vars.screenshot_buffer,
+                                     directory=env_vars.screenshot_dir,
+                                     compress=env_vars.screenshot_compress,
+                                     retention=env_vars.screenshot_retention)
+    DRIVER_MANIFEST = DriverManifest(env_vars.driver_manifest_path,
+                                     pinned_path=env_vars.driver_path,
+                                     pinned_browser=env_vars.browser)
+
+
+def new_webdriver(browser, driver_path, options_args):
+    """Function to start the given browser with an already resolved driver binary."""
+    if browser == 'edge':
+        options = webdriver.EdgeOptions()
+        for o in options_args:
+            options.add_argument(o)
+        if BROWSER_PROFILE == 'lean':
+            options.page_load_strategy = 'eager'
+        if SLOT_SOURCE == 'network':
+            options.set_capability('ms:loggingPrefs', {'performance': 'ALL'})
+        return webdriver.Edge(service=EdgeService(driver_path), options=options)
+
+    options = webdriver.ChromeOptions()
+    for o in options_args:
+        options.add_argument(o)
+    if BROWSER_PROFILE == 'lean':
+        # Return from get() once the DOM is ready, without waiting for the subresources
+        options.page_load_strategy = 'eager'
+    if SLOT_SOURCE == 'network':
+        # Keep the network events, so the results page can be read from its response
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    return webdriver.Chrome(service=ChromeService(driver_path), options=options)
+
+
+def start_chrome():
+    """Function to start chrome browser."""
+    test_ua = 'Mozilla/5.0 (Windows NT 4.0; WOW64) AppleWebKit/537.36 '
+    test_ua += '(KHTML, like Gecko) Chrome/37.0.2049.0 Safari/537.36'
+
+    # Command line arguments for Chrome
+    options_args = [
+        # '--start-maximized'
+        '--headless',
+        '--window-size=1920,1080',
+        '--disable-gpu',
+        '--disable-web-security',
+        f'--user-agent={test_ua}',
+        '--no-sandbox',
+        '--disable-extensions',
+        '--ignore-certificate-errors',
+        '--allow-running-insecure-content'
+    ]
+    if BROWSER_TABS:
+        # The searches in the background tabs keep their timers and renderer at full speed
+        options_args += ['--disable-background-timer-throttling',
+                         '--disable-backgrounding-occluded-windows',
+                         '--disable-renderer-backgrounding']
+
+    # Initiate Browser with the driver resolved once and kept in the manifest
+    log.info('Starting webdriver')
+    browser, driver_path = DRIVER_MANIFEST.resolve()
+    try:
+        l_driver = new_webdriver(browser, driver_path, options_args)
+    except Exception as first_error:
+        if DRIVER_MANIFEST.pinned:
+            log.info('Could not initiate the pinned WebDriver. Please check!')
+            log_exception(first_error)
+            raise
+        log.info('Could not start %s, resolving the webdriver again', browser)
+        DRIVER_MANIFEST.invalidate()
+        try:
+            browser, driver_path = DRIVER_MANIFEST.resolve(skip=browser)
+            l_driver = new_webdriver(browser, driver_path, options_args)
+        except (ConnectionError,NoSuchDriverException):
+            log.info('Could not initiate WebDriver. Please check!')
+            raise
+        except Exception as e:
+            log_exception(e)
+            raise
+
+    if BROWSER_PROFILE == 'lean':
+        block_resources(l_driver, BROWSER_ALLOW)
+
+    # Navigate to the URL
+    l_driver.get(SIGA_URL)
+
+    return l_driver
+
+
+def get_blocked_urls(allow=()):
+    """Function to get the URL patterns blocked by the lean profile, except the allowed kinds."""
+    return [pattern for kind, patterns in BLOCKED_RESOURCES.items() if kind not in allow
+            for pattern in patterns]
+
+
+def block_resources(p_driver, allow=()):
+    """
+    Function to block the images, fonts, stylesheets, media and analytics of every page through
+    the DevTools protocol, for the whole life of the browser.
+    """
+    blocked = get_blocked_urls(allow)
+    try:
+        p_driver.execute_cdp_cmd('Network.enable', {})
+        p_driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked})
+        log.info('Blocking %s URL pattern(s) in the browser', len(blocked))
+    except (AttributeError, WebDriverException) as ex:
+        log.warning('Could not block resources in the browser: %s', ex)
+
+
+def reset_chrome(p_driver):
+    """Function to bring a used chrome browser back to the start page."""
+    p_driver.delete_all_cookies()
+    p_driver.get(SIGA_URL)
+
+
+def close_chrome(p_driver):
+    """Function to close chrome browser."""
+    log.info('Quitting webdriver')
+    p_driver.quit()
+
+
+def find_and_click_entity_button(driver, p_entity, wait=None):
+    """Find and click the entity button."""
+    btn_label = ''
+    timeout, _ = wait or STEP_WAIT_DEFAULTS['entity']
+    if check_elem_exists(driver, By.CLASS_NAME, "btn-selecionar-entidade", True, timeout):
+        btn_entity_lst = driver.find_elements(By.XPATH,
+                                              '//button[@class="btn btn-selecionar-entidade"]')
+        if btn_entity_lst:
+            for btn in btn_entity_lst:
+                if btn.get_attribute("id") == str(p_entity):
+                    try:
+                        btn_label = btn.get_attribute("title")
+                        btn.click()
+                        log.info('Botão "%s" clicado com sucesso!', btn_label)
+                        return btn_label
+                    except WebDriverException as webd_except:
+                        log.critical(webd_except)
+                        raise webd_except
+    return btn_label
+
+
+def set_entity(driver, p_entity, wait=None):
+    """Function to set entity field."""
+    btn_label = find_and_click_entity_button(driver, p_entity, wait)
+
+    if not btn_label:
+        err_msg = f"Cannot find Entity '{p_entity}' button."
+        log.critical(err_msg)
+        SCREENSHOTS.capture_error(driver, set_entity.__name__)
+        raise NoSuchElementException(err_msg + '. Please check if the webpage is working')
+
+    return btn_label
+
+
+def get_step_wait(config_instance, step):
+    """Function to get the (timeout, poll interval) of a step, honouring the config overrides."""
+    timeout, poll = STEP_WAIT_DEFAULTS[step]
+    wait_opt = config_instance.wait_opt if config_instance else {}
+    step_opt = wait_opt.get(step) or wait_opt.get('default') or {}
+    return step_opt.get('timeout', timeout), step_opt.get('poll', poll)
+
+
+@contextlib.contextmanager
+def timed_step(msg_header, step):
+    """Context manager to log and keep how long a step of the search took."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        log.info('Step "%s" took %.3fs', step, elapsed)
+        if msg_header is not None:
+            msg_header.set_step_timing(step, elapsed)
+
+
+def option_to_be_selectable(select_id, value):
+    """
+    An expectation that a dependent dropdown is enabled and populated with the option
+    of the given value. Returns the select element once it is.
+    """
+    def _predicate(driver):
+        try:
+            select_elem = driver.find_element(By.ID, select_id)
+            if not (select_elem.is_displayed() and select_elem.is_enabled()):
+                return False
+            select_elem.find_element(By.CSS_SELECTOR, f'option[value="{value}"]')
+            return select_elem
+        except (NoSuchElementException, StaleElementReferenceException):
+            return False
+
+    return _predicate
+
+
+def select_when_populated(driver, select_id, value, step, wait=None):
+    """Function to wait until a dependent dropdown offers the value, then select it."""
+    timeout, poll = wait or STEP_WAIT_DEFAULTS[step]
+    try:
+        select_elem = WebDriverWait(driver, timeout, poll_frequency=poll).until(
+            option_to_be_selectable(select_id, value))
+        select = Select(select_elem)
+        select.select_by_value(str(value))
+        txt = select.first_selected_option.text
+        log.info(OPT_SELECT_MSG , txt)
+        return txt
+    except (NoSuchElementException, TimeoutException) as no_element:
+        err_msg = NO_ELEMENT_MSG % (value, type(no_element).__name__, no_element)
+        log.critical(msg=err_msg)
+        SCREENSHOTS.capture_error(driver, f'set_{step}')
+        raise no_element
+
+
+def set_district(driver, p_distrito, wait=None):
+    """Function to set district field."""
+    return select_when_populated(driver, 'IdDistrito', p_distrito, 'district', wait)
+
+
+def set_local(driver, p_localidade, wait=None):
+    """Function to set local field."""
+    return select_when_populated(driver, 'IdLocalidade', p_localidade, 'local', wait)
+
+
+def set_service_desk(driver, p_local_atendimento, wait=None):
+    """Function to set service field."""
+    return select_when_populated(driver, 'IdLocalAtendimento', p_local_atendimento,
+                                 'service_desk', wait)
+
+
+def read_options(driver, select_id, step, wait=None) -> dict:
+    """Function to wait until a dependent dropdown is populated and read its options."""
+    timeout, poll = wait or STEP_WAIT_DEFAULTS[step]
+    try:
+        options = WebDriverWait(driver, timeout, poll_frequency=poll).until(
+            lambda d: d.execute_script(READ_OPTIONS_SCRIPT, select_id))
+    except TimeoutException:
+        log.info('No options found for %s', select_id)
+        return {}
+    return {int(v) if v.lstrip('-').isdigit() else v: text for v, text in options.items()}
+
+
+def click_next_button(driver, step, wait=None):
+    """Function to click the "Next" button as soon as it is clickable."""
+    timeout, poll = wait or STEP_WAIT_DEFAULTS[step]
+    next_button = None
+    try:
+        next_button = WebDriverWait(driver, timeout, poll_frequency=poll).until(
+            EC.element_to_be_clickable((By.XPATH, NEXT_BUTTON_XPATH)))
+        driver.execute_script("arguments[0].click();", next_button) # next_button.click()
+        log.info('Botão "Next" clicado com sucesso!')
+    except (ElementClickInterceptedException, TimeoutException) as no_button:
+        err_msg = NO_BUTTON_MSG % (next_button or step)
+        log.critical(msg=err_msg)
+        SCREENSHOTS.capture_error(driver, f'set_{step}')
+        raise no_button
+
+
+def set_step_two(driver, wait=None):
+    """Function to click button."""
+    click_next_button(driver, 'step_two', wait)
+
+
+def set_category(driver, p_category, wait=None):
+    """Function to set category field."""
+    return select_when_populated(driver, 'IdCategoria', p_category, 'category', wait)
+
+
+def set_subcategory(driver, p_subcategory, wait=None):
+    """Function to set subcategory field."""
+    return select_when_populated(driver, 'IdSubcategoria', p_subcategory, 'subcategory', wait)
+
+
+def set_motive(driver, p_motive, wait=None):
+    """Function to set motive field."""
+    return select_when_populated(driver, 'IdMotivo', p_motive, 'motive', wait)
+
+
+def set_step_three(driver, wait=None):
+    """Function to click button."""
+    click_next_button(driver, 'step_three', wait)
+    timeout, poll = wait or STEP_WAIT_DEFAULTS['step_three']
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=poll).until(EC.any_of(
+            EC.visibility_of_element_located((By.CLASS_NAME, 'schedule-list')),
+            EC.visibility_of_element_located((By.CLASS_NAME, 'error-message'))))
+    except TimeoutException:
+        log.critical('Results page did not load a schedule list nor an error message')
+
+#return boolean value instead of throwing exception
+def check_elem_exists(parent, by, selector, wait=False, timeout=False):
+    """Function to check if the element exists on the loaded page."""
+    ret = None
+    if not wait:
+        try:
+            parent.find_element(by, selector)
+        except NoSuchElementException:
+            ret = False
+        else:
+            ret = True
+    else:
+        #when allowing wait time - print note for what is happening
+        log.info('%s - check_elem_exists(%is..)' , selector,timeout)
+        try:
+            WebDriverWait(parent, timeout).until(EC.presence_of_element_located((by, selector)))
+        except NoSuchElementException:
+            ret = False
+        except TimeoutException:
+            ret = False
+        else:
+            ret = True
+
+    return ret
+
+def drain_performance_log(driver) -> list:
+    """Function to read and clear the network events kept by the browser since the last read."""
+    try:
+        return driver.get_log('performance')
+    except (WebDriverException, ValueError) as ex:
+        log.debug('Performance log not available: %s', ex)
+        return []
+
+
+def parse_schedule(body):
+    """
+    Function to read the schedule list and the error message from the HTML of a results page.
+    Returns None when the page has neither, e.g. a frame or a page of another step.
+    """
+    # pylint: disable=import-outside-toplevel
+    from http_engine import SigaPageParser
+    page = SigaPageParser()
+    page.feed(body or '')
+    page.close()
+    if page.slots or page.error_message.strip():
+        return {'slots': page.slots, 'error': page.error_message or None}
+    return None
+
+
+def read_schedule_response(driver):
+    """
+    Function to read the schedule list and the error message from the response body of the
+    results page, as captured in the performance log.
+    Returns None when the response is not available, so the DOM is read instead.
+    """
+    for entry in reversed(drain_performance_log(driver)):
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, TypeError, ValueError):
+            continue
+        if message.get('method') != 'Network.responseReceived' or \
+                message.get('params', {}).get('type') != 'Document':
+            continue
+        try:
+            response = driver.execute_cdp_cmd('Network.getResponseBody',
+                                              {'requestId': message['params']['requestId']})
+        except WebDriverException as ex:
+            log.debug('Response body not available: %s', ex)
+            continue
+        body = response.get('body', '')
+        if response.get('base64Encoded'):
+            body = base64.b64decode(body).decode('utf-8', errors='replace')
+        # Frames of the page are documents too: keep the one with the schedule
+        schedule = parse_schedule(body)
+        if schedule is not None:
+            return schedule
+    return None
+
+
+def read_schedule(driver, schedule=None):
+    """
+    Function to read the schedule list and the error message of the results page, from its
+    response in network mode, unless they were already read.
+    """
+    if schedule is None and SLOT_SOURCE == 'network':
+        schedule = read_schedule_response(driver)
+    if schedule is None:
+        if SLOT_SOURCE == 'network':
+            log.info('Results page response not captured, reading the page instead')
+        # One round trip for the whole schedule list and the error message
+        schedule = driver.execute_script(SCHEDULE_LIST_SCRIPT) or {}
+    return schedule
+
+
+def read_results(driver, msg_header, days_max, schedule=None):
+    """
+    Function to set the time slots of the results page on the notification header, and whether
+    the results page was reached: without a schedule list nor an error message the search
+    stopped before it, and its empty time slots must not be taken as no time slots.
+    """
+    schedule = read_schedule(driver, schedule)
+    msg_header.set_results_read(bool(schedule.get('slots') or
+                                     (schedule.get('error') or '').strip()))
+    msg_header.set_time_slots(get_time_slots(driver, days_max, schedule))
+
+
+def get_time_slots(driver, days_max, schedule=None):
+    """
+    Function to get all the schedule available, grouped by location.
+    The schedule is read from the results page unless it was already read from a response.
+    """
+    log.info('Max date to search for time slots: %s', get_max_date(days_max).strftime("%d-%m-%Y"))
+
+    schedule = read_schedule(driver, schedule)
+    time_slot_list = filter_time_slots(schedule.get('slots') or [], days_max)
+    print_log_schedule(time_slot_list)
+
+    if schedule.get('error'):
+        log.info('SIGA: %s', schedule['error'].strip())
+    elif not schedule.get('slots'):
+        log.critical('No error message')
+
+    return time_slot_list
+
+
+def run_service_steps(driver, config_instance, msg_header) -> None:
+    """Function to run steps 1 and 2 of the search: entity, category, subcategory and motive."""
+    l_screen_shot = 'step{}'
+    l_service_opt = config_instance.service_opt
+
+    # Step 1: Set entity
+    SCREENSHOTS.capture(driver, l_screen_shot.format(1))
+    with timed_step(msg_header, 'entity'):
+        msg_header.set_entity(set_entity(driver,
+                                         config_instance.entity_opt,
+                                         get_step_wait(config_instance, 'entity')))
+
+    # Step 2: Set category, subcategory, and motive
+    with timed_step(msg_header, 'category'):
+        msg_header.set_category(set_category(driver, l_service_opt.get("tema", ''),
+                                             get_step_wait(config_instance, 'category')))
+    with timed_step(msg_header, 'subcategory'):
+        msg_header.set_subcategory(set_subcategory(driver, l_service_opt.get("subtema", ''),
+                                                   get_step_wait(config_instance, 'subcategory')))
+    with timed_step(msg_header, 'motive'):
+        msg_header.set_motive(set_motive(driver, l_service_opt.get("motivo", ''),
+                                         get_step_wait(config_instance, 'motive')))
+    SCREENSHOTS.capture(driver, l_screen_shot.format(2))
+    with timed_step(msg_header, 'step_two'):
+        set_step_two(driver, get_step_wait(config_instance, 'step_two'))
+
+
+def run_location_steps(driver, config_instance, msg_header):
+    """
+    Function to run step 3 of the search: district, local and service desk, then read the slots.
+    Returns the action and the encoded fields of the location form in sticky mode, else None.
+    """
+    l_screen_shot = 'step{}'
+    l_location_opt = config_instance.location_opt
+    l_distrito  = l_location_opt.get('distrito', '')
+    l_localidade = l_location_opt.get('localidade', '')
+    l_local_atendimento = l_location_opt.get('local_atendimento', '')
+
+    # Step 3: Set district, local, and service desk
+    with timed_step(msg_header, 'district'):
+        msg_header.set_district(set_district(driver, l_distrito,
+                                             get_step_wait(config_instance, 'district')))
+    with timed_step(msg_header, 'local'):
+        msg_header.set_local(set_local(driver, l_localidade,
+                                       get_step_wait(config_instance, 'local')))
+    if l_localidade > 0 and l_local_atendimento:
+        with timed_step(msg_header, 'service_desk'):
+            msg_header.set_service_desk(set_service_desk(
+                driver, l_local_atendimento, get_step_wait(config_instance, 'service_desk')))
+    SCREENSHOTS.capture(driver, l_screen_shot.format(3))
+    location_form = driver.execute_script(READ_FORM_SCRIPT, 'IdDistrito') \
+        if STICKY_SESSIONS else None
+    if SLOT_SOURCE == 'network':
+        # Only the responses of the results page are left in the log
+        drain_performance_log(driver)
+    with timed_step(msg_header, 'step_three'):
+        set_step_three(driver, get_step_wait(config_instance, 'step_three'))
+
+    SCREENSHOTS.capture(driver, l_screen_shot.format(4))
+    with timed_step(msg_header, 'time_slots'):
+        read_results(driver, msg_header, config_instance.max_days)
+    return location_form
+
+
+def discover_locations(driver, config_instance) -> dict:
+    """
+    Function to list the locals and service desks offered in the district of a configuration,
+    for the service of the configuration.
+    Returns a dict of local to {'label': str, 'desks': {service desk: label}}.
+    """
+    msg_header = NotificationData()
+    run_service_steps(driver, config_instance, msg_header)
+    msg_header.set_district(set_district(driver, config_instance.location_opt.get('distrito', ''),
+                                         get_step_wait(config_instance, 'district')))
+    locations = {}
+    for localidade, label in read_options(driver, 'IdLocalidade', 'local',
+                                          get_step_wait(config_instance, 'local')).items():
+        driver.execute_script(CLEAR_OPTIONS_SCRIPT, 'IdLocalAtendimento')
+        set_local(driver, localidade, get_step_wait(config_instance, 'local'))
+        desks = read_options(driver, 'IdLocalAtendimento', 'service_desk',
+                             get_step_wait(config_instance, 'service_desk'))
+        locations[localidade] = {'label': label, 'desks': desks}
+    log.info('Found %s local(s) and %s service desk(s) in %s', len(locations),
+             sum(len(l['desks']) for l in locations.values()), msg_header.get_district())
+    return locations
+
+
+def return_to_step_three(driver, wait=None) -> bool:
+    """Function to go back from the results to the location step, keeping the service selection."""
+    timeout, poll = wait or STEP_WAIT_DEFAULTS['step_three']
+    previous_button = driver.find_elements(By.XPATH, "//li[contains(@id, 'Anterior')]//a")
+    if previous_button and previous_button[0].is_displayed():
+        driver.execute_script("arguments[0].click();", previous_button[0])
+    else:
+        driver.back()
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=poll).until(
+            EC.visibility_of_element_located((By.ID, 'IdDistrito')))
+        return True
+    except TimeoutException:
+        log.info('Could not return to the location step, restarting the search')
+        return False
+
+
+def keep_sticky_session(driver, config_instance, location_form, msg_header) -> None:
+    """Function to keep the location form of a whole search, to submit it alone next time."""
+    if not location_form:
+        return
+    labels = (msg_header.get_entity(), msg_header.get_category(), msg_header.get_subcategory(),
+              msg_header.get_motive(), msg_header.get_district(), msg_header.get_local(),
+              msg_header.get_service_desk())
+    STICKY_STATE[driver] = (config_instance.digest, location_form[0], location_form[1], labels,
+                            time.monotonic())
+
+
+def refresh_schedule(driver, config_instance, msg_header) -> bool:
+    """
+    Function to submit the location form again from the results page the browser was left on,
+    without going through the previous steps.
+    Returns False when the browser has no live session for the configuration: the session
+    expired, the form was reset or the browser was left by another search.
+    """
+    sticky = STICKY_STATE.pop(driver, None)
+    if sticky is None or sticky[0] != config_instance.digest:
+        return False
+    digest, action, fields, labels, created_at = sticky
+    if time.monotonic() - created_at >= STICKY_MAX_AGE:
+        log.info('Sticky session of %s is too old, starting a new one', config_instance.title)
+        return False
+
+    timeout, _ = get_step_wait(config_instance, 'step_three')
+    try:
+        with timed_step(msg_header, 'refresh'):
+            schedule = parse_schedule(driver.execute_async_script(SUBMIT_FORM_SCRIPT, action,
+                                                                  fields, timeout))
+    except (TimeoutException, WebDriverException) as ex:
+        log.info('Sticky session of %s failed, running the whole search: %s',
+                 config_instance.title, ex)
+        return False
+    if schedule is None:
+        log.info('Sticky session of %s expired, running the whole search',
+                 config_instance.title)
+        return False
+
+    entity, category, subcategory, motive, district, local, service_desk = labels
+    msg_header.set_entity(entity)
+    msg_header.set_category(category)
+    msg_header.set_subcategory(subcategory)
+    msg_header.set_motive(motive)
+    msg_header.set_district(district)
+    msg_header.set_local(local)
+    msg_header.set_service_desk(service_desk)
+    with timed_step(msg_header, 'time_slots'):
+        read_results(driver, msg_header, config_instance.max_days, schedule)
+    STICKY_STATE[driver] = (digest, action, fields, labels, created_at)
+    return True
+
+
+def claim_slot(driver, config_instance, location, label, profile, confirm=False) -> bool:
+    """
+    Function to claim a slot from the results page the search left the browser on: the slot is
+    clicked, the booking details are filled from the profile, and the booking is confirmed or
+    left on hold. Returns False when the slot or the booking details are not available.
+    """
+    timeout, poll = get_step_wait(config_instance, 'claim')
+    sticky = STICKY_STATE.pop(driver, None)
+    if not driver.execute_script(CLICK_SLOT_SCRIPT, location, label):
+        if sticky is None or sticky[0] != config_instance.digest:
+            log.warning('Slot %s of %s is not on the results page', label, location)
+            return False
+        # The sticky session read the results without showing them: open them first
+        driver.execute_script(OPEN_FORM_SCRIPT, sticky[1], sticky[2])
+        WebDriverWait(driver, timeout, poll_frequency=poll).until(
+            EC.visibility_of_element_located((By.CLASS_NAME, 'schedule-list')))
+        if not driver.execute_script(CLICK_SLOT_SCRIPT, location, label):
+            log.warning('Slot %s of %s is no longer available', label, location)
+            return False
+
+    try:
+        field = WebDriverWait(driver, timeout, poll_frequency=poll).until(EC.any_of(
+            *(EC.visibility_of_element_located((By.NAME, name)) for name in profile)))
+    except TimeoutException:
+        log.warning('Booking details of %s at %s did not open', label, location)
+        SCREENSHOTS.capture_error(driver, claim_slot.__name__)
+        return False
+    filled = driver.execute_script(FILL_FORM_SCRIPT, dict(profile))
+    missing = [name for name in profile if name not in filled]
+    if missing:
+        log.warning('Profile fields not on the booking details: %s', ', '.join(missing))
+    if not confirm:
+        return True
+
+    click_next_button(driver, 'claim', (timeout, poll))
+    WebDriverWait(driver, timeout, poll_frequency=poll).until(EC.staleness_of(field))
+    if check_elem_exists(driver, By.CLASS_NAME, 'error-message'):
+        log.warning('Booking of %s at %s was not confirmed', label, location)
+        SCREENSHOTS.capture_error(driver, claim_slot.__name__)
+        return False
+    return True
+
+
+def copy_service_header(msg_header) -> NotificationData:
+    """Function to start a new notification header from the service steps of another one."""
+    new_header = NotificationData()
+    new_header.set_entity(msg_header.get_entity())
+    new_header.set_category(msg_header.get_category())
+    new_header.set_subcategory(msg_header.get_subcategory())
+    new_header.set_motive(msg_header.get_motive())
+    for step, seconds in msg_header.get_step_timings().items():
+        new_header.set_step_timing(step, seconds)
+    return new_header
+
+
+def scan_result(error) -> str:
+    """Function to get the metrics result of a failed search."""
+    if isinstance(error, TimeoutException):
+        return 'timeout'
+    if isinstance(error, WebDriverException):
+        return 'webdriver_error'
+    return 'error'
+
+
+def check_schedule(driver, config_instance) -> NotificationData:
+    """Function to manage the automation search."""
+    msg_header = NotificationData()
+    result = 'success'
+    started = time.monotonic()
+
+    try:
+        now = datetime.now()
+        log.info('Start of check_schedule: %s', now.strftime("%H:%M:%S"))
+
+        if config_instance.service_opt and \
+                config_instance.location_opt:
+            if STICKY_SESSIONS and refresh_schedule(driver, config_instance, msg_header):
+                log.info('Results of %s submitted again on the sticky session',
+                         config_instance.title)
+            else:
+                if STICKY_SESSIONS and driver.current_url != SIGA_URL:
+                    # Left on the results page of a search with no live session
+                    reset_chrome(driver)
+                run_service_steps(driver, config_instance, msg_header)
+                keep_sticky_session(driver, config_instance,
+                                    run_location_steps(driver, config_instance, msg_header),
+                                    msg_header)
+
+            log.info('End of check_schedule: %s', datetime.now().strftime("%H:%M:%S"))
+        else:
+            log.critical('Empty parameter: p_service_opt')
+
+        SCREENSHOTS.discard(driver)
+        return msg_header
+
+    except WebDriverException as wd:
+        log.error('WebDriverException in check_schedule: %s', wd)
+        log_exception(wd)
+        SCREENSHOTS.capture_error(driver, check_schedule.__name__)
+        result = scan_result(wd)
+        return None
+    except Exception as ex:
+        log.error('Exception in check_schedule: %s', ex)
+        SCREENSHOTS.capture_error(driver, check_schedule.__name__)
+        result = scan_result(ex)
+        return None
+    finally:
+        record_scan(config_instance, 'selenium', result,
+                    msg_header.get_step_timings(), time.monotonic() - started)
+
+
+def check_schedule_group(driver, config_instances) -> list:
+    """
+    Function to manage the automation search of configurations that share the entity and
+    service, running steps 1 and 2 once and branching on step 3 for each location.
+    Returns one NotificationData (or None on failure) per configuration, in the same order.
+    """
+    results = []
+    service_header = None
+    log.info('Start of check_schedule_group: %s', datetime.now().strftime("%H:%M:%S"))
+    for config_instance in config_instances:
+        msg_header = None
+        result = 'success'
+        started = time.monotonic()
+        try:
+            if service_header is None or \
+                    not return_to_step_three(driver, get_step_wait(config_instance, 'step_three')):
+                if results:
+                    reset_chrome(driver)
+                service_header = msg_header = NotificationData()
+                run_service_steps(driver, config_instance, service_header)
+            msg_header = copy_service_header(service_header)
+            run_location_steps(driver, config_instance, msg_header)
+            results.append(msg_header)
+        except WebDriverException as wd:
+            log.error('WebDriverException in check_schedule_group: %s', wd)
+            log_exception(wd)
+            SCREENSHOTS.capture_error(driver, check_schedule_group.__name__)
+            service_header = None
+            result = scan_result(wd)
+            results.append(None)
+        except Exception as ex:
+            log.error('Exception in check_schedule_group: %s', ex)
+            SCREENSHOTS.capture_error(driver, check_schedule_group.__name__)
+            service_header = None
+            result = scan_result(ex)
+            results.append(None)
+        finally:
+            record_scan(config_instance, 'selenium', result,
+                        msg_header.get_step_timings() if msg_header else None,
+                        time.monotonic() - started)
+    SCREENSHOTS.discard(driver)
+    log.info('End of check_schedule_group: %s', datetime.now().strftime("%H:%M:%S"))
+    return results
+
+
+def open_tab(driver):
+    """
+    Function to open a tab of the tab browser, returning its window handle.
+    Each tab gets a browser context of its own, so the searches do not share their cookies and
+    SIGA sessions. When the browser cannot create one, the tab shares the cookies of the others.
+    """
+    known = set(driver.window_handles)
+    try:
+        context = driver.execute_cdp_cmd('Target.createBrowserContext', {})
+        target = driver.execute_cdp_cmd('Target.createTarget', {
+            'url': 'about:blank', 'browserContextId': context['browserContextId']})
+        handles = [handle for handle in driver.window_handles if handle not in known]
+        if handles:
+            return handles[0]
+        driver.execute_cdp_cmd('Target.closeTarget', {'targetId': target['targetId']})
+        log.warning('The tab of a new browser context is not listed, sharing the cookies')
+    except (AttributeError, KeyError, WebDriverException) as ex:
+        log.warning('Could not open a tab with cookies of its own, sharing them: %s', ex)
+    driver.switch_to.new_window('tab')
+    return driver.current_window_handle
+
+
+def wait_in_tab(condition, wait):
+    """
+    Function to wait in a search of the tab browser, used with yield from: the condition is
+    yielded to the multiplexer, which checks it while the other tabs run their steps, and its
+    value is returned. Raises TimeoutException once the wait is over, like WebDriverWait.
+    """
+    def _predicate(driver):
+        try:
+            return condition(driver)
+        except (NoSuchElementException, StaleElementReferenceException):
+            return False
+
+    try:
+        return (yield _predicate, wait)
+    except TimeoutError as timeout:
+        raise TimeoutException(str(timeout)) from timeout
+
+
+def select_in_tab(driver, select_id, value, step, wait):
+    """Generator version of select_when_populated for the tab browser."""
+    try:
+        select_elem = yield from wait_in_tab(option_to_be_selectable(select_id, value), wait)
+        select = Select(select_elem)
+        select.select_by_value(str(value))
+        txt = select.first_selected_option.text
+        log.info(OPT_SELECT_MSG , txt)
+        return txt
+    except (NoSuchElementException, TimeoutException) as no_element:
+        err_msg = NO_ELEMENT_MSG % (value, type(no_element).__name__, no_element)
+        log.critical(msg=err_msg)
+        SCREENSHOTS.capture_error(driver, f'set_{step}')
+        raise no_element
+
+
+def click_next_in_tab(driver, step, wait):
+    """Generator version of click_next_button for the tab browser."""
+    try:
+        next_button = yield from wait_in_tab(
+            EC.element_to_be_clickable((By.XPATH, NEXT_BUTTON_XPATH)), wait)
+        driver.execute_script("arguments[0].click();", next_button)
+        log.info('Botão "Next" clicado com sucesso!')
+    except TimeoutException as no_button:
+        log.critical(msg=NO_BUTTON_MSG % step)
+        SCREENSHOTS.capture_error(driver, f'set_{step}')
+        raise no_button
+
+
+def run_tab_steps(driver, config_instance, msg_header):
+    """
+    Generator version of the steps of check_schedule for a tab of the tab browser.
+    The Entidades page is loaded first, as the tab is left on the results of its last search.
+    The time slots are read from the page: the network log of the browser mixes every tab.
+    """
+    l_service_opt = config_instance.service_opt
+    l_location_opt = config_instance.location_opt
+    l_localidade = l_location_opt.get('localidade', '')
+    l_local_atendimento = l_location_opt.get('local_atendimento', '')
+
+    # Step 1: Load the Entidades page and set entity
+    entity_wait = get_step_wait(config_instance, 'entity')
+    with timed_step(msg_header, 'page_load'):
+        driver.execute_script(LEAVE_PAGE_SCRIPT, SIGA_URL)
+        yield from wait_in_tab(lambda d: d.execute_script(ENTIDADES_READY_SCRIPT), entity_wait)
+    with timed_step(msg_header, 'entity'):
+        msg_header.set_entity(set_entity(driver, config_instance.entity_opt, entity_wait))
+
+    # Step 2: Set category, subcategory, and motive
+    for step, select_id, key, setter in (
+            ('category', 'IdCategoria', 'tema', msg_header.set_category),
+            ('subcategory', 'IdSubcategoria', 'subtema', msg_header.set_subcategory),
+            ('motive', 'IdMotivo', 'motivo', msg_header.set_motive)):
+        with timed_step(msg_header, step):
+            setter((yield from select_in_tab(driver, select_id, l_service_opt.get(key, ''), step,
+                                             get_step_wait(config_instance, step))))
+    with timed_step(msg_header, 'step_two'):
+        yield from click_next_in_tab(driver, 'step_two',
+                                     get_step_wait(config_instance, 'step_two'))
+
+    # Step 3: Set district, local, and service desk
+    location_steps = [('district', 'IdDistrito', l_location_opt.get('distrito', ''),
+                       msg_header.set_district),
+                      ('local', 'IdLocalidade', l_localidade, msg_header.set_local)]
+    if l_localidade > 0 and l_local_atendimento:
+        location_steps.append(('service_desk', 'IdLocalAtendimento', l_local_atendimento,
+                               msg_header.set_service_desk))
+    for step, select_id, value, setter in location_steps:
+        with timed_step(msg_header, step):
+            setter((yield from select_in_tab(driver, select_id, value, step,
+                                             get_step_wait(config_instance, step))))
+    with timed_step(msg_header, 'step_three'):
+        step_wait = get_step_wait(config_instance, 'step_three')
+        yield from click_next_in_tab(driver, 'step_three', step_wait)
+        try:
+            yield from wait_in_tab(EC.any_of(
+                EC.visibility_of_element_located((By.CLASS_NAME, 'schedule-list')),
+                EC.visibility_of_element_located((By.CLASS_NAME, 'error-message'))), step_wait)
+        except TimeoutException:
+            log.critical('Results page did not load a schedule list nor an error message')
+
+    with timed_step(msg_header, 'time_slots'):
+        read_results(driver, msg_header, config_instance.max_days,
+                     driver.execute_script(SCHEDULE_LIST_SCRIPT) or {})
+
+
+def scan_in_tab(driver, config_instance):
+    """
+    Function to manage the automation search in a tab of the tab browser: a generator run by
+    the TabBrowser, returning the NotificationData, or None on failure, like check_schedule.
+    """
+    msg_header = NotificationData()
+    result = 'success'
+    started = time.monotonic()
+
+    try:
+        log.info('Start of check_schedule in a tab: %s', config_instance.title)
+        if config_instance.service_opt and config_instance.location_opt:
+            yield from run_tab_steps(driver, config_instance, msg_header)
+            log.info('End of check_schedule in a tab: %s', config_instance.title)
+        else:
+            log.critical('Empty parameter: p_service_opt')
+        return msg_header
+
+    except WebDriverException as wd:
+        log.error('WebDriverException in scan_in_tab: %s', wd)
+        log_exception(wd)
+        SCREENSHOTS.capture_error(driver, scan_in_tab.__name__)
+        result = scan_result(wd)
+        return None
+    except GeneratorExit:
+        # Stopped with the browser
+        result = 'error'
+        raise
+    except Exception as ex:
+        log.error('Exception in scan_in_tab: %s', ex)
+        SCREENSHOTS.capture_error(driver, scan_in_tab.__name__)
+        result = scan_result(ex)
+        return None
+    finally:
+        record_scan(config_instance, 'selenium', result,
+                    msg_header.get_step_timings(), time.monotonic() - started)
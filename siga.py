@@ -1,75 +1,67 @@
 """Imports"""
 import os
 import sys
-import traceback
-import re
 import time
+import argparse
+import importlib
 import collections
-from datetime import datetime, timedelta
+from datetime import datetime
 
 import logging as log
-import requests
-
-
-import schedule as sd
-from notifypy import Notify
-
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.select import Select
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import (NoSuchElementException,
-                                        TimeoutException,
-                                        WebDriverException,
-                                        NoSuchDriverException,
-                                        ElementClickInterceptedException)
-
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.edge.service import Service as EdgeService
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.microsoft import EdgeChromiumDriverManager
 
 # Local libraries and Classes
-from env_vars import EnvironmentVariables
-from yaml_loader import YamlLoader
+# Heavy modules (Selenium, requests, notifypy, asyncio, cerberus, dotenv) are imported
+# only by the code paths that need them, to keep the import of this module fast.
 from notif_data import NotificationData
+from log_utils import word_in_center, print_log_schedule, log_exception
+from metrics import METRICS, config_labels, record_scan
 
 __version__ = "0.01.01"
 
 
-# Create an instance of the EnvironmentVariables class
-# which loads environment variables from .env file
-ENV_VARS = EnvironmentVariables()
-
-TIME_SLOT_LIST = collections.defaultdict(list)
+# The instance of the EnvironmentVariables class which loads environment variables
+# from .env file is created by init()
+ENV_VARS = None
+
+DRIVER_POOL = None
+TASK_EXECUTOR = None
+SLOT_STORE = None
+ADAPTIVE_FREQUENCY = None
+NOTIFIER = None
+FAN_OUT = None
+FAST_CLAIM = None
+TAB_BROWSER = None
+HTTP_ENGINE = None
+SELENIUM_ENGINE = None
 opt = {}
 
-OPT_SELECT_MSG = 'Opção "%s" selecionada com sucesso!'
-NO_ELEMENT_MSG = "No element found for: %s\\n%s was raised: %s"
-LOG_WEBDRIVER_ERROR = 'log_%s_error_%s.png'
-NO_BUTTON_MSG = "No button %s available at the moment"
-
-
-log.basicConfig(
-    handlers=[
-        log.StreamHandler(sys.stdout),
-        log.FileHandler(f'{os.path.splitext(os.path.basename(__file__))[0]}_' +
-                        f'{datetime.now().strftime("%Y%m%d")}.log',
-                        mode="a+", encoding='utf-8'),
-    ],
-    level=log.DEBUG,
-    format="%(asctime)s - %(name)-12s - %(levelname)-8s:[%(filename)s:%(lineno)-04d]: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
+# Functions of the Selenium engine still reachable as siga.<name>, imported on first use
+SELENIUM_ENGINE_EXPORTS = (
+    'start_chrome', 'reset_chrome', 'close_chrome', 'check_schedule', 'check_schedule_group',
+    'get_time_slots', 'set_entity', 'set_category', 'set_subcategory', 'set_motive',
+    'set_step_two', 'set_district', 'set_local', 'set_service_desk', 'set_step_three',
+    'check_elem_exists', 'SIGA_URL',
 )
 
-log.getLogger("selennium").setLevel(log.ERROR)
-log.getLogger('selenium.webdriver.remote').setLevel(log.ERROR)
-log.getLogger('selenium.webdriver.common').setLevel(log.ERROR)
-log.getLogger('urllib3.connectionpool').setLevel(log.ERROR)
-log.getLogger('WDM').setLevel(log.ERROR)
-log.getLogger('charset_normalizer').setLevel(log.ERROR)
-log.getLogger('schedule').setLevel(log.DEBUG)
+
+def __getattr__(name):
+    """Function to resolve the Selenium engine functions lazily (PEP 562)."""
+    if name in SELENIUM_ENGINE_EXPORTS:
+        return getattr(importlib.import_module('selenium_engine'), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def init() -> None:
+    """
+    Function to load the environment variables from the .env file and start the logging
+    pipeline configured in LOG_CONFIG.
+    """
+    global ENV_VARS # pylint: disable=global-statement
+    # pylint: disable=import-outside-toplevel
+    from env_vars import EnvironmentVariables
+    from log_pipeline import setup_logging
+    ENV_VARS = EnvironmentVariables()
+    setup_logging(ENV_VARS.log_config, ENV_VARS.log_format)
 
 
 def check_dotenv_siga():
@@ -87,21 +79,78 @@ def usage():
           --location (dict)<{String values from drop lists}>')
 
 
-def send_message(message_header):
-    """Function to send message."""
-    if TIME_SLOT_LIST:
-        if ENV_VARS.bot_token and ENV_VARS.bot_chat_id:
-            response = telegram_send_message(message_header, TIME_SLOT_LIST)
+def get_config_key(config_instance):
+    """Function to get a stable key of a configuration, used to keep its slot history."""
+    return config_instance.key
+
+
+def get_job_tag(config_instances):
+    """Function to get the tag of the scheduled job of a group of configurations."""
+    return '+'.join(get_config_key(c) for c in config_instances)
+
+
+def notify_changes(message_header, config_instance, keep_locations=()):
+    """
+    Function to send only the time slots that appeared or disappeared since the last search.
+    The slots of keep_locations, which the search could not read, are never reported as gone.
+    A search that did not reach the results page read no time slots at all, so nothing is sent.
+    """
+    if message_header is None:
+        return
+    if not message_header.get_results_read():
+        log.warning('%s did not reach the results page, its time slots are left as they were',
+                    config_instance.title)
+        return
+    started = time.monotonic()
+    labels = config_labels(config_instance)
+    METRICS.inc('siga_slots_found_total', sum(map(len, message_header.get_time_slots().values())),
+                **labels)
+    if SLOT_STORE is None:
+        send_message(message_header)
+    else:
+        new_slots, gone_slots = SLOT_STORE.update(get_config_key(config_instance),
+                                                  message_header.get_time_slots(),
+                                                  keep_locations=keep_locations)
+        METRICS.inc('siga_slots_new_total', sum(map(len, new_slots.values())), **labels)
+        send_message(message_header, new_slots, gone_slots)
+    METRICS.observe('siga_step_duration_seconds', time.monotonic() - started,
+                    **labels, step='notification')
+
+
+def send_message(message_header, new_slots=None, gone_slots=None):
+    """
+    Function to send message.
+    Without new_slots all the time slots of the header are sent. When the notification
+    dispatcher is running the messages are only queued, so the search is never held.
+    """
+    if message_header is None:
+        return
+    if new_slots is None:
+        new_slots = message_header.get_time_slots()
+
+    if (new_slots or gone_slots) and ENV_VARS and ENV_VARS.bot_token and ENV_VARS.bot_chat_id:
+        if NOTIFIER is not None:
+            NOTIFIER.enqueue_telegram(ENV_VARS.bot_chat_id,
+                                      format_telegram_message(message_header, new_slots,
+                                                              gone_slots))
+        else:
+            response = telegram_send_message(message_header, new_slots, gone_slots)
             log.info('Message sent to Telegram')
             log.info('Telegram response: %s' , list(response.keys())[0])
 
-        notification = Notify()
-        notification.title = "SIGA"
-        notification.message = f"Time slots available:\n{message_header.get_district()}\
+    if new_slots:
+        title = "SIGA"
+        message = f"Time slots available:\n{message_header.get_district()}\
             -{message_header.get_local()}"
-        notification.urgency = "critical"
-        notification.send()
-        TIME_SLOT_LIST.clear()
+        if NOTIFIER is not None:
+            NOTIFIER.enqueue_desktop(title, message)
+        else:
+            from notifypy import Notify # pylint: disable=import-outside-toplevel
+            notification = Notify()
+            notification.title = title
+            notification.message = message
+            notification.urgency = "critical"
+            notification.send()
 
 
 def format_time_slots(time_slots):
@@ -114,8 +163,8 @@ def format_time_slots(time_slots):
     return message
 
 
-def telegram_send_message(message_header, time_slots):
-    """Function to send a notification to Telegram via chat bot."""
+def format_telegram_message(message_header, time_slots, gone_slots=None):
+    """Function to build the text of the Telegram notification."""
     entity = message_header.get_entity()
     category = message_header.get_category()
     subcategory = message_header.get_subcategory()
@@ -127,527 +176,416 @@ def telegram_send_message(message_header, time_slots):
     message += f"Distrito: {district}, Localidade: {local}\n\n"
 
     message += format_time_slots(time_slots)
+    if gone_slots:
+        message += "\nJá não disponíveis:\n"
+        message += format_time_slots(gone_slots)
+    return message
+
 
+def format_claim_message(message_header, claim):
+    """Function to build the text of the notification of a claimed time slot."""
+    state = "Marcação confirmada" if claim['confirmed'] else "Vaga reservada nos dados da marcação"
+    message = f"{state} ({claim['seconds']:.1f}s)\n"
+    message += f"{message_header.get_entity()} - {message_header.get_category()}\n"
+    message += f"{message_header.get_subcategory()}\n{message_header.get_motive()}\n\n"
+    message += format_time_slots({claim['location']: [claim['label']]})
+    return message
+
+
+def notify_claim(message_header, claim):
+    """Function to report a time slot claimed by the fast claim, booked or held."""
+    if NOTIFIER is None:
+        return
+    if ENV_VARS.bot_token and ENV_VARS.bot_chat_id:
+        NOTIFIER.enqueue_telegram(ENV_VARS.bot_chat_id,
+                                  format_claim_message(message_header, claim))
+    NOTIFIER.enqueue_desktop("SIGA", f"Time slot {'booked' if claim['confirmed'] else 'held'}:\n"
+                                     f"{claim['location']} {claim['label']}")
+
+
+def telegram_send_message(message_header, time_slots, gone_slots=None):
+    """Function to send a notification to Telegram via chat bot."""
+    import requests # pylint: disable=import-outside-toplevel
     url = f'https://api.telegram.org/bot{ENV_VARS.bot_token}/sendMessage'
     params = {
         "chat_id": ENV_VARS.bot_chat_id,
-        "text": message,
+        "text": format_telegram_message(message_header, time_slots, gone_slots),
         "parse_mode" : "Markdown"
     }
     response = requests.get(url, params=params, timeout=10)
     return response.json()
 
 
-def start_chrome():
-    """Function to start chrome browser."""
-    test_ua = 'Mozilla/5.0 (Windows NT 4.0; WOW64) AppleWebKit/537.36 '
-    test_ua += '(KHTML, like Gecko) Chrome/37.0.2049.0 Safari/537.36'
-
-    # Command line arguments for Chrome
-    options_args = [
-        # '--start-maximized'
-        '--headless',
-        '--window-size=1920,1080',
-        '--disable-gpu',
-        '--disable-web-security',
-        f'--user-agent={test_ua}',
-        '--no-sandbox',
-        '--disable-extensions',
-        '--ignore-certificate-errors',
-        '--allow-running-insecure-content'
-    ]
-
-    # Initiate Browser
-    log.info('Starting webdriver')
-    try:
-        options = webdriver.ChromeOptions()
-        for o in options_args:
-            options.add_argument(o)
-        options.add_experimental_option('excludeSwitches', ['enable-logging'])
-        service = ChromeService(ChromeDriverManager().install())
-        l_driver = webdriver.Chrome(service=service, options=options)
-    except Exception:
+def get_selenium_engine():
+    """Function to import the Selenium engine on first use, configured from the env variables."""
+    global SELENIUM_ENGINE # pylint: disable=global-statement
+    if SELENIUM_ENGINE is None:
+        engine = importlib.import_module('selenium_engine')
+        if ENV_VARS is not None:
+            engine.configure(ENV_VARS)
+        SELENIUM_ENGINE = engine
+    return SELENIUM_ENGINE
+
+
+def check_schedule_http(config_instance) -> NotificationData:
+    """Function to manage the automation search without a browser."""
+    global HTTP_ENGINE # pylint: disable=global-statement
+    if HTTP_ENGINE is None:
+        from http_engine import HttpScanEngine # pylint: disable=import-outside-toplevel
+        HTTP_ENGINE = HttpScanEngine(base_url=ENV_VARS.siga_url,
+                                     sticky=ENV_VARS.sticky_sessions,
+                                     max_age=ENV_VARS.sticky_session_max_age)
+
+    log.info('Start of check_schedule_http: %s', datetime.now().strftime("%H:%M:%S"))
+    msg_header, time_slots = HTTP_ENGINE.scan(config_instance)
+    msg_header.set_time_slots(time_slots)
+    print_log_schedule(time_slots)
+    log.info('End of check_schedule_http: %s', datetime.now().strftime("%H:%M:%S"))
+    return msg_header
+
+
+def run_scan(config_instance) -> NotificationData:
+    """Function to run the search with the engine chosen in the configuration."""
+    if config_instance.engine == 'http':
+        from http_engine import HttpScanError # pylint: disable=import-outside-toplevel
+        started = time.monotonic()
         try:
-            options = webdriver.EdgeOptions()
-            for o in options_args:
-                options.add_argument(o)
-            service = EdgeService(EdgeChromiumDriverManager().install())
-            l_driver = webdriver.Edge(service=service, options=options)
-        except (ConnectionError,NoSuchDriverException):
-            log.info('Could not initiate WebDriver. Please check!')
-            raise
-        except Exception as e:
-            log_exception(e)
-            raise
-
-    # Navigate to the URL
-    url = 'https://siga.marcacaodeatendimento.pt/Marcacao/Entidades'
-    l_driver.get(url)
-
-    return l_driver
-
-
-def close_chrome(p_driver):
-    """Function to close chrome browser."""
-    log.info('Quitting webdriver')
-    p_driver.quit()
-
-
-def find_and_click_entity_button(driver, p_entity):
-    """Find and click the entity button."""
-    btn_label = ''
-    if check_elem_exists(driver, By.CLASS_NAME, "btn-selecionar-entidade"):
-        btn_entity_lst = driver.find_elements(By.XPATH,
-                                              '//button[@class="btn btn-selecionar-entidade"]')
-        if btn_entity_lst:
-            for btn in btn_entity_lst:
-                if btn.get_attribute("id") == str(p_entity):
-                    try:
-                        btn_label = btn.get_attribute("title")
-                        btn.click()
-                        log.info('Botão "%s" clicado com sucesso!', btn_label)
-                        return btn_label
-                    except WebDriverException as webd_except:
-                        log.critical(webd_except)
-                        raise webd_except
-    return btn_label
-
-
-def set_entity(driver, p_entity):
-    """Function to set entity field."""
-    btn_label = find_and_click_entity_button(driver, p_entity)
-
-    if not btn_label:
-        err_msg = f"Cannot find Entity '{p_entity}' button."
-        log.critical(err_msg)
-        now = datetime.now().strftime('%d%m%Y_%H%M%S')
-        file_name = LOG_WEBDRIVER_ERROR % (set_entity.__name__, now)
-        driver.get_screenshot_as_file(filename=file_name)
-        raise NoSuchElementException(err_msg + '. Please check if the webpage is working')
-
-    return btn_label
-
-
-def set_district(driver, p_distrito):
-    """Function to set district field."""
-    try:
-        if check_elem_exists(driver, By.ID, "IdDistrito"):
-            wait_value = WebDriverWait(driver, 40).until(
-                        EC.text_to_be_present_in_element_value((By.XPATH,
-                                                        f"//select[@id='IdDistrito']\
-                                                        /option[@value={p_distrito}]"),\
-                                                        str(p_distrito)))
-            if wait_value:
-                id_distrito_select = driver.find_element(By.ID, 'IdDistrito')
-                select = Select(id_distrito_select)
-                time.sleep(2)
-                select.select_by_value(str(p_distrito))
-                log.info(OPT_SELECT_MSG , select.first_selected_option.text)
-                return select.first_selected_option.text
-    except NoSuchElementException as no_element:
-        err_msg = NO_ELEMENT_MSG % (p_distrito, \
-                     type(no_element).__name__, no_element)
-        log.critical(msg=err_msg)
-        now = datetime.now().strftime('%d%m%Y_%H%M%S')
-        file_name = LOG_WEBDRIVER_ERROR % set_district.__name__, now
-        driver.get_screenshot_as_file(filename=file_name)
-        raise no_element
-
-
-def set_local(driver, p_localidade):
-    """Function to set local field."""
-    try:
-        if check_elem_exists(driver, By.ID, "IdLocalidade"):
-            wait_value = WebDriverWait(driver, 40).until(
-                        EC.text_to_be_present_in_element_value((By.XPATH,
-                                                        f"//select[@id='IdLocalidade']\
-                                                        /option[@value={p_localidade}]"),\
-                                                        str(p_localidade)))
-            if wait_value:
-                id_localidade = driver.find_element(By.ID, 'IdLocalidade')
-                select = Select(id_localidade)
-                time.sleep(2)
-                select.select_by_value(str(p_localidade))
-                log.info(OPT_SELECT_MSG , select.first_selected_option.text)
-                return select.first_selected_option.text
-    except NoSuchElementException as no_element:
-        err_msg = NO_ELEMENT_MSG % (p_localidade, \
-                     type(no_element).__name__, no_element)
-        log.critical(msg=err_msg)
-        now = datetime.now().strftime('%d%m%Y_%H%M%S')
-        file_name = LOG_WEBDRIVER_ERROR % set_local.__name__, now
-        driver.get_screenshot_as_file(filename=file_name)
-        raise no_element
-
-
-def set_service_desk(driver, p_local_atendimento):
-    """Function to set service field."""
-    try:
-        id_local_atendimento = WebDriverWait(driver, 20).until(
-            EC.visibility_of_element_located((By.ID, 'IdLocalAtendimento'))
-        )
-        select = Select(id_local_atendimento)
-        time.sleep(2)
-        select.select_by_value(str(p_local_atendimento))
-        log.info(OPT_SELECT_MSG , select.first_selected_option.text)
-        return select.first_selected_option.text
-    except NoSuchElementException as no_element:
-        err_msg = NO_ELEMENT_MSG % (p_local_atendimento, \
-                     type(no_element).__name__, no_element)
-        log.critical(msg=err_msg)
-        now = datetime.now().strftime('%d%m%Y_%H%M%S')
-        file_name = LOG_WEBDRIVER_ERROR % set_service_desk.__name__, now
-        driver.get_screenshot_as_file(filename=file_name)
-        raise no_element
-
-
-def set_step_two(driver):
-    """Function to click button."""
-    try:
-        if check_elem_exists(driver, By.CLASS_NAME, "set-date-button"):
-            next_button = WebDriverWait(driver, 30).until(
-                EC.visibility_of_element_located((By.XPATH,
-                                                "//li[@id='liProximoButton']\
-                                                    //a[@class='set-date-button']"))
-            )
-            driver.get_screenshot_as_file(f'log_step{2}.png')
-            time.sleep(2)
-            driver.execute_script("arguments[0].click();", next_button) # next_button.click()
-            log.info('Botão "Next" clicado com sucesso!')
-        else:
-            log.critical('Cannot find step-two button')
-    except ElementClickInterceptedException as no_button:
-        err_msg = NO_BUTTON_MSG % (next_button)
-        log.critical(msg=err_msg)
-        now = datetime.now().strftime('%d%m%Y_%H%M%S')
-        file_name = LOG_WEBDRIVER_ERROR % set_step_two.__name__, now
-        driver.get_screenshot_as_file(filename=file_name)
-        raise no_button
-
-
-def set_category(driver, p_category):
-    """Function to set category field."""
-    try:
-        if check_elem_exists(driver, By.ID, "IdCategoria"):
-            wait_value = WebDriverWait(driver, 40).until(
-                        EC.text_to_be_present_in_element_value((By.XPATH,
-                                                        f"//select[@id='IdCategoria']\
-                                                        /option[@value={p_category}]"),\
-                                                        str(p_category)))
-            if wait_value:
-                id_category_select = driver.find_element(By.ID, 'IdCategoria')
-                select = Select(id_category_select)
-                time.sleep(2)
-                select.select_by_value(str(p_category))
-                log.info(OPT_SELECT_MSG , select.first_selected_option.text)
-                return select.first_selected_option.text
-    except NoSuchElementException as no_element:
-        err_msg = NO_ELEMENT_MSG % (p_category, type(no_element).__name__, no_element)
-        log.critical(msg=err_msg)
-        now = datetime.now().strftime('%d%m%Y_%H%M%S')
-        file_name = LOG_WEBDRIVER_ERROR % (set_category.__name__, now)
-        driver.get_screenshot_as_file(filename=file_name)
-        raise no_element
-
-
-def set_subcategory(driver, p_subcategory):
-    """Function to set subcategory field."""
-    try:
-        if check_elem_exists(driver, By.ID, "IdSubcategoria"):
-            wait_value = WebDriverWait(driver, 40).until(
-                        EC.text_to_be_present_in_element_value((By.XPATH,
-                                                        f"//select[@id='IdSubcategoria']\
-                                                        /option[@value={p_subcategory}]"),\
-                                                        str(p_subcategory)))
-            if wait_value:
-                id_subcategory_select = driver.find_element(By.ID, 'IdSubcategoria')
-                select = Select(id_subcategory_select)
-                time.sleep(2)
-                select.select_by_value(str(p_subcategory))
-                txt = select.first_selected_option.text
-                log.info(OPT_SELECT_MSG , txt)
-                return txt
-    except NoSuchElementException as no_element:
-        err_msg = NO_ELEMENT_MSG % (p_subcategory, type(no_element).__name__, no_element)
-        log.critical(msg=err_msg)
-        now = datetime.now().strftime('%d%m%Y_%H%M%S')
-        file_name = LOG_WEBDRIVER_ERROR % (set_subcategory.__name__, now)
-        driver.get_screenshot_as_file(filename=file_name)
-        raise no_element
-
-
-def set_motive(driver, p_motive):
-    """Function to set motive field."""
-    try:
-
-        if check_elem_exists(driver, By.ID, "IdMotivo"):
-            wait_value = WebDriverWait(driver, 40).until(
-                        EC.text_to_be_present_in_element_value((By.XPATH,
-                                                        f"//select[@id='IdMotivo']\
-                                                        /option[@value={p_motive}]"),\
-                                                        str(p_motive)))
-            if wait_value:
-                id_motive_select = driver.find_element(By.ID, 'IdMotivo')
-                select = Select(id_motive_select)
-                time.sleep(2)
-                select.select_by_value(str(p_motive))
-                txt = select.first_selected_option.text
-                log.info(OPT_SELECT_MSG , txt)
-                return txt
-    except NoSuchElementException as no_element:
-        err_msg = NO_ELEMENT_MSG % (p_motive, type(no_element).__name__, no_element)
-        log.critical(msg=err_msg)
-        now = datetime.now().strftime('%d%m%Y_%H%M%S')
-        file_name = LOG_WEBDRIVER_ERROR % (set_motive.__name__, now)
-        driver.get_screenshot_as_file(filename=file_name)
-        raise no_element
-
-
-def set_step_three(driver):
-    """Function to click button."""
-    try:
-        if check_elem_exists(driver, By.CLASS_NAME, "set-date-button"):
-            next_button = WebDriverWait(driver, 30).until(
-                EC.visibility_of_element_located((By.XPATH,
-                                                "//li[@id='liProximoButton']\
-                                                    //a[@class='set-date-button']"))
-            )
-            driver.get_screenshot_as_file(f'log_step{3}.png')
-            time.sleep(2)
-            driver.execute_script("arguments[0].click();", next_button) # next_button.click()
-            log.info('Botão "Next" clicado com sucesso!')
-        else:
-            log.critical('Cannot find step-three button')
-    except ElementClickInterceptedException as no_button:
-        err_msg = NO_BUTTON_MSG % (next_button)
-        log.critical(msg=err_msg)
-        now = datetime.now().strftime('%d%m%Y_%H%M%S')
-        file_name = LOG_WEBDRIVER_ERROR % (set_step_two.__name__, now)
-        driver.get_screenshot_as_file(filename=file_name)
-        raise no_button
-
-#return boolean value instead of throwing exception
-def check_elem_exists(parent, by, selector, wait=False, timeout=False):
-    """Function to check if the element exists on the loaded page."""
-    ret = None
-    if not wait:
-        try:
-            parent.find_element(by, selector)
-        except NoSuchElementException:
-            ret = False
-        else:
-            ret = True
-    else:
-        #when allowing wait time - print note for what is happening
-        log.info('%s - check_elem_exists(%is..)' , selector,timeout)
-        try:
-            WebDriverWait(parent, timeout).until(EC.presence_of_element_located((by, selector)))
-        except NoSuchElementException:
-            ret = False
-        except TimeoutException:
-            ret = False
-        else:
-            ret = True
-
-    return ret
-
-def word_in_center(string):
-    """Function to print a string in center."""
-    return f'{string:-^100}'
-
-
-def get_time_slots(driver, days_max):
-    """Function to get all the schedule available."""
-
-    def print_log_schedule(time_slot):
-        if time_slot:
-            sorted_list = dict(sorted(time_slot.items()))
-            log.info('|'*100)
-            log.info(word_in_center('Run! There are time slots available that matches your search'))
-            for key, values in sorted_list.items():
-                log.info('Location: %s', key)
-                log.info('Dates: %s', sorted(values))
-                log.info('-'*100)
-            log.info('|'*100)
-
-
-    def sort_nested_dict_by_date(nested_dict):
-        for key, value in nested_dict.items():
-            nested_dict[key] = sorted(value, key=lambda x: datetime.strptime(x, '%d-%m-%Y %H:%M'))
-        return {key: value for key, value in sorted(nested_dict.items())}
-
-
-    pattern = r'\d{2}-\d{2}-\d{4} \d{2}:\d{2}\b|\d{2}:\d{2} - \d{2}-\d{2}-\d{4}\b'
-
-    date_max_days = (datetime.now() + timedelta(days=days_max))
-    log.info('Max date to search for time slots: %s', date_max_days.strftime("%d-%m-%Y"))
+            msg_header = check_schedule_http(config_instance)
+            record_scan(config_instance, 'http', 'success', msg_header.get_step_timings(),
+                        time.monotonic() - started)
+            return msg_header
+        except HttpScanError as ex:
+            record_scan(config_instance, 'http', 'error', seconds=time.monotonic() - started)
+            log.warning('HTTP engine failed, falling back to Selenium: %s', ex)
+
+    if TAB_BROWSER is not None and (FAST_CLAIM is None or config_instance.claim_opt is None):
+        # A tab of the shared browser, its steps multiplexed with the searches of the other tabs
+        return TAB_BROWSER.scan(config_instance)
+
+    # A sticky search gets back the browser it left on its results page
+    affinity = config_instance.digest if ENV_VARS.sticky_sessions else None
+    with DRIVER_POOL.lease(affinity) as driver:
+        msg_header = get_selenium_engine().check_schedule(driver, config_instance)
+        if msg_header is not None and FAST_CLAIM is not None:
+            # Still on the results page: claim before the notifications go out
+            FAST_CLAIM.claim(driver, config_instance, msg_header)
+        return msg_header
 
-    schedule_list = driver.find_elements(By.XPATH, \
-                                         '//div[@class="schedule-list"]\
-                                            //div[starts-with(@class, "col-md-5 m-")]')
-    if schedule_list:
-        for time_slots in schedule_list:
-            if time_slots:
-                available_dates = re.search('(\\d{2}-\\d{2}-\\d{4})',
-                                            time_slots.find_element(By.TAG_NAME, "span").text)
-                date_now = datetime.strptime(available_dates.group(),'%d-%m-%Y')
-                if date_now <= date_max_days: # filters de time slots by maximum date wanted
-                    validated_date = re.search(pattern,
-                                                time_slots.find_element(By.TAG_NAME, "span").text)
-                    TIME_SLOT_LIST[time_slots.get_attribute("title")].append(validated_date.group())
 
-        # TIME_SLOT_LIST = sort_nested_dict_by_date(TIME_SLOT_LIST)
-        print_log_schedule(TIME_SLOT_LIST)
+def discover_locations(config_instance) -> dict:
+    """Function to list the locals and service desks of the district of a configuration."""
+    with DRIVER_POOL.lease() as driver:
+        return get_selenium_engine().discover_locations(driver, config_instance)
 
-    try:
-        if check_elem_exists(driver, By.CLASS_NAME, "error-message"):
-            error_message_div = WebDriverWait(driver, 20).until(
-                EC.visibility_of_element_located((By.XPATH, \
-                                                  '//div[@class="error-message"]\
-                                                    //div[@class="col-md-12 no_padding"]'))
-            )
-
-            h5_element = error_message_div.find_element(By.TAG_NAME, 'h5')
-            log.info('*'*100)
-            log.info(word_in_center(h5_element.text))
-            log.info('*'*100)
-
-    except NoSuchElementException as no_element:
-        log.critical('No error message')
-        log.critical("%s was raised: %s", type(no_element).__name__, no_element)
-    except TimeoutException as timeout:
-        log.critical('No error message')
-        log.critical("%s was raised: %s" , type(timeout).__name__, timeout)
-
-
-def check_schedule(driver, config_instance) -> NotificationData:
-    """Function to manage the automation search."""
-    msg_header = NotificationData()
 
-    try:
-        now = datetime.now()
-        log.info('Start of check_schedule: %s', now.strftime("%H:%M:%S"))
-
-        max_days = config_instance.get_value_by_key('max_days')
-
-        l_screen_shot = 'log_step{}.png'
-        l_location_opt = config_instance.get_value_by_key('location_opt')
-        l_service_opt = config_instance.get_value_by_key('service_opt')
-        l_distrito  = l_location_opt.get('distrito', '')
-        l_localidade = l_location_opt.get('localidade', '')
-        l_local_atendimento = l_location_opt.get('local_atendimento', '')
-
-        if l_service_opt and l_location_opt:
-            # Step 1: Set entity
-            driver.get_screenshot_as_file(l_screen_shot.format(1))
-            msg_header.set_entity(set_entity(driver,
-                                             config_instance.get_value_by_key('entity_opt')))
-
-            # Step 2: Set category, subcategory, and motive
-            msg_header.set_category(set_category(driver, l_service_opt.get("tema", '')))
-            msg_header.set_subcategory(set_subcategory(driver, l_service_opt.get("subtema", '')))
-            msg_header.set_motive(set_motive(driver, l_service_opt.get("motivo", '')))
-            driver.get_screenshot_as_file(l_screen_shot.format(2))
-            set_step_two(driver)
-
-            # Step 3: Set district, local, and service desk
-            msg_header.set_district(set_district(driver, l_distrito))
-            msg_header.set_local(set_local(driver, l_localidade))
-            if l_localidade > 0 and l_local_atendimento:
-                msg_header.set_service_desk(set_service_desk(driver, l_local_atendimento))
-            driver.get_screenshot_as_file(l_screen_shot.format(3))
-            set_step_three(driver)
-
-            driver.get_screenshot_as_file(l_screen_shot.format(4))
-            get_time_slots(driver, max_days)
-
-            log.info('End of check_schedule: %s', datetime.now().strftime("%H:%M:%S"))
+def task(config_instance) -> None:
+    """Function to start the tasks."""
+    now = datetime.now()
+    started = time.monotonic()
+    title = config_instance.title
+    log.info('Task start: %s', title)
+    if config_instance.in_window(now):
+        if config_instance.fan_out and FAN_OUT is not None:
+            msg, failed_locations = FAN_OUT.scan(config_instance)
+            notify_changes(msg, config_instance, failed_locations)
         else:
-            log.critical('Empty parameter: p_service_opt')
-
-        return msg_header
+            msg = run_scan(config_instance)
+            notify_changes(msg, config_instance)
+    else:
+        log.info('Outside business hours')
+    log.info('Task end: %s (%.1fs)', title, time.monotonic() - started)
 
-    except WebDriverException as wd:
-        log.error('WebDriverException in check_schedule: %s', wd)
-        log_exception(wd)
-        return None
-    except Exception as ex:
-        log.error('Exception in check_schedule: %s', ex)
-        return None
 
+def task_group(config_instances) -> None:
+    """Function to start the tasks of configurations sharing the same navigation prefix."""
+    if len(config_instances) == 1:
+        task(config_instances[0])
+        return
 
-def task(config_instance) -> None:
-    """Function to start the tasks."""
+    titles = ', '.join(c.title for c in config_instances)
     now = datetime.now()
-    log.info('>' * 100)
-    log.info(word_in_center(' Task Start: %s ' % config_instance.get_value_by_key('title')))
-    start_time = config_instance.get_value_by_key('start_time')
-    end_time = config_instance.get_value_by_key('end_time')
-    if start_time <= now.strftime("%H:%M") <= end_time:
-        driver = start_chrome()
-        msg = check_schedule(driver, config_instance)
-        close_chrome(driver)
-        send_message(msg)
+    started = time.monotonic()
+    log.info('Task group start: %s', titles)
+    if config_instances[0].in_window(now):
+        with DRIVER_POOL.lease() as driver:
+            msgs = get_selenium_engine().check_schedule_group(driver, config_instances)
+        for config_instance, msg in zip(config_instances, msgs):
+            notify_changes(msg, config_instance)
     else:
         log.info('Outside business hours')
-    log.info(word_in_center(' Task End: %s ' % config_instance.get_value_by_key('title')))
-    log.info('<'*100)
+    log.info('Task group end: %s (%.1fs)', titles, time.monotonic() - started)
 
 
-def main() -> None:
+def get_prefix_key(config_instance) -> tuple:
+    """
+    Function to get the key of the navigation prefix of a configuration: configurations with
+    the same key share steps 1 and 2 and run together on the same schedule.
+    Nothing is grouped with sticky sessions or browser tabs: a group runs in a browser of the
+    pool leased by the whole group, so a search could neither get back the browser it left on
+    its results page nor run in a tab.
+    """
+    # Claims need the driver of their own search, still on its results page
+    if config_instance.engine == 'http' or config_instance.fan_out or \
+            config_instance.claim_opt is not None:
+        return ('single', id(config_instance))
+    if ENV_VARS is not None and (ENV_VARS.sticky_sessions or ENV_VARS.browser_tabs > 0):
+        return ('single', id(config_instance))
+    service_opt = config_instance.service_opt
+    adaptive_opt = config_instance.adaptive_opt
+    return (config_instance.entity_opt,
+            service_opt.get('tema'), service_opt.get('subtema'), service_opt.get('motivo'),
+            config_instance.frequency,
+            tuple(sorted(adaptive_opt.items())) if adaptive_opt else None,
+            config_instance.start_time,
+            config_instance.end_time)
+
+
+def group_by_prefix(config_instances) -> list:
+    """Function to group the configurations by their navigation prefix, keeping the file order."""
+    groups = collections.OrderedDict()
+    for config_instance in config_instances:
+        groups.setdefault(get_prefix_key(config_instance), []).append(config_instance)
+    return list(groups.values())
+
+
+def warn_invalid_configs(yaml_instance) -> None:
+    """Function to log the entries skipped for failing the validation, at startup and on reload."""
+    positions = yaml_instance.get_invalid_positions()
+    if positions:
+        log.warning('Configuration(s) #%s are invalid and not searched, see their errors above',
+                    ', #'.join(map(str, positions)))
+
+
+def validate_config(config_file) -> tuple:
+    """Function to load and validate the configuration file without starting any search."""
+    from yaml_loader import YamlLoader # pylint: disable=import-outside-toplevel
+    yaml_instance = YamlLoader(config_file, cache_path=ENV_VARS.config_cache_path,
+                               workers=ENV_VARS.config_workers)
+    return yaml_instance.get_len_valid_configs(), yaml_instance.get_len_loaded_configs()
+
+
+def encrypt_claim_profile(source_path) -> int:
+    """
+    Function to encrypt the booking details of the fast claim into CLAIM_PROFILE_PATH.
+    A new key is printed once when CLAIM_PROFILE_KEY is not set, to be added to the .env file.
+    """
+    # pylint: disable=import-outside-toplevel
+    from fast_claim import ClaimError, encrypt_profile, new_profile_key
+    key = ENV_VARS.claim_profile_key
+    try:
+        if not key:
+            key = new_profile_key()
+            print(f'Add this line to the .env file:\nCLAIM_PROFILE_KEY = {key}')
+        encrypt_profile(source_path, ENV_VARS.claim_profile_path, key)
+    except (ClaimError, OSError) as ex:
+        log.error('Claim profile not written: %s', ex)
+        return 1
+    log.info('Claim profile written to %s, %s can be deleted', ENV_VARS.claim_profile_path,
+             source_path)
+    return 0
+
+
+def main(config_file="search_config.yaml", once=False) -> None:
     """Main."""
-
-    def set_schedule(config_instance) -> None:
-        frequency_opt = config_instance.get_value_by_key('frequency')
-        log.info('Scheduling configured for: %s. Running from: %s until %s, every %s minutes',
-                 config_instance.get_value_by_key('title'),
-                 config_instance.get_value_by_key('start_time'),
-                 config_instance.get_value_by_key('end_time'),
-                 frequency_opt
-                 )
-        sd.every(frequency_opt).minutes.do(task,
-                                           config_instance) \
-                                            .tag('siga-tasks',
-                                                 config_instance.get_value_by_key('title'))
+    global DRIVER_POOL, TASK_EXECUTOR # pylint: disable=global-statement
+    global SLOT_STORE, NOTIFIER, ADAPTIVE_FREQUENCY, FAN_OUT # pylint: disable=global-statement
+    global FAST_CLAIM, TAB_BROWSER # pylint: disable=global-statement
+    # pylint: disable=import-outside-toplevel
+    from yaml_loader import YamlLoader
+    from driver_pool import DriverPool
+    from task_executor import TaskExecutor
+    from slot_store import SlotStore
+    from notifier import NotificationDispatcher
+    from adaptive_frequency import AdaptiveFrequency
+    from fan_out import FanOutScanner
+
+    def set_schedule(scheduler, config_instances) -> None:
+        frequency_opt = config_instances[0].frequency
+        for config_instance in config_instances:
+            log.info('Scheduling configured for: %s. Running from: %s until %s, every %s minutes',
+                     config_instance.title,
+                     config_instance.start_time.strftime('%H:%M'),
+                     config_instance.end_time.strftime('%H:%M'),
+                     frequency_opt
+                     )
+        if len(config_instances) > 1:
+            log.info('%s configurations share the entity and service steps',
+                     len(config_instances))
+        tag = get_job_tag(config_instances)
+        adaptive_opt = config_instances[0].adaptive_opt
+        if adaptive_opt:
+            log.info('Adaptive frequency between %s and %s minutes',
+                     adaptive_opt['min_frequency'], adaptive_opt['max_frequency'])
+            config_keys = [get_config_key(c) for c in config_instances]
+            frequency_opt = lambda base=frequency_opt: ADAPTIVE_FREQUENCY.get_interval(
+                tag, config_keys, base,
+                adaptive_opt['min_frequency'], adaptive_opt['max_frequency'])
+        scheduler.add_job(tag, frequency_opt, task_group, config_instances,
+                          start_time=config_instances[0].start_time,
+                          end_time=config_instances[0].end_time)
+
+    def load_config(previous):
+        yaml_instance = YamlLoader(config_file, previous=previous,
+                                   cache_path=ENV_VARS.config_cache_path,
+                                   workers=ENV_VARS.config_workers)
+        if yaml_instance.get_len_valid_configs() == 0:
+            raise ValueError(f'No valid configuration in {config_file}')
+        warn_invalid_configs(yaml_instance)
+        return yaml_instance
+
+    def apply_config(scheduler, scheduled, yaml_instance) -> None:
+        groups = {get_job_tag(g): g for g in group_by_prefix(yaml_instance.get_instances())}
+        removed = [tag for tag in scheduled if tag not in groups]
+        for tag in removed:
+            scheduler.remove_job(tag)
+            ADAPTIVE_FREQUENCY.forget(tag)
+            del scheduled[tag]
+        added = changed = 0
+        for tag, config_group in groups.items():
+            signature = tuple(c.digest for c in config_group)
+            if scheduled.get(tag) == signature:
+                continue
+            if tag in scheduled:
+                ADAPTIVE_FREQUENCY.forget(tag)
+                changed += 1
+            else:
+                added += 1
+            set_schedule(scheduler, config_group)
+            scheduled[tag] = signature
+        log.info('Configuration reloaded: %s added, %s rescheduled, %s removed, %s unchanged',
+                 added, changed, len(removed), len(groups) - added - changed)
 
     check_dotenv_siga()
-    yaml_instance = YamlLoader("search_config.yaml")
-    for config in yaml_instance.get_instances():
-        set_schedule(config)
+    yaml_instance = YamlLoader(config_file, cache_path=ENV_VARS.config_cache_path,
+                               workers=ENV_VARS.config_workers)
+    config_groups = group_by_prefix(yaml_instance.get_instances())
 
     if yaml_instance.get_len_valid_configs() == 0:
         raise ValueError('There are no valid configurations on your Yaml file. Please check!')
-
-    while True:
-        sd.run_pending()
-        time.sleep(1)
-
-
-def log_exception(exception):
-    """
-    Log an exception.
-    Args:
-        exception: The exception to log.
-    """
-    log.error(exception.__class__.__name__)
-    log.error(exception)
-    log.error(traceback.format_exc())
+    warn_invalid_configs(yaml_instance)
+
+    DRIVER_POOL = DriverPool(lambda: get_selenium_engine().start_chrome(),
+                             lambda driver: get_selenium_engine().reset_chrome(driver),
+                             size=ENV_VARS.driver_pool_size,
+                             max_uses=ENV_VARS.driver_max_uses,
+                             max_age=ENV_VARS.driver_max_age)
+    log.info('Webdriver pool configured with %s browser(s), recycled after %s uses or %s minutes',
+             DRIVER_POOL.size, ENV_VARS.driver_max_uses, ENV_VARS.driver_max_age)
+    if ENV_VARS.browser_tabs > 0:
+        from tab_browser import TabBrowser
+        TAB_BROWSER = TabBrowser(lambda: get_selenium_engine().start_chrome(),
+                                 lambda driver: get_selenium_engine().close_chrome(driver),
+                                 lambda driver: get_selenium_engine().open_tab(driver),
+                                 lambda *args: get_selenium_engine().scan_in_tab(*args),
+                                 tabs=ENV_VARS.browser_tabs,
+                                 max_age=ENV_VARS.driver_max_age)
+        log.info('Searches run in up to %s tabs of one shared browser', TAB_BROWSER.tabs)
+        if ENV_VARS.browser_tabs > ENV_VARS.worker_pool_size:
+            log.warning('Only %s of the %s tabs can be busy: WORKER_POOL_SIZE is lower',
+                        ENV_VARS.worker_pool_size, ENV_VARS.browser_tabs)
+    SLOT_STORE = SlotStore(ENV_VARS.slot_store_path)
+    ADAPTIVE_FREQUENCY = AdaptiveFrequency(SLOT_STORE, scan_budget=ENV_VARS.scan_budget)
+    FAN_OUT = FanOutScanner(discover_locations, run_scan, workers=ENV_VARS.fan_out_workers,
+                            retries=ENV_VARS.fan_out_retries)
+    if ENV_VARS.fast_claim:
+        from fast_claim import FastClaimer
+        FAST_CLAIM = FastClaimer(lambda *args: get_selenium_engine().claim_slot(*args),
+                                 ENV_VARS.claim_profile_path, ENV_VARS.claim_profile_key,
+                                 confirm=ENV_VARS.fast_claim_confirm,
+                                 hold_seconds=ENV_VARS.fast_claim_hold,
+                                 hold=DRIVER_POOL.hold, notify=notify_claim)
+        log.info('Fast claim enabled: the matching slots are %s',
+                 'booked' if ENV_VARS.fast_claim_confirm else
+                 f'held for {ENV_VARS.fast_claim_hold} seconds')
+    NOTIFIER = NotificationDispatcher(ENV_VARS.bot_token,
+                                      max_queue=ENV_VARS.notify_queue_size,
+                                      max_retries=ENV_VARS.notify_max_retries)
+    NOTIFIER.start()
+    METRICS.add_collector(NOTIFIER.collect_metrics)
+    if ENV_VARS.metrics_port:
+        METRICS.serve(ENV_VARS.metrics_port, ENV_VARS.metrics_host)
+    try:
+        if once:
+            for config_group in config_groups:
+                task_group(config_group)
+            return
+
+        import asyncio
+        from async_scheduler import AsyncScheduler
+        TASK_EXECUTOR = TaskExecutor(max_workers=ENV_VARS.worker_pool_size)
+        log.info('Running searches on up to %s worker(s)', TASK_EXECUTOR.max_workers)
+        scheduler = AsyncScheduler(submit=TASK_EXECUTOR.submit, jitter=ENV_VARS.schedule_jitter)
+        scheduled = {}
+        for config_group in config_groups:
+            set_schedule(scheduler, config_group)
+            scheduled[get_job_tag(config_group)] = tuple(c.digest for c in config_group)
+        background = []
+        if ENV_VARS.config_reload_interval > 0:
+            from config_watcher import ConfigWatcher
+
+            def load():
+                return load_config(yaml_instance)
+
+            def apply(new_instance):
+                nonlocal yaml_instance
+                apply_config(scheduler, scheduled, new_instance)
+                yaml_instance = new_instance
+
+            background.append(ConfigWatcher(config_file, load, apply,
+                                            interval=ENV_VARS.config_reload_interval).watch())
+        asyncio.run(scheduler.run(*background))
+    finally:
+        if TASK_EXECUTOR is not None:
+            TASK_EXECUTOR.shutdown(wait=False)
+        if TAB_BROWSER is not None:
+            TAB_BROWSER.close()
+        DRIVER_POOL.close()
+        if HTTP_ENGINE is not None:
+            HTTP_ENGINE.close()
+        NOTIFIER.stop()
+        log.info('Notification metrics: %s', NOTIFIER.get_metrics())
+        SLOT_STORE.close()
+        METRICS.shutdown()
+
+
+def parse_args(argv=None):
+    """Function to parse the command line arguments."""
+    parser = argparse.ArgumentParser(description='Search SIGA for available time slots.')
+    parser.add_argument('-c', '--config', default='search_config.yaml',
+                        help='YAML file with the search configurations')
+    parser.add_argument('--validate-config', action='store_true',
+                        help='only validate the configurations and exit')
+    parser.add_argument('--once', action='store_true',
+                        help='run every search once and exit')
+    parser.add_argument('--encrypt-profile', metavar='PROFILE_YAML',
+                        help='encrypt the booking details of the fast claim and exit')
+    return parser.parse_args(argv)
 
 
 #------------------------------------------------------------------------------
 if __name__ == "__main__":
     # execute only if run as a script
+    ARGS = parse_args()
+    init()
+    from log_pipeline import stop_logging
+    if ARGS.validate_config:
+        VALIDS, CONFIGS = validate_config(ARGS.config)
+        sys.exit(0 if CONFIGS and VALIDS == CONFIGS else 1)
+    if ARGS.encrypt_profile:
+        sys.exit(encrypt_claim_profile(ARGS.encrypt_profile))
     try:
         log.info("Press CTRL + C to cancel.")
-        main()
+        main(ARGS.config, once=ARGS.once)
     except ValueError as v:
         log.info(v)
         log.info(word_in_center(' End '))
     except FileNotFoundError as e:
         log_exception(e)
+        stop_logging()
         os._exit(1)
     except (KeyboardInterrupt, EOFError):
         log.info(word_in_center(' Interrupted by user '))
+        stop_logging()
         os._exit(1)
     except SystemExit as e:
         log.error(word_in_center(' Interrupted by system '))
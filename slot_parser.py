@@ -0,0 +1,65 @@
+"""
+Helpers shared by the scan engines to turn the schedule list of the SIGA results page
+into the time slot mapping used by the notifications.
+Imports:
+- re: Regular expressions used to find the dates in the slot labels.
+- collections: Provides the defaultdict used for the time slot mapping.
+- datetime: Used to filter the time slots by the maximum number of days.
+"""
+import re
+import collections
+from datetime import datetime, timedelta
+
+# Matches "dd-mm-YYYY HH:MM" (groups 1-3) or "HH:MM - dd-mm-YYYY" (groups 4-6)
+SLOT_PATTERN = re.compile(r'(\d{2})-(\d{2})-(\d{4}) \d{2}:\d{2}\b'
+                          r'|\d{2}:\d{2} - (\d{2})-(\d{2})-(\d{4})\b')
+
+
+def get_max_date(days_max):
+    """
+    Gets the maximum date accepted for a time slot.
+    Args:
+    - days_max (int): Threshold of days to look for available time slots.
+    Returns:
+    - datetime: The maximum date.
+    """
+    return datetime.now() + timedelta(days=int(days_max))
+
+
+def filter_time_slots(entries, days_max):
+    """
+    Builds the time slot mapping from the entries of the schedule list in a single pass.
+    Dates are compared as (year, month, day) tuples, so no slot label is parsed by strptime.
+    Args:
+    - entries (iterable): Pairs of (location title, slot label) as shown on the results page.
+    - days_max (int): Threshold of days to look for available time slots.
+    Returns:
+    - defaultdict: The slot labels grouped by location title.
+    """
+    time_slots = collections.defaultdict(list)
+    date_max_days = get_max_date(days_max)
+    max_day = (date_max_days.year, date_max_days.month, date_max_days.day)
+    search = SLOT_PATTERN.search
+    for title, text in entries:
+        validated_date = search(text or '')
+        if not validated_date:
+            continue
+        day, month, year = validated_date.group(1, 2, 3) if validated_date.group(1) \
+            else validated_date.group(4, 5, 6)
+        if (int(year), int(month), int(day)) <= max_day:
+            time_slots[title].append(validated_date.group())
+    return time_slots
+
+
+def parse_slot_datetime(label):
+    """
+    Parses the datetime of a slot label in either of the formats shown by SIGA.
+    Args:
+    - label (str): "dd-mm-YYYY HH:MM" or "HH:MM - dd-mm-YYYY".
+    Returns:
+    - datetime: The datetime of the slot.
+    """
+    if ' - ' in label:
+        hour, day = label.split(' - ', 1)
+        label = f'{day} {hour}'
+    return datetime.strptime(label, '%d-%m-%Y %H:%M')
@@ -0,0 +1,188 @@
+"""
+SlotStore: A class to keep the time slots seen by each search in an embedded SQLite database,
+so only the slots that appeared or disappeared since the previous run are notified.
+Imports:
+- sqlite3: The embedded database.
+- logging: Logging facility for Python.
+- threading: Used to share the connection between the worker threads.
+- collections: Provides the defaultdict used for the time slot mappings.
+- datetime: Used for the first-seen and last-seen timestamps.
+
+Example usage:
+store = SlotStore("siga_slots.db")
+new_slots, gone_slots = store.update(config_key, time_slots)
+history = store.get_history(config_key)
+store.close()
+"""
+import sqlite3
+import logging
+import threading
+import collections
+from datetime import datetime
+
+from slot_parser import parse_slot_datetime
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (
+    config_key TEXT NOT NULL,
+    location TEXT NOT NULL,
+    slot_at TEXT NOT NULL,
+    label TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    initial INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (config_key, location, slot_at)
+);
+CREATE INDEX IF NOT EXISTS slots_first_seen ON slots (config_key, first_seen);
+"""
+
+
+class SlotStore:
+    """
+    Represents the history of the time slots found by each search configuration.
+    Slots are keyed by configuration, location and slot datetime. A slot is active while it
+    is returned by the searches; it becomes inactive when a search no longer returns it and
+    active again (with a new first-seen timestamp) when it reappears. The slots found by the
+    first search of a configuration since the store was opened were already there, or were
+    released while nothing was searching: they are flagged as initial and are not release times.
+    Args:
+        db_path (str): The path to the SQLite database file, or ":memory:".
+    Methods:
+        update(config_key, time_slots, seen_at): Records a search result and returns the changes.
+        get_history(config_key, since): Returns the recorded slots.
+        close(): Closes the database.
+    """
+    def __init__(self, db_path="siga_slots.db"):
+        """
+        Initializes the SlotStore, creating the database if needed.
+        Args:
+        - db_path (str): The path to the SQLite database file, or ":memory:".
+        """
+        self.db_path = db_path
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.__conn.row_factory = sqlite3.Row
+        self.__updated = set()
+        with self.__conn:
+            self.__conn.executescript(SCHEMA)
+            columns = [row['name'] for row in self.__conn.execute("PRAGMA table_info(slots)")]
+            if 'initial' not in columns:
+                # Databases created before the initial flag
+                self.__conn.execute(
+                    "ALTER TABLE slots ADD COLUMN initial INTEGER NOT NULL DEFAULT 0")
+        logger.info('Slot store opened: %s', db_path)
+
+    def update(self, config_key, time_slots, seen_at=None, keep_locations=()):
+        """
+        Records the time slots returned by a search.
+        Args:
+        - config_key (str): Identifies the search configuration.
+        - time_slots (dict): The slot labels grouped by location.
+        - seen_at (datetime): When the search ran. Defaults to now.
+        - keep_locations (iterable): Locations the search could not read, whose known slots
+                                     are kept instead of being marked as gone.
+        Returns:
+        - tuple: Two defaultdicts of location to slot labels, the new and the gone slots.
+        """
+        seen = (seen_at or datetime.now()).isoformat(timespec='seconds')
+        new_slots = collections.defaultdict(list)
+        gone_slots = collections.defaultdict(list)
+        current = {}
+        for location, labels in time_slots.items():
+            for label in labels:
+                current[(location, parse_slot_datetime(label).isoformat())] = label
+
+        with self.__lock, self.__conn:
+            initial = int(config_key not in self.__updated)
+            self.__updated.add(config_key)
+            rows = self.__conn.execute(
+                "SELECT location, slot_at, label, active FROM slots WHERE config_key = ?",
+                (config_key,)).fetchall()
+            known = {(row['location'], row['slot_at']): row for row in rows}
+
+            for (location, slot_at), label in current.items():
+                row = known.get((location, slot_at))
+                if row is None:
+                    self.__conn.execute(
+                        "INSERT INTO slots (config_key, location, slot_at, label, first_seen, "
+                        "last_seen, active, initial) VALUES (?, ?, ?, ?, ?, ?, 1, ?)",
+                        (config_key, location, slot_at, label, seen, seen, initial))
+                    new_slots[location].append(label)
+                elif not row['active']:
+                    self.__conn.execute(
+                        "UPDATE slots SET active = 1, first_seen = ?, last_seen = ?, label = ?, "
+                        "initial = ? WHERE config_key = ? AND location = ? AND slot_at = ?",
+                        (seen, seen, label, initial, config_key, location, slot_at))
+                    new_slots[location].append(label)
+                else:
+                    self.__conn.execute(
+                        "UPDATE slots SET last_seen = ? "
+                        "WHERE config_key = ? AND location = ? AND slot_at = ?",
+                        (seen, config_key, location, slot_at))
+
+            keep_locations = set(keep_locations)
+            for (location, slot_at), row in known.items():
+                if location in keep_locations:
+                    continue
+                if row['active'] and (location, slot_at) not in current:
+                    self.__conn.execute(
+                        "UPDATE slots SET active = 0 "
+                        "WHERE config_key = ? AND location = ? AND slot_at = ?",
+                        (config_key, location, slot_at))
+                    gone_slots[location].append(row['label'])
+
+        logger.info('Slot store: %s new and %s gone time slot(s)',
+                    sum(map(len, new_slots.values())), sum(map(len, gone_slots.values())))
+        return new_slots, gone_slots
+
+    def get_history(self, config_key=None, since=None):
+        """
+        Returns the recorded slots, most recently appeared first.
+        Args:
+        - config_key (str): Only the slots of this configuration. Defaults to all.
+        - since (datetime): Only the slots first seen after this moment. Defaults to all.
+        Returns:
+        - list of dict: The slots with their location, datetime, label, timestamps and status.
+        """
+        query = "SELECT * FROM slots WHERE 1 = 1"
+        params = []
+        if config_key is not None:
+            query += " AND config_key = ?"
+            params.append(config_key)
+        if since is not None:
+            query += " AND first_seen >= ?"
+            params.append(since.isoformat(timespec='seconds'))
+        query += " ORDER BY first_seen DESC, slot_at"
+        with self.__lock:
+            return [dict(row) for row in self.__conn.execute(query, params).fetchall()]
+
+    def get_release_times(self, config_key, since=None):
+        """
+        Returns when the slots of a configuration were first seen, except the slots of the
+        first search since the store was opened, which were not seen being released.
+        Args:
+        - config_key (str): Identifies the search configuration.
+        - since (datetime): Only the slots first seen after this moment. Defaults to all.
+        Returns:
+        - list of datetime: The first-seen timestamps.
+        """
+        query = "SELECT first_seen FROM slots WHERE config_key = ? AND initial = 0"
+        params = [config_key]
+        if since is not None:
+            query += " AND first_seen >= ?"
+            params.append(since.isoformat(timespec='seconds'))
+        with self.__lock:
+            rows = self.__conn.execute(query, params).fetchall()
+        return [datetime.fromisoformat(row['first_seen']) for row in rows]
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        with self.__lock:
+            self.__conn.close()
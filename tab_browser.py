@@ -0,0 +1,288 @@
+"""
+TabBrowser: A class to run the searches of several configurations in the tabs of one shared
+browser, multiplexing their steps on a single thread.
+Imports:
+- time: Used to schedule the checks of each tab with a monotonic clock.
+- logging: Logging facility for Python.
+- threading: Used to run the multiplexer and hand it the searches of the worker threads.
+- collections: The queue of the searches waiting for a tab.
+- concurrent.futures: The result of each search, waited on by the worker threads.
+
+Example usage:
+browser = TabBrowser(start_chrome, close_chrome, open_tab, scan_in_tab, tabs=4)
+msg_header = browser.scan(config_instance)  # From any worker thread
+browser.close()
+"""
+import time
+import logging
+import threading
+import collections
+from concurrent.futures import Future
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class BrowserTab:
+    """
+    Represents a tab of the shared browser running a search, and what the search waits for.
+    Attributes:
+        handle (str): The window handle of the tab.
+        flow (generator): The steps of the search.
+        future (Future): The result of the search.
+        title (str): The title of the configuration, used in the log.
+        condition (callable): What the search waits for, checked on the driver.
+        timeout (float): Seconds the search waits for the condition.
+        poll (float): Seconds between two checks of the condition.
+        deadline (float): Monotonic time after which the wait times out.
+        next_check (float): Monotonic time of the next check of the condition.
+    """
+    def __init__(self, handle, flow, future, title):
+        """
+        Initializes the BrowserTab with a search that did not run any step yet.
+        """
+        self.handle = handle
+        self.flow = flow
+        self.future = future
+        self.title = title
+        self.condition = None
+        self.timeout = 0
+        self.poll = 0
+        self.deadline = 0
+        self.next_check = 0
+
+
+class TabBrowser:
+    """
+    Represents one browser serving the searches of several configurations, one tab each.
+    WebDriver commands always go to the current tab, so the tabs are driven from one thread.
+    A search is a generator: it runs its steps on the driver and yields what it waits for, a
+    condition on the driver and its (timeout, poll interval). The multiplexer switches to each
+    waiting tab in turn, checks its condition once and moves on, so the other tabs run their
+    steps while the dropdown of one is loading. A wait that times out raises TimeoutError in
+    the search. Searches queue while every tab is busy, and a finished tab is reused by the next
+    search. The browser is started on the first search, recycled once idle after max_age minutes
+    and started again when it stops answering.
+    Args:
+        factory (callable): Starts the browser.
+        close (callable): Quits the browser.
+        open_tab (callable): Opens a new tab, returning its window handle: (driver).
+        flow (callable): Creates the steps of a search, returning its result when done:
+                         (driver, config_instance).
+        tabs (int): Maximum number of tabs, searched at the same time.
+        max_age (int): Minutes after which the browser is recycled.
+    Methods:
+        submit(config_instance): Queues the search of a configuration.
+        scan(config_instance): Searches a configuration in a tab, blocking until it is done.
+        close(): Stops the multiplexer and quits the browser.
+    """
+    def __init__(self, factory, close, open_tab, flow, tabs=4, max_age=30):
+        """
+        Initializes the TabBrowser.
+        """
+        self.__factory = factory
+        self.__close = close
+        self.__open_tab = open_tab
+        self.__flow = flow
+        self.tabs = max(1, tabs)
+        self.max_age = max_age * 60
+        self.__driver = None
+        self.__started_at = 0
+        self.__free = []
+        self.__active = []
+        self.__queue = collections.deque()
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__closed = False
+
+    def submit(self, config_instance):
+        """
+        Queues the search of a configuration, starting the multiplexer on the first one.
+        Args:
+        - config_instance (YamlConfigItem): The search configuration.
+        Returns:
+        - Future: The result of the search.
+        Raises:
+        - RuntimeError: If the browser was closed.
+        """
+        future = Future()
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError('The tab browser is closed')
+            self.__queue.append((config_instance, future))
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name='siga-tabs',
+                                                 daemon=True)
+                self.__thread.start()
+            self.__condition.notify()
+        return future
+
+    def scan(self, config_instance):
+        """
+        Searches a configuration in a tab of the shared browser.
+        Args:
+        - config_instance (YamlConfigItem): The search configuration.
+        Returns:
+            The result of the search flow.
+        """
+        return self.submit(config_instance).result()
+
+    def close(self):
+        """
+        Stops the multiplexer, failing the searches still queued or running, and quits the
+        browser.
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify()
+            thread = self.__thread
+        if thread is not None:
+            thread.join(timeout=30)
+
+    def __run(self):
+        """Runs the multiplexer until the browser is closed."""
+        try:
+            while True:
+                with self.__condition:
+                    while not (self.__closed or self.__queue or self.__active):
+                        self.__condition.wait()
+                    if self.__closed:
+                        break
+                    starting = []
+                    while self.__queue and len(self.__active) + len(starting) < self.tabs:
+                        starting.append(self.__queue.popleft())
+                if not self.__active and not starting:
+                    continue
+                if not self.__active and self.__driver is not None and \
+                        time.monotonic() - self.__started_at > self.max_age:
+                    logger.info('Recycling the tab browser after %s minutes', self.max_age // 60)
+                    self.__quit()
+                for config_instance, future in starting:
+                    self.__start(config_instance, future)
+                delay = self.__check_due()
+                if delay:
+                    with self.__condition:
+                        if not (self.__closed or
+                                (self.__queue and len(self.__active) < self.tabs)):
+                            self.__condition.wait(delay)
+        finally:
+            with self.__condition:
+                queued = list(self.__queue)
+                self.__queue.clear()
+            for _, future in queued:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(RuntimeError('The tab browser is closed'))
+            self.__quit(RuntimeError('The tab browser is closed'))
+
+    def __start(self, config_instance, future):
+        """Starts a search in a free tab, opening one when none is free."""
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            driver = self.__get_driver()
+            handle = self.__free.pop() if self.__free else self.__open_tab(driver)
+            driver.switch_to.window(handle)
+            flow = self.__flow(driver, config_instance)
+        except Exception as ex: # pylint: disable=broad-except
+            logger.error('Could not open a tab for %s: %s', config_instance.title, ex)
+            future.set_exception(ex)
+            self.__check_browser(ex)
+            return
+        logger.debug('Searching %s in tab %s (%s of %s busy)', config_instance.title, handle,
+                     len(self.__active) + 1, self.tabs)
+        tab = BrowserTab(handle, flow, future, config_instance.title)
+        self.__active.append(tab)
+        self.__advance(tab)
+
+    def __check_due(self):
+        """
+        Checks the condition of every tab whose next check is due.
+        Returns:
+        - float: Seconds until the next check, or None when no tab is searching.
+        """
+        now = time.monotonic()
+        for tab in [tab for tab in self.__active if tab.next_check <= now]:
+            if tab not in self.__active:
+                # Failed with the browser while checking another tab
+                continue
+            try:
+                self.__driver.switch_to.window(tab.handle)
+                value = tab.condition(self.__driver)
+            except Exception as ex: # pylint: disable=broad-except
+                self.__advance(tab, error=ex)
+                continue
+            if value:
+                self.__advance(tab, value)
+            elif time.monotonic() >= tab.deadline:
+                self.__advance(tab, error=TimeoutError(
+                    f'Condition not met after {tab.timeout}s in the tab of {tab.title}'))
+            else:
+                tab.next_check = time.monotonic() + tab.poll
+        if not self.__active:
+            return None
+        return max(0, min(tab.next_check for tab in self.__active) - time.monotonic())
+
+    def __advance(self, tab, value=None, error=None):
+        """Runs the steps of a search up to its next wait, or finishes it."""
+        try:
+            if error is not None:
+                request = tab.flow.throw(error)
+            else:
+                request = tab.flow.send(value)
+        except StopIteration as stop:
+            self.__finish(tab, result=stop.value)
+            return
+        except Exception as ex: # pylint: disable=broad-except
+            self.__finish(tab, error=ex)
+            return
+        tab.condition, (tab.timeout, tab.poll) = request
+        # Checked at once on the next pass, as WebDriverWait does before its first poll
+        tab.next_check = time.monotonic()
+        tab.deadline = tab.next_check + tab.timeout
+
+    def __finish(self, tab, result=None, error=None):
+        """Gives the result of a search and frees its tab."""
+        self.__active.remove(tab)
+        if error is None:
+            self.__free.append(tab.handle)
+            tab.future.set_result(result)
+            return
+        logger.error('Search of %s failed in its tab: %s', tab.title, error)
+        tab.future.set_exception(error)
+        self.__check_browser(error)
+
+    def __check_browser(self, error):
+        """Quits the browser when it stopped answering, else drops the tabs that were closed."""
+        if self.__driver is None:
+            return
+        try:
+            handles = set(self.__driver.window_handles)
+        except Exception: # pylint: disable=broad-except
+            logger.warning('The tab browser stopped answering, it will be started again')
+            self.__quit(error)
+            return
+        self.__free = [handle for handle in self.__free if handle in handles]
+
+    def __get_driver(self):
+        """Gets the browser, starting it when needed, with its first tab free."""
+        if self.__driver is None:
+            self.__driver = self.__factory()
+            self.__started_at = time.monotonic()
+            self.__free = [self.__driver.current_window_handle]
+        return self.__driver
+
+    def __quit(self, error=None):
+        """Quits the browser, failing the searches still running in its tabs."""
+        for tab in self.__active:
+            tab.flow.close()
+            tab.future.set_exception(error or RuntimeError('The tab browser was recycled'))
+        self.__active = []
+        self.__free = []
+        if self.__driver is None:
+            return
+        driver, self.__driver = self.__driver, None
+        try:
+            self.__close(driver)
+        except Exception as ex: # pylint: disable=broad-except
+            logger.warning('Could not quit the tab browser: %s', ex)
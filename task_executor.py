@@ -0,0 +1,104 @@
+"""
+TaskExecutor: A class to run the scheduled searches on a bounded pool of worker threads.
+Imports:
+- logging: Logging facility for Python.
+- threading: Used for the per-configuration concurrency limits.
+- concurrent.futures: Provides the bounded thread pool.
+
+Example usage:
+executor = TaskExecutor(max_workers=4)
+executor.submit(config_instance, task, config_instance)
+executor.shutdown()
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Configure logging
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class TaskExecutor:
+    """
+    Represents a bounded pool of worker threads that never runs the same key more than
+    a given number of times at once.
+    Args:
+        max_workers (int): Maximum number of searches running at the same time.
+        per_key_limit (int): Maximum number of concurrent runs of the same key.
+    Methods:
+        submit(key, fn, *args): Runs fn on a worker unless the key is at its limit.
+        get_running(key): Gets the number of runs of the key in progress.
+        shutdown(wait): Stops the workers.
+    """
+    def __init__(self, max_workers=4, per_key_limit=1):
+        """
+        Initializes the TaskExecutor.
+        Args:
+        - max_workers (int): Maximum number of searches running at the same time.
+        - per_key_limit (int): Maximum number of concurrent runs of the same key.
+        """
+        self.max_workers = max(1, max_workers)
+        self.per_key_limit = max(1, per_key_limit)
+        self.__pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                         thread_name_prefix='siga-task')
+        self.__running = {}
+        self.__lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Runs fn on a worker thread, skipping it when the key is already at its limit.
+        Args:
+        - key: Identifies the work, usually the configuration instance.
+        - fn (callable): The function to run.
+        Returns:
+        - Future or None: The future of the run, or None if it was skipped.
+        """
+        with self.__lock:
+            running = self.__running.get(key, 0)
+            if running >= self.per_key_limit:
+                logger.warning('Skipping %s: previous run still in progress', fn.__name__)
+                return None
+            self.__running[key] = running + 1
+
+        try:
+            future = self.__pool.submit(fn, *args, **kwargs)
+        except RuntimeError:
+            self.__done(key)
+            raise
+        future.add_done_callback(lambda f: self.__done(key, f))
+        return future
+
+    def get_running(self, key):
+        """
+        Gets the number of runs of a key in progress. A run is counted until its key is freed,
+        which happens after its future has resolved.
+        Args:
+        - key: Identifies the work.
+        Returns:
+        - int: The runs of the key that were not freed yet.
+        """
+        with self.__lock:
+            return self.__running.get(key, 0)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers.
+        Args:
+        - wait (bool): Wait for the running searches to finish.
+        """
+        self.__pool.shutdown(wait=wait, cancel_futures=True)
+
+    def __done(self, key, future=None):
+        """
+        Frees a run of the key and logs unexpected errors of the finished run.
+        """
+        with self.__lock:
+            running = self.__running.get(key, 1) - 1
+            if running > 0:
+                self.__running[key] = running
+            else:
+                self.__running.pop(key, None)
+        if future is not None and not future.cancelled() and future.exception() is not None:
+            logger.error('Task failed: %s', future.exception(),
+                         exc_info=future.exception())
@@ -0,0 +1,9 @@
+"""
+Shared fixtures of the tests: the modules of the repository root are imported as siga.py does.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
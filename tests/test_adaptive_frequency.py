@@ -0,0 +1,84 @@
+"""Tests of the intervals learned from the release times by the AdaptiveFrequency."""
+from datetime import datetime
+
+import pytest
+
+from adaptive_frequency import AdaptiveFrequency
+
+DAY = datetime(2026, 3, 2)
+
+
+class FakeStore:
+    """Returns the same release times for every configuration, counting the reads."""
+    def __init__(self, *release_times):
+        self.release_times = list(release_times)
+        self.reads = 0
+
+    def get_release_times(self, config_key, since=None):
+        self.reads += 1
+        return [moment for moment in self.release_times if since is None or moment >= since]
+
+
+def at(hour, minute=0, day=1):
+    return DAY.replace(day=day, hour=hour, minute=minute)
+
+
+def test_without_history_the_frequency_is_kept():
+    adaptive = AdaptiveFrequency(FakeStore())
+    assert adaptive.get_interval('job', ['a'], 5, 2, 15, now=at(10)) == 5
+    assert adaptive.get_interval('job', ['a'], 5, 6, 15, now=at(10)) == 6
+    assert adaptive.get_interval('job', ['a'], 20, 2, 15, now=at(10)) == 15
+
+
+@pytest.mark.parametrize('moment, expected', [
+    (at(10, 5), 2.0),    # In the bucket of the releases: the shortest interval
+    (at(9, 45), 2.0),    # The bucket just before them
+    (at(15, 0), 10.0),   # A quiet bucket: twice the frequency
+])
+def test_interval_follows_the_release_times(moment, expected):
+    adaptive = AdaptiveFrequency(FakeStore(*[at(10, 10 + i) for i in range(5)]))
+    assert adaptive.get_interval('job', ['a'], 5, 2, 15, now=moment) == pytest.approx(expected)
+
+
+def test_interval_is_proportional_between_the_bounds():
+    # Releases spread over every bucket but one, which gets twice the average
+    releases = [at(hour, minute) for hour in range(24) for minute in (0, 30)] + [at(10, 1)]
+    adaptive = AdaptiveFrequency(FakeStore(*releases))
+    mean = len(releases) / 48
+    assert adaptive.get_interval('job', ['a'], 6, 1, 30, now=at(9, 35)) == \
+        pytest.approx(6 * 2 * mean / (2 + mean))
+
+
+@pytest.mark.parametrize('bucket_minutes', [7, 25, 45])
+def test_buckets_that_do_not_divide_the_day(bucket_minutes):
+    adaptive = AdaptiveFrequency(FakeStore(at(0, 1), at(12, 0)), bucket_minutes=bucket_minutes)
+    # The last minutes of the day are counted in the first bucket, with the releases at 00:01
+    assert adaptive.get_interval('job', ['a'], 5, 1, 15, now=at(23, 59)) < 5
+
+
+def test_old_releases_are_not_counted():
+    adaptive = AdaptiveFrequency(FakeStore(at(10, 10, day=1)), history_days=14)
+    assert adaptive.get_interval('job', ['a'], 5, 2, 15, now=at(10, 5, day=20)) == 5
+
+
+def test_budget_stretches_the_intervals_within_the_bounds():
+    adaptive = AdaptiveFrequency(FakeStore(), scan_budget=40)
+    assert adaptive.get_interval('a', ['a'], 2, 1, 15, now=at(10)) == 2
+    # 30 + 30 searches per hour, over the budget of 40
+    assert adaptive.get_interval('b', ['b'], 2, 1, 15, now=at(10)) == pytest.approx(3)
+    # 30 + 20 + 60 searches per hour: stretched to 2.75 minutes, but never past the bound
+    assert adaptive.get_interval('c', ['c'], 1, 1, 2, now=at(10)) == 2
+    adaptive.forget('b')
+    adaptive.forget('c')
+    assert adaptive.get_interval('a', ['a'], 2, 1, 15, now=at(10)) == 2
+
+
+def test_profile_is_read_again_after_the_refresh():
+    store = FakeStore(at(10, 10))
+    adaptive = AdaptiveFrequency(store, refresh=600)
+    adaptive.get_profile('job', ['a', 'b'], now=at(10))
+    adaptive.get_profile('job', ['a', 'b'], now=at(10, 9))
+    assert store.reads == 2
+    profile = adaptive.get_profile('job', ['a', 'b'], now=at(10, 10))
+    assert store.reads == 4
+    assert profile[20] == 2 and sum(profile) == 2
@@ -0,0 +1,106 @@
+"""Tests of the time windows, intervals and jitter of the AsyncScheduler jobs."""
+import asyncio
+from datetime import datetime, time as dt_time
+
+import pytest
+
+from async_scheduler import AsyncScheduler, ScheduledJob, in_time_window, next_eligible
+from yaml_loader import YamlLoader
+
+DAY = dt_time(7, 0), dt_time(23, 59)
+NIGHT = dt_time(22, 0), dt_time(2, 0)
+
+
+@pytest.mark.parametrize('moment, window, expected', [
+    (datetime(2026, 3, 2, 12, 0), DAY, datetime(2026, 3, 2, 12, 0)),
+    (datetime(2026, 3, 2, 6, 30), DAY, datetime(2026, 3, 2, 7, 0)),
+    (datetime(2026, 3, 2, 23, 59, 30), DAY, datetime(2026, 3, 2, 23, 59, 30)),
+    (datetime(2026, 3, 2, 0, 10), DAY, datetime(2026, 3, 2, 7, 0)),
+    (datetime(2026, 3, 2, 23, 0), NIGHT, datetime(2026, 3, 2, 23, 0)),
+    (datetime(2026, 3, 2, 1, 30), NIGHT, datetime(2026, 3, 2, 1, 30)),
+    (datetime(2026, 3, 2, 2, 0, 45), NIGHT, datetime(2026, 3, 2, 2, 0, 45)),
+    (datetime(2026, 3, 2, 12, 0), NIGHT, datetime(2026, 3, 2, 22, 0)),
+])
+def test_next_eligible(moment, window, expected):
+    assert next_eligible(moment, *window) == expected
+    assert in_time_window(moment, *window) == (moment == expected)
+
+
+def test_next_eligible_after_the_end_is_the_next_day():
+    assert next_eligible(datetime(2026, 3, 2, 20, 0), dt_time(7, 0), dt_time(19, 0)) == \
+        datetime(2026, 3, 3, 7, 0)
+
+
+def write_config(tmp_path, start_time, end_time):
+    path = tmp_path / 'config.yaml'
+    path.write_text(f"""- search:
+    title: Night
+    start_time: '{start_time}'
+    end_time: '{end_time}'
+    max_days: 30
+    frequency: 5
+    entity_opt: 176
+    service_opt: {{tema: 22002, subtema: 22003, motivo: 22705}}
+    location_opt: {{distrito: 11, localidade: 17, local_atendimento: 591}}
+""", encoding='utf8')
+    return str(path)
+
+
+def test_config_window_matches_the_scheduler(tmp_path):
+    config_instance = YamlLoader(write_config(tmp_path, '22:00', '02:00')).get_instances()[0]
+    for hour in range(24):
+        moment = datetime(2026, 3, 2, hour, 30)
+        assert config_instance.in_window(moment) == \
+            in_time_window(moment, config_instance.start_time, config_instance.end_time)
+    assert config_instance.in_window(datetime(2026, 3, 2, 23, 0))
+    assert config_instance.in_window(datetime(2026, 3, 3, 1, 0))
+    assert not config_instance.in_window(datetime(2026, 3, 2, 12, 0))
+
+
+def test_first_run_waits_one_interval():
+    now = datetime(2026, 3, 2, 12, 0)
+    job = ScheduledJob('tag', 5, print, ())
+    assert job.compute_next_run(now) == datetime(2026, 3, 2, 12, 5)
+    job.last_run = datetime(2026, 3, 2, 12, 5)
+    assert job.compute_next_run(datetime(2026, 3, 2, 12, 6)) == datetime(2026, 3, 2, 12, 10)
+    # A late run is not made up for
+    assert job.compute_next_run(datetime(2026, 3, 2, 12, 30)) == datetime(2026, 3, 2, 12, 30)
+
+
+def test_next_run_is_moved_into_the_window_and_asks_the_interval():
+    intervals = iter([5, 60])
+    job = ScheduledJob('tag', lambda: next(intervals), print, (), '07:00', '12:00')
+    assert job.compute_next_run(datetime(2026, 3, 2, 6, 0)) == datetime(2026, 3, 2, 7, 0)
+    job.last_run = datetime(2026, 3, 2, 11, 30)
+    assert job.compute_next_run(datetime(2026, 3, 2, 11, 31)) == datetime(2026, 3, 3, 7, 0)
+
+
+def test_jitter_is_added_within_bounds():
+    now = datetime(2026, 3, 2, 12, 0)
+    job = ScheduledJob('tag', 5, print, (), jitter=30)
+    delays = {(job.compute_next_run(now) - now).total_seconds() for _ in range(50)}
+    assert all(300 <= delay <= 330 for delay in delays) and len(delays) > 1
+
+
+def test_replaced_job_keeps_its_last_run():
+    scheduler = AsyncScheduler()
+    job = scheduler.add_job('tag', 5, print)
+    job.last_run = datetime(2026, 3, 2, 12, 0)
+    assert scheduler.add_job('tag', 10, print).last_run == job.last_run
+    assert scheduler.remove_job('tag') and not scheduler.get_jobs()
+
+
+def test_run_submits_the_due_jobs_and_stops():
+    runs = []
+    scheduler = AsyncScheduler()
+    scheduler.add_job('tag', 0, runs.append, 'run')
+
+    async def main():
+        async def stop_after_runs():
+            while len(runs) < 2:
+                await asyncio.sleep(0.01)
+            scheduler.stop()
+        await scheduler.run(stop_after_runs())
+
+    asyncio.run(asyncio.wait_for(main(), timeout=5))
+    assert runs[:2] == ['run', 'run']
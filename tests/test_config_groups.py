@@ -0,0 +1,33 @@
+"""Tests of the grouping of the configurations sharing their first steps."""
+from types import SimpleNamespace
+
+import pytest
+
+import siga
+from yaml_loader import YamlConfigItem
+
+
+def config(localidade, **search):
+    return YamlConfigItem({'search': {
+        'title': f'Local {localidade}', 'entity_opt': 176, 'frequency': 3,
+        'service_opt': {'tema': 22002, 'subtema': 22003, 'motivo': 22705},
+        'location_opt': {'distrito': 11, 'localidade': localidade}, **search}})
+
+
+def env(sticky_sessions=False, browser_tabs=0):
+    return SimpleNamespace(sticky_sessions=sticky_sessions, browser_tabs=browser_tabs)
+
+
+def test_configurations_sharing_the_service_are_grouped(monkeypatch):
+    monkeypatch.setattr(siga, 'ENV_VARS', env())
+    configs = [config(17), config(6), config(10, frequency=5), config(12, engine='http')]
+    assert [[c.title for c in group] for group in siga.group_by_prefix(configs)] == \
+        [['Local 17', 'Local 6'], ['Local 10'], ['Local 12']]
+
+
+@pytest.mark.parametrize('settings', [env(sticky_sessions=True), env(browser_tabs=4)])
+def test_nothing_is_grouped_with_sticky_sessions_or_tabs(monkeypatch, settings):
+    monkeypatch.setattr(siga, 'ENV_VARS', settings)
+    configs = [config(17), config(6)]
+    assert [[c.title for c in group] for group in siga.group_by_prefix(configs)] == \
+        [['Local 17'], ['Local 6']]
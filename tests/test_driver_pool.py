@@ -0,0 +1,84 @@
+"""Tests of the DriverPool leases, affinities and holds, with fake drivers."""
+import time
+
+from driver_pool import DriverPool
+
+
+class FakeDriver:
+    """A WebDriver answering the health check, counting its resets."""
+    started = 0
+
+    def __init__(self):
+        FakeDriver.started += 1
+        self.name = FakeDriver.started
+        self.resets = 0
+        self.quit_called = False
+        self.window_handles = ['main']
+        self.current_url = 'about:blank'
+
+    def quit(self):
+        self.quit_called = True
+
+
+def reset(driver):
+    driver.resets += 1
+
+
+def new_pool(**kwargs):
+    return DriverPool(FakeDriver, reset, **kwargs)
+
+
+def test_release_resets_and_reuses_the_driver():
+    pool = new_pool(size=1)
+    with pool.lease() as first:
+        pass
+    with pool.lease() as second:
+        assert second is first
+    assert first.resets == 2
+    pool.close()
+
+
+def test_affinity_keeps_the_page():
+    pool = new_pool(size=2)
+    with pool.lease('a') as driver:
+        pass
+    with pool.lease('a') as again:
+        assert again is driver
+    assert driver.resets == 0
+    pool.close()
+
+
+def test_held_driver_is_not_leased_nor_reset_with_a_full_pool():
+    pool = new_pool(size=1)
+    with pool.lease() as held:
+        pool.hold(held, 600)
+    with pool.lease() as other:
+        assert other is not held
+    with pool.lease('sticky') as sticky:
+        assert sticky is not held
+    assert held.resets == 0 and not held.quit_called
+    pool.close()
+
+
+def test_held_driver_is_not_recycled():
+    pool = new_pool(size=1, max_uses=1)
+    with pool.lease() as held:
+        pool.hold(held, 600)
+    assert not held.quit_called
+    with pool.lease() as other:
+        assert other is not held
+    assert not held.quit_called
+    pool.close()
+
+
+def test_extra_driver_is_quit_once_the_hold_is_over():
+    pool = new_pool(size=1)
+    with pool.lease() as held:
+        pool.hold(held, 0.05)
+    with pool.lease() as extra:
+        time.sleep(0.1)
+    assert extra.quit_called
+    with pool.lease() as driver:
+        # Reset from the booking page before its first lease after the hold
+        assert driver is held and held.resets == 1
+    pool.close()
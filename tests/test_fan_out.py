@@ -0,0 +1,160 @@
+"""Tests of the merged results, the failed service desks and the discovery of the FanOutScanner."""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fan_out import FanOutScanner, merge_results
+from notif_data import NotificationData
+from slot_store import SlotStore
+from yaml_loader import YamlConfigItem
+
+CONFIG = YamlConfigItem({'search': {
+    'title': 'Lisboa', 'fan_out': True, 'entity_opt': 176,
+    'service_opt': {'tema': 22002, 'subtema': 22003, 'motivo': 22705},
+    'location_opt': {'distrito': 11, 'localidade': -1}}})
+# The dropdown labels, which are not the titles of the schedule lists of the results page
+LOCATIONS = {17: {'label': 'Lisboa', 'desks': {591: 'Laranjeiras'}},
+             6: {'label': 'Cascais', 'desks': {889: 'Cascais'}}}
+TITLES = {591: 'Loja do Cidadão Laranjeiras', 889: 'Conservatória de Cascais'}
+
+
+def msg_header(local, time_slots, timings=None):
+    header = NotificationData()
+    header.set_local(local)
+    header.set_time_slots(time_slots)
+    header.set_results_read(True)
+    for step, seconds in (timings or {}).items():
+        header.set_step_timing(step, seconds)
+    return header
+
+
+class FakeSite:
+    """Answers the search of each service desk, unless it is down."""
+    def __init__(self):
+        self.down = set()
+        self.searched = []
+
+    def scan(self, config_instance):
+        desk = config_instance.location_opt['local_atendimento']
+        self.searched.append(desk)
+        if desk in self.down:
+            raise TimeoutError('Results page not loaded')
+        return msg_header(config_instance.location_opt['localidade'],
+                          {TITLES[desk]: [f'0{desk % 9 + 1}-03-2026 10:00']})
+
+
+def test_merge_results():
+    merged = merge_results(
+        [msg_header('17', {'A': ['02-03-2026 10:00']}, {'step_three': 2.0}),
+         msg_header('6', {}, {'step_three': 3.5}),
+         msg_header('17', {'A': ['02-03-2026 10:00', '03-03-2026 10:00'],
+                           'B': ['04-03-2026 09:00']}, {'step_three': 1.0})],
+        ['Lisboa', 'Cascais', 'Lisboa'])
+    assert merged.get_time_slots() == {'A': ['02-03-2026 10:00', '03-03-2026 10:00'],
+                                       'B': ['04-03-2026 09:00']}
+    assert merged.get_local() == 'Lisboa'
+    assert merged.get_step_timings() == {'step_three': 3.5}
+
+
+def test_merge_results_without_slots_names_the_first_local():
+    merged = merge_results([msg_header('17', {}), msg_header('6', {})], ['Lisboa', 'Cascais'])
+    assert merged.get_local() == 'Lisboa'
+    assert merged.get_time_slots() == {}
+
+
+def test_failed_desk_is_retried_and_named_by_its_dropdown_label():
+    site = FakeSite()
+    site.down.add(889)
+    scanner = FanOutScanner(lambda c: LOCATIONS, site.scan, workers=2, retries=1)
+    msg, failed = scanner.scan(CONFIG)
+    assert sorted(site.searched) == [591, 889, 889]
+    assert failed == ['Cascais']
+    assert list(msg.get_time_slots()) == [TITLES[591]]
+
+
+def test_desk_that_did_not_reach_the_results_is_failed():
+    site = FakeSite()
+    scan = site.scan
+
+    def without_results(config_instance):
+        header = scan(config_instance)
+        if config_instance.location_opt['local_atendimento'] == 889:
+            header.set_time_slots({})
+            header.set_results_read(False)
+        return header
+    scanner = FanOutScanner(lambda c: LOCATIONS, without_results, workers=2, retries=0)
+    msg, failed = scanner.scan(CONFIG)
+    assert failed == ['Cascais']
+    assert msg.get_results_read()
+
+
+def test_failed_desk_keeps_its_slots_in_the_store():
+    site = FakeSite()
+    store = SlotStore(':memory:')
+    scanner = FanOutScanner(lambda c: LOCATIONS, site.scan, workers=2, retries=0)
+
+    msg, failed = scanner.scan(CONFIG)
+    new_slots, _ = store.update(CONFIG.key, msg.get_time_slots(), keep_locations=failed,
+                                seen_at=datetime(2026, 3, 1, 10, 0))
+    assert not failed
+    assert sorted(new_slots) == sorted(TITLES.values())
+
+    site.down.add(889)
+    msg, failed = scanner.scan(CONFIG)
+    assert failed == ['Cascais', TITLES[889]]
+    new_slots, gone_slots = store.update(CONFIG.key, msg.get_time_slots(),
+                                         keep_locations=failed,
+                                         seen_at=datetime(2026, 3, 1, 10, 5))
+    assert not new_slots
+    assert not gone_slots
+    store.close()
+
+
+def district(distrito):
+    return CONFIG.replace(location_opt={'distrito': distrito, 'localidade': -1})
+
+
+def test_districts_are_discovered_at_the_same_time():
+    started = threading.Barrier(2, timeout=5)
+
+    def discover(config_instance):
+        # Both discoveries must be running for either to pass the barrier
+        started.wait()
+        return LOCATIONS
+    scanner = FanOutScanner(discover, FakeSite().scan)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(scanner.get_locations, [district(11), district(13)]))
+    assert results == [LOCATIONS, LOCATIONS]
+
+
+def test_same_district_is_discovered_once():
+    release = threading.Event()
+    calls = []
+
+    def discover(config_instance):
+        calls.append(config_instance.location_opt['distrito'])
+        release.wait(5)
+        return LOCATIONS
+    scanner = FanOutScanner(discover, FakeSite().scan)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(scanner.get_locations, CONFIG) for _ in range(3)]
+        while not calls:
+            time.sleep(0.001)
+        release.set()
+        assert [future.result(5) for future in futures] == [LOCATIONS] * 3
+    assert calls == [11]
+    assert scanner.get_locations(CONFIG) == LOCATIONS and calls == [11]
+
+
+def test_failed_discovery_is_tried_again():
+    answers = [RuntimeError('browser crashed'), LOCATIONS]
+
+    def discover(config_instance):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    scanner = FanOutScanner(discover, FakeSite().scan)
+    assert scanner.get_locations(CONFIG) == {}
+    assert scanner.get_locations(CONFIG) == LOCATIONS
@@ -0,0 +1,223 @@
+"""
+Tests of the fast claim: the claim rules, the encrypted profile, the claim flow on the booking
+forms of the mock site, and the browser claim of the Selenium engine when a browser is available.
+"""
+import re
+import shutil
+from datetime import datetime
+
+import pytest
+import requests
+
+import mock_siga
+from fast_claim import ClaimError, ClaimRules, FastClaimer, encrypt_profile, load_profile, \
+    new_profile_key
+from http_engine import HttpScanEngine, SigaPageParser
+from scan_benchmark import write_configs
+from yaml_loader import YamlLoader
+
+NOW = datetime(2026, 3, 2, 8, 0)
+TIME_SLOTS = {'Loja do Cidadão Laranjeiras': ['03-03-2026 16:00', '10:00 - 05-03-2026'],
+              'Conservatória de Cascais': ['02-03-2026 09:00', '20-04-2026 11:00']}
+
+
+def test_select_earliest_slot():
+    assert ClaimRules({}).select(TIME_SLOTS, NOW) == ('Conservatória de Cascais',
+                                                      '02-03-2026 09:00')
+
+
+def test_select_preferred_desk_before_the_earliest():
+    rules = ClaimRules({'earliest': False, 'desks': ['laranjeiras', 'cascais']})
+    assert rules.select(TIME_SLOTS, NOW) == ('Loja do Cidadão Laranjeiras', '03-03-2026 16:00')
+
+
+def test_select_within_the_hours_and_days():
+    rules = ClaimRules({'start_time': '15:00', 'end_time': '18:00', 'max_days': 7})
+    assert rules.select(TIME_SLOTS, NOW) == ('Loja do Cidadão Laranjeiras', '03-03-2026 16:00')
+    assert ClaimRules({'desks': ['porto']}).select(TIME_SLOTS, NOW) is None
+    assert ClaimRules({'max_days': 0}).select(TIME_SLOTS, datetime(2026, 3, 2, 10)) is None
+
+
+@pytest.fixture(name='profile')
+def fixture_profile(tmp_path):
+    pytest.importorskip('cryptography')
+    source = tmp_path / 'profile.yaml'
+    source.write_text("Nome: Test\nEmail: test@example.com\nTelemovel: '910000000'\n"
+                      "NumeroDocumento: '00000000'\n", encoding='utf8')
+    key = new_profile_key()
+    encrypt_profile(str(source), str(tmp_path / 'profile.enc'), key)
+    return str(tmp_path / 'profile.enc'), key
+
+
+def test_profile_round_trip(profile, tmp_path):
+    path, key = profile
+    assert load_profile(path, key)['Telemovel'] == '910000000'
+    assert b'Test' not in (tmp_path / 'profile.enc').read_bytes()
+    with pytest.raises(ClaimError):
+        load_profile(path, new_profile_key())
+    with pytest.raises(ClaimError):
+        load_profile(str(tmp_path / 'missing.enc'), key)
+
+
+def test_profile_must_be_a_mapping(tmp_path):
+    pytest.importorskip('cryptography')
+    source = tmp_path / 'profile.yaml'
+    source.write_text('- Nome\n', encoding='utf8')
+    with pytest.raises(ClaimError):
+        encrypt_profile(str(source), str(tmp_path / 'profile.enc'), new_profile_key())
+
+
+@pytest.fixture(name='server')
+def fixture_server():
+    server = mock_siga.MockSigaServer().start()
+    yield server
+    server.stop()
+
+
+def claim_on_mock(url):
+    """
+    Claims a slot by posting the booking forms of the mock site: the FastClaimer flow without a
+    browser. The browser claim of the Selenium engine is tested by test_browser_claim_*.
+    """
+    desks = {title: desk for desks in mock_siga.SERVICE_DESKS.values()
+             for desk, title in desks.items()}
+    base = url.split(mock_siga.ENTITIES_PATH)[0]
+
+    def claim(session, config_instance, location, label, profile, confirm):
+        session.get(url, timeout=5)
+        fields = {'IdEntidade': config_instance.entity_opt,
+                  'IdLocalAtendimento': desks[location], 'Horario': label}
+        page = session.post(base + '/Marcacao/Passo4', data=fields, timeout=5).text
+        if 'formPasso4' not in page:
+            return False
+        if confirm:
+            page = session.post(base + '/Marcacao/Passo5', data={**fields, **profile},
+                                timeout=5).text
+            return 'confirmation' in page
+        return True
+
+    return claim
+
+
+def scan(server, config_instance):
+    msg_header, time_slots = HttpScanEngine(base_url=server.url).scan(config_instance)
+    msg_header.set_time_slots(time_slots)
+    return msg_header
+
+
+def test_claim_holds_then_confirms_on_the_mock_site(server, profile, tmp_path):
+    config_instance = YamlLoader(write_configs(1, str(tmp_path), claim=True)).get_instances()[0]
+    msg_header = scan(server, config_instance)
+    assert msg_header.get_time_slots()
+
+    held = []
+    holder = FastClaimer(claim_on_mock(server.url), *profile,
+                         hold=lambda driver, seconds: held.append(seconds))
+    result = holder.claim(requests.Session(), config_instance, msg_header)
+    assert result is not None and not result['confirmed']
+    assert held == [600] and not server.bookings
+    # The same slot is not claimed twice
+    assert holder.claim(requests.Session(), config_instance, msg_header) is None
+
+    notified = []
+    booker = FastClaimer(claim_on_mock(server.url), *profile, confirm=True,
+                         notify=lambda header, claim: notified.append(claim))
+    result = booker.claim(requests.Session(), config_instance, msg_header)
+    assert result['confirmed'] and notified == [result]
+    assert [(b['slot'], b['Nome']) for b in server.bookings] == [(result['label'], 'Test')]
+    assert result['label'] not in scan(server, config_instance).get_time_slots()[
+        result['location']]
+    # A confirmed booking stops the claims of its service
+    assert booker.claim(requests.Session(), config_instance,
+                        scan(server, config_instance)) is None
+
+
+def test_failed_claim_is_not_held(server, profile, tmp_path):
+    config_instance = YamlLoader(write_configs(1, str(tmp_path), claim=True)).get_instances()[0]
+    msg_header = scan(server, config_instance)
+    held = []
+    claimer = FastClaimer(lambda *args: False, *profile,
+                          hold=lambda driver, seconds: held.append(seconds))
+    assert claimer.claim(requests.Session(), config_instance, msg_header) is None
+    assert not held
+
+
+def test_claim_scripts_match_the_booking_pages(server):
+    """The selectors of CLICK_SLOT_SCRIPT, FILL_FORM_SCRIPT and the next button, on the mock."""
+    selenium_engine = pytest.importorskip('selenium_engine')
+    base = server.url.split(mock_siga.ENTITIES_PATH)[0]
+    desk = '591'
+    label = mock_siga.slot_labels(desk)[0]
+    session = requests.Session()
+    session.get(server.url, timeout=5)
+
+    results = session.post(base + '/Marcacao/Passo3',
+                           data={'IdLocalidade': '17', 'IdLocalAtendimento': desk}, timeout=5).text
+    # CLICK_SLOT_SCRIPT: the slots of div[class="schedule-list"], by title and span text
+    assert 'div[class="schedule-list"] div[class^="col-md-5 m-"]' in \
+        selenium_engine.CLICK_SLOT_SCRIPT
+    assert re.search(r'<div class="schedule-list"><div class="col-md-5 m-[^"]*" title="'
+                     + re.escape(mock_siga.SERVICE_DESKS['17'][desk]) + r'"><a [^>]*><span>'
+                     + re.escape(label) + '</span>', results)
+
+    fields = {'IdLocalAtendimento': desk, 'Horario': label}
+    details = session.post(base + '/Marcacao/Passo4', data=fields, timeout=5).text
+    page = SigaPageParser()
+    page.feed(details)
+    form = page.get_form_with('Nome')
+    # FILL_FORM_SCRIPT fills the fields by name; the profile has one per field of the form
+    assert all(name in form.fields for name in mock_siga.DETAILS_FIELDS)
+    assert '//li[@id=\'liProximoButton\']//a[@class=\'set-date-button\']' == \
+        selenium_engine.NEXT_BUTTON_XPATH
+    assert '<li id="liProximoButton">\n<a class="set-date-button"' in details
+
+    details = {name: 'x' for name in mock_siga.DETAILS_FIELDS}
+    confirmed = session.post(base + '/Marcacao/Passo5', data={**fields, **details},
+                             timeout=5).text
+    assert 'error-message' not in confirmed
+    refused = session.post(base + '/Marcacao/Passo5', data={**fields, **details},
+                           timeout=5).text
+    assert 'class="error-message"' in refused
+
+
+@pytest.fixture(name='browser')
+def fixture_browser(server, tmp_path, monkeypatch):
+    """A headless browser of the Selenium engine on the mock site, skipped without Chrome."""
+    selenium_engine = pytest.importorskip('selenium_engine')
+    if not any(shutil.which(name) for name in ('google-chrome', 'google-chrome-stable',
+                                               'chromium', 'chromium-browser', 'chrome')):
+        pytest.skip('No Chrome or Chromium to run the browser claim')
+    from driver_manifest import DriverManifest # pylint: disable=import-outside-toplevel
+    from screenshots import ScreenshotRecorder # pylint: disable=import-outside-toplevel
+    monkeypatch.setattr(selenium_engine, 'SIGA_URL', server.url)
+    monkeypatch.setattr(selenium_engine, 'SCREENSHOTS', ScreenshotRecorder(policy='off'))
+    monkeypatch.setattr(selenium_engine, 'DRIVER_MANIFEST',
+                        DriverManifest(str(tmp_path / 'driver_manifest.json')))
+    try:
+        driver = selenium_engine.start_chrome()
+    except Exception as ex: # pylint: disable=broad-except
+        pytest.skip(f'No webdriver to run the browser claim: {ex}')
+    yield selenium_engine, driver
+    selenium_engine.close_chrome(driver)
+
+
+def test_browser_claim_holds_then_confirms_on_the_mock_site(server, profile, browser, tmp_path):
+    selenium_engine, driver = browser
+    config_instance = YamlLoader(write_configs(1, str(tmp_path), claim=True)).get_instances()[0]
+    msg_header = selenium_engine.check_schedule(driver, config_instance)
+    assert msg_header.get_time_slots()
+
+    held = []
+    holder = FastClaimer(selenium_engine.claim_slot, *profile,
+                         hold=lambda driver, seconds: held.append(seconds))
+    result = holder.claim(driver, config_instance, msg_header)
+    assert result is not None and not result['confirmed']
+    assert held == [600] and not server.bookings
+    assert driver.find_element('name', 'Telemovel').get_attribute('value') == '910000000'
+
+    selenium_engine.reset_chrome(driver)
+    msg_header = selenium_engine.check_schedule(driver, config_instance)
+    booker = FastClaimer(selenium_engine.claim_slot, *profile, confirm=True)
+    result = booker.claim(driver, config_instance, msg_header)
+    assert result['confirmed']
+    assert [(b['slot'], b['Nome']) for b in server.bookings] == [(result['label'], 'Test')]
@@ -0,0 +1,147 @@
+"""Tests of the browserless scan engine: the page parser, and whole and sticky scans on the mock site."""
+from datetime import date, timedelta
+
+import pytest
+
+import mock_siga
+from http_engine import HttpScanEngine, HttpScanError, SigaPageParser, StickySession
+from slot_parser import parse_slot_datetime
+from yaml_loader import YamlConfigItem
+
+LARANJEIRAS = 'Loja do Cidadão Laranjeiras'
+PAGE = """<form id="formPasso3" action="/Marcacao/Passo3" method="post">
+<input type="hidden" name="IdEntidade" value="176">
+<input type="checkbox" name="Aceito" value="1">
+<input type="submit" name="Enviar" value="Próximo">
+<select id="IdDistrito" name="IdDistrito"><option value="">Selecione</option>
+<option value="11" selected>Lisboa</option><option value="13">Porto</option></select>
+<select id="IdLocalidade" name="IdLocalidade"><option value="17">Lisboa</option></select>
+<button class="btn btn-selecionar-entidade" name="IdEntidade" value="176">IRN</button>
+</form>
+<div class="schedule-list">
+<div class="col-md-5 m-b-10" title="Loja A"><a href="#"><span> 02-03-2026 10:00 </span></a></div>
+<div class="col-md-5 m-b-10" title="Loja B"><a href="#"><span>09:15 - 03-03-2026</span></a></div>
+</div>
+<div class="error-message"><div class="col-md-12 no_padding"><h5>Sem vagas</h5></div></div>"""
+
+
+def test_parser_reads_forms_slots_and_error_message():
+    page = SigaPageParser()
+    page.feed(PAGE)
+    page.close()
+    form = page.get_form_with('IdDistrito')
+    assert form is page.forms[0] and form.action == '/Marcacao/Passo3'
+    assert form.fields == {'IdEntidade': '176', 'IdDistrito': '11', 'IdLocalidade': '17'}
+    assert form.get_label('IdDistrito', 13) == 'Porto'
+    assert form.get_label('IdLocalidade', 99) == '99'
+    assert [attrs['value'] for _, attrs in page.entity_buttons] == ['176']
+    assert page.slots == [('Loja A', '02-03-2026 10:00'), ('Loja B', '09:15 - 03-03-2026')]
+    assert page.error_message.strip() == 'Sem vagas'
+    assert page.get_form_with('Horario') is None
+
+
+def config(local_atendimento=591, localidade=17, max_days=30):
+    return YamlConfigItem({'search': {
+        'title': 'Mock', 'max_days': max_days, 'entity_opt': 176,
+        'service_opt': {'tema': 22002, 'subtema': 22003, 'motivo': 22705},
+        'location_opt': {'distrito': 11, 'localidade': localidade,
+                         'local_atendimento': local_atendimento}}})
+
+
+def expected_slots(max_days=30):
+    last = date.today() + timedelta(days=max_days)
+    return [label for label in mock_siga.slot_labels('591')
+            if parse_slot_datetime(label).date() <= last]
+
+
+@pytest.fixture(name='server')
+def fixture_server():
+    server = mock_siga.MockSigaServer().start()
+    yield server
+    server.stop()
+
+
+def test_scan_reads_the_slots_of_the_results_page(server):
+    msg_header, time_slots = HttpScanEngine(base_url=server.url).scan(config())
+    assert dict(time_slots) == {LARANJEIRAS: expected_slots()}
+    assert msg_header.get_results_read()
+    assert msg_header.get_entity() == mock_siga.ENTITIES['176']
+    assert msg_header.get_category() == mock_siga.CATEGORIES['22002']
+    assert set(msg_header.get_step_timings()) == {'entity', 'step_two', 'step_three',
+                                                  'time_slots'}
+    assert server.requests == 3
+
+
+def test_scan_without_slots_reads_the_error_message(server):
+    msg_header, time_slots = HttpScanEngine(base_url=server.url).scan(
+        config(local_atendimento=889, localidade=6))
+    assert not time_slots
+    assert msg_header.get_results_read()
+
+
+def test_scan_of_a_missing_page_fails(server):
+    engine = HttpScanEngine(base_url=server.url.replace('Entidades', 'Missing'))
+    with pytest.raises(HttpScanError):
+        engine.scan(config())
+
+
+def test_sticky_scan_submits_the_last_step_again(server):
+    engine = HttpScanEngine(base_url=server.url, sticky=True)
+    _, first = engine.scan(config())
+    assert server.requests == 3
+
+    msg_header, time_slots = engine.scan(config())
+    assert server.requests == 4
+    assert time_slots == first
+    assert 'refresh' in msg_header.get_step_timings()
+    assert msg_header.get_entity() == mock_siga.ENTITIES['176']
+    assert msg_header.get_results_read()
+
+    # An edited search starts a new session
+    engine.scan(config(max_days=7))
+    assert server.requests == 7
+
+
+def test_expired_sticky_session_runs_the_whole_search(server):
+    engine = HttpScanEngine(base_url=server.url, sticky=True)
+    _, first = engine.scan(config())
+    server.expire_sessions()
+
+    msg_header, time_slots = engine.scan(config())
+    # The refused refresh, then the three steps
+    assert server.requests == 3 + 1 + 3
+    assert time_slots == first
+    assert 'refresh' not in msg_header.get_step_timings()
+
+    engine.scan(config())
+    assert server.requests == 8
+
+
+def test_old_sticky_session_is_started_again(server):
+    engine = HttpScanEngine(base_url=server.url, sticky=True, max_age=0)
+    engine.scan(config())
+    engine.scan(config())
+    assert server.requests == 6
+
+
+def test_sticky_sessions_left_behind_are_closed(server, monkeypatch):
+    closed = []
+    monkeypatch.setattr(StickySession, 'close', lambda sticky: closed.append(sticky))
+    engine = HttpScanEngine(base_url=server.url, sticky=True)
+    engine.scan(config())
+    server.expire_sessions()
+    # The refused session is closed before the whole search starts a new one
+    engine.scan(config())
+    assert len(closed) == 1
+    # Closing the engine closes the sessions of both searches
+    engine.scan(config(max_days=7))
+    engine.close()
+    assert len(closed) == 3
+
+
+def test_closed_sticky_session_keeps_the_pool_open(server):
+    engine = HttpScanEngine(base_url=server.url, sticky=True, max_age=0)
+    engine.scan(config())
+    _, time_slots = engine.scan(config())
+    assert dict(time_slots) == {LARANJEIRAS: expected_slots()}
+    engine.close()
@@ -0,0 +1,32 @@
+"""Tests of the labels of the search metrics."""
+import metrics
+from metrics import MetricsRegistry, config_labels, record_scan
+from yaml_loader import YamlConfigItem
+
+
+def untitled(localidade):
+    return YamlConfigItem({'search': {
+        'entity_opt': 176, 'service_opt': {'tema': 22002, 'subtema': 22003, 'motivo': 22705},
+        'location_opt': {'distrito': 11, 'localidade': localidade}}})
+
+
+def test_untitled_configurations_are_kept_apart(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics, 'METRICS', registry)
+    first, second = untitled(17), untitled(6)
+    record_scan(first, 'http', 'success', {'entity': 0.2}, 1.0)
+    record_scan(second, 'http', 'timeout', seconds=2.0)
+
+    text = registry.render()
+    assert f'siga_scans_total{{config="{first.key}",engine="http",result="success",title=""}} 1' \
+        in text
+    assert f'siga_scans_total{{config="{second.key}",engine="http",result="timeout",title=""}} 1' \
+        in text
+    assert f'siga_step_duration_seconds_count{{config="{first.key}",step="entity",title=""}} 1' \
+        in text
+
+
+def test_config_labels():
+    config_instance = untitled(17).replace(title='IRN Lisboa')
+    assert config_labels(config_instance) == {'config': config_instance.key,
+                                              'title': 'IRN Lisboa'}
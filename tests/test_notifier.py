@@ -0,0 +1,87 @@
+"""Tests of the delivery, the retries and the failures of the NotificationDispatcher."""
+import pytest
+import requests
+
+import notifier
+from notifier import NotificationDispatcher
+
+
+class FakeResponse:
+    """An answer of the Telegram API."""
+    def __init__(self, status_code, answer):
+        self.status_code = status_code
+        self.answer = answer
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        if self.answer is None:
+            raise ValueError('Not JSON')
+        return self.answer
+
+
+class FakeSession:
+    """Answers the Telegram calls in turn, keeping the messages posted."""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.posted = []
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def post(self, url, data=None, timeout=None):
+        self.posted.append(data['text'])
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def close(self):
+        pass
+
+
+def deliver(monkeypatch, *responses):
+    session = FakeSession(*responses)
+    monkeypatch.setattr(notifier.requests, 'Session', lambda: session)
+    dispatcher = NotificationDispatcher('token', max_retries=2, backoff=0, coalesce_window=0)
+    dispatcher.start()
+    dispatcher.enqueue_telegram('chat', 'Vagas em *Lisboa*')
+    dispatcher.stop()
+    return dispatcher, session
+
+
+def test_message_is_sent(monkeypatch):
+    dispatcher, session = deliver(monkeypatch, FakeResponse(200, {'ok': True, 'result': {}}))
+    assert session.posted == ['Vagas em *Lisboa*']
+    assert dispatcher.failed == 0
+    assert dispatcher.delivery_latency.count == 1
+
+
+@pytest.mark.parametrize('response', [
+    FakeResponse(400, {'ok': False, 'description': "Bad Request: can't parse entities"}),
+    FakeResponse(403, None),
+    FakeResponse(200, {'ok': False, 'description': 'Refused'}),
+])
+def test_refused_message_fails_without_retry(monkeypatch, response):
+    dispatcher, session = deliver(monkeypatch, response)
+    assert len(session.posted) == 1
+    assert dispatcher.failed == 1
+    assert dispatcher.delivery_latency.count == 0
+
+
+def test_server_errors_are_retried(monkeypatch):
+    dispatcher, session = deliver(monkeypatch, FakeResponse(502, None),
+                                  requests.ConnectionError('reset'),
+                                  FakeResponse(200, {'ok': True}))
+    assert len(session.posted) == 3
+    assert dispatcher.failed == 0
+    assert dispatcher.delivery_latency.count == 1
+
+
+def test_message_fails_after_the_retries(monkeypatch):
+    dispatcher, session = deliver(monkeypatch, *[FakeResponse(503, None)] * 3)
+    assert len(session.posted) == 3
+    assert dispatcher.failed == 1
+    assert dispatcher.delivery_latency.count == 0
@@ -0,0 +1,36 @@
+"""Tests of the sticky refresh of the Selenium engine, with a fake driver."""
+import time
+
+import pytest
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+import selenium_engine
+from notif_data import NotificationData
+from yaml_loader import YamlConfigItem
+
+CONFIG = YamlConfigItem({'search': {
+    'title': 'Laranjeiras', 'entity_opt': 176,
+    'service_opt': {'tema': 22002, 'subtema': 22003, 'motivo': 22705},
+    'location_opt': {'distrito': 11, 'localidade': 17, 'local_atendimento': 591}}})
+
+
+class FailingDriver:
+    """A WebDriver whose scripts fail with the given error."""
+    def __init__(self, error):
+        self.error = error
+        self.scripts = 0
+
+    def execute_async_script(self, *args):
+        self.scripts += 1
+        raise self.error
+
+
+@pytest.mark.parametrize('error', [TimeoutException('script timeout'),
+                                   WebDriverException('tab crashed')])
+def test_failed_refresh_runs_the_whole_search(error):
+    driver = FailingDriver(error)
+    selenium_engine.STICKY_STATE[driver] = (CONFIG.digest, '/Marcacao/Passo3', {}, (None,) * 7,
+                                            time.monotonic())
+    assert selenium_engine.refresh_schedule(driver, CONFIG, NotificationData()) is False
+    assert driver.scripts == 1
+    assert driver not in selenium_engine.STICKY_STATE
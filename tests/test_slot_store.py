@@ -0,0 +1,125 @@
+"""Tests of the new and gone time slots of the SlotStore and of the notifications built on them."""
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import siga
+from notif_data import NotificationData
+from slot_store import SlotStore
+from yaml_loader import YamlConfigItem
+
+CONFIG = YamlConfigItem({'search': {
+    'title': 'Laranjeiras', 'entity_opt': 176,
+    'service_opt': {'tema': 22002, 'subtema': 22003, 'motivo': 22705},
+    'location_opt': {'distrito': 11, 'localidade': 17, 'local_atendimento': 591}}})
+
+
+def at(minute):
+    return datetime(2026, 3, 1, 10, minute)
+
+
+@pytest.fixture(name='store')
+def fixture_store():
+    store = SlotStore(':memory:')
+    yield store
+    store.close()
+
+
+def test_update_reports_new_and_gone_slots(store):
+    new_slots, gone_slots = store.update('a', {'L': ['02-03-2026 10:00', '03-03-2026 10:00']},
+                                         seen_at=at(0))
+    assert new_slots == {'L': ['02-03-2026 10:00', '03-03-2026 10:00']}
+    assert not gone_slots
+
+    new_slots, gone_slots = store.update('a', {'L': ['03-03-2026 10:00'],
+                                               'M': ['10:30 - 04-03-2026']}, seen_at=at(5))
+    assert new_slots == {'M': ['10:30 - 04-03-2026']}
+    assert gone_slots == {'L': ['02-03-2026 10:00']}
+
+    new_slots, gone_slots = store.update('a', {'L': ['03-03-2026 10:00'],
+                                               'M': ['10:30 - 04-03-2026']}, seen_at=at(10))
+    assert not new_slots
+    assert not gone_slots
+
+
+def test_reappeared_slot_is_new_again(store):
+    store.update('a', {'L': ['02-03-2026 10:00']}, seen_at=at(0))
+    store.update('a', {}, seen_at=at(5))
+    new_slots, _ = store.update('a', {'L': ['02-03-2026 10:00']}, seen_at=at(10))
+    assert new_slots == {'L': ['02-03-2026 10:00']}
+    history = store.get_history('a')
+    assert [(row['first_seen'], row['active']) for row in history] == \
+        [(at(10).isoformat(), 1)]
+
+
+def test_keep_locations_are_not_gone(store):
+    store.update('a', {'L': ['02-03-2026 10:00'], 'M': ['03-03-2026 10:00']}, seen_at=at(0))
+    new_slots, gone_slots = store.update('a', {}, seen_at=at(5), keep_locations=['M'])
+    assert not new_slots
+    assert gone_slots == {'L': ['02-03-2026 10:00']}
+    assert [row['location'] for row in store.get_history('a') if row['active']] == ['M']
+
+
+def test_first_search_is_not_a_release(store, tmp_path):
+    store.update('a', {'L': ['02-03-2026 10:00']}, seen_at=at(0))
+    store.update('a', {'L': ['02-03-2026 10:00', '03-03-2026 10:00']}, seen_at=at(5))
+    assert store.get_release_times('a') == [at(5)]
+
+    # Opened again: the slots released while nothing was searching are not release times
+    path = str(tmp_path / 'slots.db')
+    reopened = SlotStore(path)
+    reopened.update('a', {'L': ['02-03-2026 10:00']}, seen_at=at(0))
+    reopened.close()
+    reopened = SlotStore(path)
+    new_slots, _ = reopened.update('a', {'L': ['02-03-2026 10:00', '04-03-2026 10:00']},
+                                   seen_at=at(30))
+    assert new_slots == {'L': ['04-03-2026 10:00']}
+    assert not reopened.get_release_times('a')
+    reopened.update('a', {'L': ['05-03-2026 10:00']}, seen_at=at(35))
+    assert reopened.get_release_times('a') == [at(35)]
+    reopened.close()
+
+
+def test_database_without_the_initial_flag_is_upgraded(tmp_path):
+    path = tmp_path / 'slots.db'
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE slots (config_key TEXT NOT NULL, location TEXT NOT NULL,
+            slot_at TEXT NOT NULL, label TEXT NOT NULL, first_seen TEXT NOT NULL,
+            last_seen TEXT NOT NULL, active INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (config_key, location, slot_at));
+        INSERT INTO slots VALUES ('a', 'L', '2026-03-02T10:00:00', '02-03-2026 10:00',
+                                  '2026-03-01T09:00:00', '2026-03-01T09:00:00', 1);""")
+    conn.close()
+    store = SlotStore(str(path))
+    assert store.get_release_times('a') == [datetime(2026, 3, 1, 9, 0)]
+    store.close()
+
+
+def test_configurations_are_kept_apart(store):
+    store.update('a', {'L': ['02-03-2026 10:00']}, seen_at=at(0))
+    new_slots, gone_slots = store.update('b', {'L': ['02-03-2026 10:00']}, seen_at=at(0))
+    assert new_slots == {'L': ['02-03-2026 10:00']}
+    assert not gone_slots
+
+
+def test_search_without_results_page_changes_nothing(store, monkeypatch):
+    sent = []
+    monkeypatch.setattr(siga, 'SLOT_STORE', store)
+    monkeypatch.setattr(siga, 'send_message', lambda *args: sent.append(args))
+    found = NotificationData()
+    found.set_time_slots({'L': ['02-03-2026 10:00']})
+    found.set_results_read(True)
+    siga.notify_changes(found, CONFIG)
+    assert len(sent) == 1
+
+    # The results page timed out: no time slots were read, none are gone
+    siga.notify_changes(NotificationData(), CONFIG)
+    assert len(sent) == 1
+    assert [row['active'] for row in store.get_history(CONFIG.key)] == [1]
+
+    none_left = NotificationData()
+    none_left.set_results_read(True)
+    siga.notify_changes(none_left, CONFIG)
+    assert sent[-1][2] == {'L': ['02-03-2026 10:00']}
@@ -0,0 +1,104 @@
+"""Tests of the per-key limit and the bounded workers of the TaskExecutor."""
+import time
+import threading
+
+import pytest
+
+from task_executor import TaskExecutor
+
+
+class Gate:
+    """A task that blocks until it is opened, counting the runs at the same time."""
+    def __init__(self):
+        self.opened = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.running = 0
+        self.peak = 0
+        self.__lock = threading.Lock()
+
+    def run(self, result=None):
+        with self.__lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.started.release()
+        self.opened.wait(5)
+        with self.__lock:
+            self.running -= 1
+        return result
+
+    def wait_started(self, count):
+        for _ in range(count):
+            assert self.started.acquire(timeout=5)
+
+
+def wait_free(executor, key):
+    """Waits until the key is freed, which the done callback does after the future resolved."""
+    deadline = time.monotonic() + 5
+    while executor.get_running(key):
+        assert time.monotonic() < deadline, f'{key} was never freed'
+        time.sleep(0.001)
+
+
+@pytest.fixture(name='executor')
+def fixture_executor():
+    executor = TaskExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def test_same_key_is_skipped_while_running(executor):
+    gate = Gate()
+    first = executor.submit('a', gate.run, 1)
+    gate.wait_started(1)
+    assert executor.submit('a', gate.run, 2) is None
+    other = executor.submit('b', gate.run, 3)
+    gate.wait_started(1)
+
+    gate.opened.set()
+    assert first.result(5) == 1 and other.result(5) == 3
+    # The key is free again once its run finished
+    wait_free(executor, 'a')
+    assert executor.submit('a', gate.run, 4).result(5) == 4
+
+
+def test_per_key_limit():
+    executor = TaskExecutor(max_workers=4, per_key_limit=2)
+    gate = Gate()
+    futures = [executor.submit('a', gate.run) for _ in range(3)]
+    assert futures[2] is None
+    gate.wait_started(2)
+    assert executor.get_running('a') == 2
+    gate.opened.set()
+    assert all(future.result(5) is None for future in futures[:2])
+    wait_free(executor, 'a')
+    executor.shutdown()
+
+
+def test_workers_are_bounded():
+    executor = TaskExecutor(max_workers=2)
+    gate = Gate()
+    futures = [executor.submit(key, gate.run) for key in 'abcd']
+    gate.wait_started(2)
+    assert gate.running == 2
+    gate.opened.set()
+    for future in futures:
+        future.result(5)
+    assert gate.peak == 2
+    executor.shutdown()
+
+
+def test_failed_run_frees_its_key(executor):
+    def fail():
+        raise ValueError('boom')
+    with pytest.raises(ValueError):
+        executor.submit('a', fail).result(5)
+    wait_free(executor, 'a')
+    assert executor.submit('a', lambda: 'ok').result(5) == 'ok'
+
+
+def test_submit_after_shutdown_frees_its_key():
+    executor = TaskExecutor(max_workers=1)
+    executor.shutdown()
+    with pytest.raises(RuntimeError):
+        executor.submit('a', print)
+    assert executor.get_running('a') == 0
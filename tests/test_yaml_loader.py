@@ -0,0 +1,101 @@
+"""Tests of the reuse of validated configurations by the YamlLoader, on reload and from the cache."""
+import json
+
+import pytest
+
+import yaml_loader
+from yaml_loader import YamlLoader
+
+ENTRY = """- search:
+    title: {title}
+    max_days: {max_days}
+    frequency: 5
+    entity_opt: 176
+    service_opt: {{tema: 22002, subtema: 22003, motivo: 22705}}
+    location_opt: {{distrito: 11, localidade: 17, local_atendimento: 591}}
+"""
+
+
+def write_configs(tmp_path, *entries):
+    path = tmp_path / 'config.yaml'
+    path.write_text(''.join(ENTRY.format(title=title, max_days=max_days)
+                            for title, max_days in entries), encoding='utf8')
+    return str(path)
+
+
+@pytest.fixture(name='validated')
+def fixture_validated(monkeypatch):
+    """Counts the entries validated against the schema."""
+    entries = []
+    validate_entry = yaml_loader.validate_entry
+
+    def counting(validator, entry):
+        entries.append(entry)
+        return validate_entry(validator, entry)
+    monkeypatch.setattr(yaml_loader, 'validate_entry', counting)
+    return entries
+
+
+def test_unchanged_entries_are_read_from_the_cache(tmp_path, validated):
+    cache_path = str(tmp_path / 'cache.json')
+    path = write_configs(tmp_path, ('A', 7), ('B', 7))
+    first = YamlLoader(path, cache_path=cache_path)
+    assert len(validated) == 2
+
+    validated.clear()
+    second = YamlLoader(path, cache_path=cache_path)
+    assert not validated
+    assert [c.key for c in second.get_instances()] == [c.key for c in first.get_instances()]
+    assert [c.data for c in second.get_instances()] == [c.data for c in first.get_instances()]
+
+
+def test_edited_entry_is_validated_again(tmp_path, validated):
+    cache_path = str(tmp_path / 'cache.json')
+    YamlLoader(write_configs(tmp_path, ('A', 7), ('B', 7)), cache_path=cache_path)
+
+    validated.clear()
+    loader = YamlLoader(write_configs(tmp_path, ('A', 7), ('B', 9)), cache_path=cache_path)
+    assert [entry['search']['title'] for entry in validated] == ['B']
+    assert loader.get_instances()[1].max_days == 9
+    with open(cache_path, encoding='utf8') as file:
+        assert len(json.load(file)['entries']) == 2
+
+
+def test_cache_of_another_schema_is_ignored(tmp_path, validated):
+    cache_path = tmp_path / 'cache.json'
+    path = write_configs(tmp_path, ('A', 7))
+    YamlLoader(path, cache_path=str(cache_path))
+    cache = json.loads(cache_path.read_text(encoding='utf8'))
+    cache['schema'] = 'another'
+    cache_path.write_text(json.dumps(cache), encoding='utf8')
+
+    validated.clear()
+    YamlLoader(path, cache_path=str(cache_path))
+    assert len(validated) == 1
+
+
+def test_invalid_entry_is_never_cached(tmp_path, validated):
+    cache_path = str(tmp_path / 'cache.json')
+    path = write_configs(tmp_path, ('A', 7), ('B', 'many'))
+    loader = YamlLoader(path, cache_path=cache_path)
+    assert loader.get_len_valid_configs() == 1
+    assert loader.get_invalid_positions() == [2]
+
+    validated.clear()
+    YamlLoader(path, cache_path=cache_path)
+    assert [entry['search']['title'] for entry in validated] == ['B']
+
+
+def test_reload_reuses_the_previous_instances(tmp_path, validated):
+    path = write_configs(tmp_path, ('A', 7), ('B', 7))
+    previous = YamlLoader(path)
+
+    validated.clear()
+    loader = YamlLoader(write_configs(tmp_path, ('A', 7), ('B', 9)), previous=previous)
+    assert [entry['search']['title'] for entry in validated] == ['B']
+    assert loader.get_instances()[0] is previous.get_instances()[0]
+
+
+def test_no_cache_file_without_a_path(tmp_path):
+    YamlLoader(write_configs(tmp_path, ('A', 7)))
+    assert [p.name for p in tmp_path.iterdir()] == ['config.yaml']
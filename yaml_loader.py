@@ -4,16 +4,35 @@ Imports:
 - yaml: A library for working with YAML files. Used for loading YAML data.
 - Validator from cerberus: A library for data validation. Used for validating configurations against a schema.
 - logging: Logging facility for Python.
+- json, hashlib: Used to compute the stable key and the content digest of each configuration,
+  and to keep the validated entries in the cache file.
+- types: Provides the read-only mappings of the compiled configurations.
+- datetime: Used to parse the time window of each configuration.
 """
 import os
+import json
+import hashlib
 import logging
+from types import MappingProxyType
+from datetime import datetime
 import yaml
 from cerberus import Validator
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError: # PyYAML built without libyaml
+    from yaml import SafeLoader
+
 # Configure logging
 # logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Below this number of entries validating in this process is faster than starting a pool
+PARALLEL_MIN_ENTRIES = 200
+
+# Validators compiled from each schema, by the digest of the schema
+_VALIDATORS = {}
+
 
 class YamlLoader:
     """
@@ -22,35 +41,76 @@ class YamlLoader:
     and retrieve configurations and instances of YamlConfigItem.
     Args:
         file_path (str): The path to the YAML file containing configurations.
+        previous (YamlLoader): A previous load of the file. Entries whose content did not change
+                               reuse its compiled instances instead of being validated again.
+        cache_path (str): A JSON file keeping the validated entries by content digest.
+        workers (int): Processes used to validate large files.
     Attributes:
         __schema_file (str): The path to the YAML schema file.
         __schema_data (dict): The schema data loaded from the schema file.
         __file_path (str): The path to the YAML configuration file.
         config_data (list): The YAML configuration data loaded from the file.
         __instances (list): A list of instances of YamlConfigItem representing configurations.
+        __compiled (dict): The valid instances by the content digest of their entry.
+        __valid_instances (tuple): The valid instances, in the order of the file.
     Methods:
-        __init__(file_path): Initializes the YamlLoader with the file path to the YAML configurations.
-        __create_instance(data): Creates an instance of YamlConfigItem from the given data.
-        __validate_yaml(data): Validates configurations against the schema.
+        __init__(file_path, ...): Initializes the YamlLoader with the file path to the YAML configurations.
+        __create_instance(index, result): Creates an instance of YamlConfigItem from a validation result.
+        __validate_all(entries, workers): Validates entries against the schema.
+        __read_cache(cache_path): Reads the validated entries of the cache file.
+        __write_cache(cache_path): Writes the validated entries to the cache file.
         get_instances(): Gets all valid instances of YamlConfigItem.
+        get_invalid_positions(): Gets the positions of the invalid entries.
         get_configurations(): Returns all configurations.
         get_configuration(index): Returns a configuration by index.
         __load_yaml(file_path): Loads YAML data from a file.
 
     """
-    def __init__(self, file_path):
+    def __init__(self, file_path, previous=None, cache_path=None, workers=1):
         """
         Initializes the YamlLoader with the file path to the YAML configurations.
         Args:
         - file_path (str): The path to the YAML file containing configurations.
+        - previous (YamlLoader): A previous load whose unchanged entries are reused.
+        - cache_path (str): A JSON file keeping the validated entries by content digest, so
+                            unchanged entries are not validated again on the next start.
+        - workers (int): Processes used to validate large files, 1 to validate in this one.
         """
         self.__schema_file = "search_schema.yaml"
         self.__schema_data = self.__load_yaml(self.__schema_file)
+        self.__schema_digest = entry_digest(self.__schema_data)
         self.__file_path = file_path
         self.config_data = self.__load_yaml(self.__file_path)
+        if not isinstance(self.config_data, list):
+            if self.config_data is not None:
+                logger.error("YAML file %s must contain a list of searches", file_path)
+            self.config_data = []
 
-        self.__instances = [self.__create_instance(i, item) \
-                            for i, item in enumerate(self.config_data, start=1)]
+        reusable = previous.__compiled if previous is not None else {}
+        cached = self.__read_cache(cache_path)
+        digests = [entry_digest(item) for item in self.config_data]
+        pending = [i for i, digest in enumerate(digests)
+                   if digest not in reusable and digest not in cached]
+        results = dict(zip(pending, self.__validate_all([self.config_data[i] for i in pending],
+                                                        workers)))
+
+        self.__compiled = {}
+        self.__instances = []
+        for i, digest in enumerate(digests):
+            if digest in reusable:
+                logger.debug("Configuration #%s is unchanged", i + 1)
+                instance = reusable[digest]
+            elif digest in cached:
+                logger.debug("Configuration #%s was already validated", i + 1)
+                instance = YamlConfigItem(cached[digest])
+            else:
+                instance = self.__create_instance(i + 1, results[i])
+            if instance is not None:
+                self.__compiled[digest] = instance
+            self.__instances.append(instance)
+        self.__valid_instances = tuple(filter(None, self.__instances))
+        if cache_path and (pending or len(cached) != len(self.__compiled)):
+            self.__write_cache(cache_path)
 
         valids = self.get_len_valid_configs()
         configs = self.get_len_loaded_configs()
@@ -63,7 +123,7 @@ class YamlLoader:
         Returns:
             int: A number indication how many configurations are valid inside the file.
         """
-        return len(list(filter(None, self.__instances)))
+        return len(self.__valid_instances)
 
     def get_len_loaded_configs(self):
         """
@@ -73,52 +133,88 @@ class YamlLoader:
         """
         return len(self.__instances)
 
+    def get_invalid_positions(self):
+        """
+        Gets the positions in the file of the entries that failed the validation.
+        Returns:
+            list: The positions, starting at 1.
+        """
+        return [i + 1 for i, instance in enumerate(self.__instances) if instance is None]
 
-    def __create_instance(self, index, data):
+    def __create_instance(self, index, result):
         """
-        Creates an instance of YamlConfigItem from the given data.
+        Creates an instance of YamlConfigItem from the validation result of an entry.
         Args:
-        - data (dict): The data representing a single configuration.
+        - index (int): The position of the entry in the file, starting at 1.
+        - result (dict): The validation result of the entry.
         Returns:
-        - YamlConfigItem: An instance representing the configuration.
-        """
-        #return YamlConfigItem(self.__validate_yaml(data))
-        validation_results = self.__validate_yaml(data)
-        for result in validation_results:
-            logger.info("Configuration #%s is valid: %s" , index, result['is_valid'])
-            if result['is_valid']:
-                return YamlConfigItem(result['yaml_config'])
-            else:
-                logger.info("Errors: %s" , result['errors'])
+        - YamlConfigItem: An instance representing the configuration, or None if invalid.
+        """
+        logger.info("Configuration #%s is valid: %s" , index, result['is_valid'])
+        if result['is_valid']:
+            return YamlConfigItem(result['yaml_config'])
+        logger.info("Errors: %s" , result['errors'])
+        return None
+
+    def __validate_all(self, entries, workers):
+        """
+        Validates entries against the schema, on a pool of processes when there are enough of
+        them to pay for starting it.
+        Args:
+        - entries (list): The entries to validate.
+        - workers (int): The number of processes.
+        Returns:
+        - list of dict: The validation result of each entry, in order.
+        """
+        if workers <= 1 or len(entries) < PARALLEL_MIN_ENTRIES:
+            validator = get_validator(self.__schema_data, self.__schema_digest)
+            return [validate_entry(validator, entry) for entry in entries]
 
+        # pylint: disable=import-outside-toplevel
+        from concurrent.futures import ProcessPoolExecutor
+        size = -(-len(entries) // workers)
+        chunks = [entries[i:i + size] for i in range(0, len(entries), size)]
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            results = pool.map(validate_entries, [self.__schema_data] * len(chunks), chunks)
+            return [result for chunk in results for result in chunk]
 
-    def __validate_yaml(self, data):
+    def __read_cache(self, cache_path):
         """
-        Validates configurations against the schema.
+        Reads the validated entries of the cache file, ignored when the schema changed.
         Returns:
-        - list of dict: A list of validation results for each configuration.
-          Each validation result contains the configuration number, validation status,
-          and validation errors.
-        Usage:
-            validation_results = loader.validate_yaml()
-            for result in validation_results:
-                print(f"Configuration '{result['config_number']}' is valid:", result['is_valid'])
-                if not result['is_valid']:
-                    print("Errors:")
-                    print(result['errors'])
-        """
-        val_results = []
-        val = Validator(self.__schema_data)
-        normalized_data = val.normalized(data, self.__schema_data)
-        #for index, yaml_config in enumerate(self.config_data, start=1):
-        is_valid = val.validate(normalized_data, self.__schema_data)
-        val_results.append({
-            'yaml_config': normalized_data,
-            'is_valid': is_valid,
-            'errors': val.errors
-        })
-
-        return val_results
+        - dict: The validated configurations by content digest.
+        """
+        if not cache_path or not os.path.isfile(cache_path):
+            return {}
+        try:
+            with open(cache_path, 'r', encoding='utf8') as file:
+                cache = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring the configuration cache %s: %s", cache_path, e)
+            return {}
+        if not isinstance(cache, dict) or cache.get('schema') != self.__schema_digest:
+            return {}
+        return cache.get('entries') or {}
+
+    def __write_cache(self, cache_path):
+        """
+        Writes the validated entries of this load to the cache file.
+        """
+        entries = {}
+        for digest, instance in self.__compiled.items():
+            data = thaw(instance.data)
+            try:
+                if json.loads(json.dumps(data)) == data:
+                    entries[digest] = data
+            except (TypeError, ValueError):
+                continue
+        temp_path = f'{cache_path}.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf8') as file:
+                json.dump({'schema': self.__schema_digest, 'entries': entries}, file)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logger.warning("Could not write the configuration cache %s: %s", cache_path, e)
 
     def get_instances(self):
         """
@@ -126,8 +222,7 @@ class YamlLoader:
         Returns:
             list: A list containing all valid instances of YamlConfigItem.
         """
-        instances = list(filter(None, self.__instances))
-        return instances
+        return list(self.__valid_instances)
 
     def get_configurations(self):
         """
@@ -169,7 +264,7 @@ class YamlLoader:
         try:
             with open(file_path, 'r', encoding='utf8') as file:
                 logger.info('YAML file successfully loaded: %s', file_path)
-                return yaml.safe_load(file)
+                return yaml.load(file, Loader=SafeLoader)
         except FileNotFoundError:
             logger.error("YAML file not found at path: %s", file_path)
             raise
@@ -184,51 +279,239 @@ class YamlLoader:
 
 class YamlConfigItem:
     """
-    Represents a single configuration item in the YAML configuration file.
+    Represents a single configuration item in the YAML configuration file, compiled once from
+    the validated data into an immutable object with typed fields.
+    Attributes:
+        title (str): The title of the search.
+        start_time (datetime.time): Start of the daily time window.
+        end_time (datetime.time): End of the daily time window.
+        max_days (int): Threshold of days to look for time slots.
+        frequency (int): Minutes between two searches.
+        engine (str): The scan engine, 'selenium' or 'http'.
+        fan_out (bool): Split a search of every local into one search per service desk.
+        entity_opt (int): The ID of the entity button.
+        service_opt (Mapping): The tema, subtema and motivo of the service.
+        location_opt (Mapping): The distrito, localidade and local_atendimento.
+        wait_opt (Mapping): The timeout and poll of each step.
+        adaptive_opt (Mapping or None): The bounds of the adaptive frequency.
+        claim_opt (Mapping or None): The rules of the slots to claim as soon as they are found.
+        key (str): A stable key of the search, used to keep its slot history.
+        digest (str): The digest of the validated configuration, changed by any edit.
+        data (Mapping): The validated configuration.
     """
+    __slots__ = ('title', 'start_time', 'end_time', 'max_days', 'frequency', 'engine', 'fan_out',
+                 'entity_opt', 'service_opt', 'location_opt', 'wait_opt', 'adaptive_opt',
+                 'claim_opt', 'key', 'digest', 'data', '_index')
+
     def __init__(self, data):
         """
         Initializes the YamlConfigItem with the configuration data.
         Args:
         - data (dict): The data representing a single configuration.
         """
-        self.data = data
-        # self.errors =
+        search = data.get('search', data)
+        values = {
+            'title': str(search.get('title', '')),
+            'start_time': parse_time(search.get('start_time', '07:00')),
+            'end_time': parse_time(search.get('end_time', '23:59')),
+            'max_days': int(search.get('max_days', 90)),
+            'frequency': int(search.get('frequency', 3)),
+            'engine': search.get('engine', 'selenium'),
+            'fan_out': bool(search.get('fan_out', False)),
+            'entity_opt': int(search['entity_opt']),
+            'service_opt': freeze(int_values(search['service_opt'])),
+            'location_opt': freeze(int_values(search['location_opt'])),
+            'wait_opt': freeze(search.get('wait_opt') or {}),
+            'adaptive_opt': freeze(search['adaptive_opt']) if search.get('adaptive_opt') else None,
+            'claim_opt': freeze(search['claim_opt']) if 'claim_opt' in search else None,
+            'data': freeze(data),
+        }
+        identity = {k: thaw(values[k]) for k in ('title', 'entity_opt', 'service_opt',
+                                                  'location_opt')}
+        values['key'] = hashlib.sha1(json.dumps(identity, sort_keys=True).encode('utf-8')) \
+            .hexdigest()[:16]
+        values['digest'] = entry_digest(data)
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, '_index', self.__build_index(data))
 
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
 
-    def get_value_by_key(self, key):
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return f"{type(self).__name__}(title={self.title!r}, key={self.key!r})"
+
+    def replace(self, **changes):
         """
-        Gets the value associated with the given key in the configuration.
+        Creates a copy of the configuration with some of its search values replaced.
         Args:
-        - key (str): The key to search for.
+        - changes: The search values to replace, e.g. title or location_opt.
         Returns:
-        - str or None: The value associated with the key if found, otherwise None.
+        - YamlConfigItem: The new configuration.
         """
-        return self._get_value_by_key_recursive(self.data, key)
+        data = thaw(self.data)
+        data.get('search', data).update(changes)
+        return YamlConfigItem(data)
 
-    def _get_value_by_key_recursive(self, data, key):
+    def in_window(self, moment):
         """
-        Helper method to get the value associated with the given key in the configuration.
+        Checks whether a moment falls inside the daily time window, with the rule the scheduler
+        uses: the whole end minute is included and the window may cross midnight.
+        Args:
+        - moment (datetime): The moment to check.
+        Returns:
+        - bool: True if the search may run at that moment.
+        """
+        from async_scheduler import in_time_window # pylint: disable=import-outside-toplevel
+        return in_time_window(moment, self.start_time, self.end_time)
+
+    def get_value_by_key(self, key):
+        """
+        Gets the value associated with the given key in the configuration.
+        Kept for compatibility: the typed attributes are preferred. Nested keys are indexed
+        once, so the lookup no longer walks the configuration.
         Args:
-        - data (dict or list): The nested dictionary or list to search within.
         - key (str): The key to search for.
         Returns:
-        - str or None: The value associated with the key if found, otherwise None.
-        """
-        if isinstance(data, dict):
-            for k, v in data.items():
-                if k == key:
-                    return v
-                elif isinstance(v, (dict, list)):
-                    result = self._get_value_by_key_recursive(v, key)
-                    if result is not None:
-                        return result
-        elif isinstance(data, list):
-            for item in data:
-                result = self._get_value_by_key_recursive(item, key)
-                if result is not None:
-                    return result
-        return None
+        - The value associated with the key if found, otherwise None. Times are "HH:MM" strings.
+        """
+        return self._index.get(key)
+
+    def __build_index(self, data):
+        """
+        Indexes every key of the configuration, keeping the first match of a depth-first walk
+        like the former recursive lookup, with the typed values of the compiled fields.
+        """
+        index = {}
+
+        def walk(node):
+            if isinstance(node, dict):
+                for k, v in node.items():
+                    if k not in index and v is not None:
+                        index[k] = v
+                    if isinstance(v, (dict, list)):
+                        walk(v)
+            elif isinstance(node, list):
+                for item in node:
+                    walk(item)
+
+        walk(data)
+        for name in ('title', 'max_days', 'frequency', 'engine', 'fan_out', 'entity_opt',
+                     'service_opt', 'location_opt', 'wait_opt', 'adaptive_opt', 'claim_opt'):
+            if name in index:
+                index[name] = getattr(self, name)
+        index['start_time'] = self.start_time.strftime('%H:%M')
+        index['end_time'] = self.end_time.strftime('%H:%M')
+        return freeze(index)
+
+
+def get_validator(schema_data, schema_digest):
+    """
+    Gets a Validator compiled once for a schema and reused for every entry.
+    Args:
+    - schema_data (dict): The schema.
+    - schema_digest (str): The digest of the schema.
+    Returns:
+    - Validator: The validator of the schema.
+    """
+    validator = _VALIDATORS.get(schema_digest)
+    if validator is None:
+        validator = _VALIDATORS[schema_digest] = Validator(schema_data)
+    return validator
+
+
+def validate_entry(validator, entry):
+    """
+    Normalizes and validates an entry.
+    Args:
+    - validator (Validator): The compiled validator.
+    - entry (dict): The entry as loaded from the YAML file.
+    Returns:
+    - dict: The normalized entry, whether it is valid and the validation errors.
+    """
+    is_valid = validator.validate(entry)
+    return {'yaml_config': validator.document, 'is_valid': is_valid, 'errors': validator.errors}
+
+
+def validate_entries(schema_data, entries):
+    """
+    Validates a chunk of entries on a worker process.
+    Args:
+    - schema_data (dict): The schema.
+    - entries (list): The entries.
+    Returns:
+    - list of dict: The validation result of each entry.
+    """
+    validator = get_validator(schema_data, entry_digest(schema_data))
+    return [validate_entry(validator, entry) for entry in entries]
+
+
+def entry_digest(entry):
+    """
+    Computes the digest of the content of a configuration entry, independent of key order.
+    Args:
+    - entry: The entry as loaded from the YAML file.
+    Returns:
+    - str: The SHA-1 hex digest.
+    """
+    return hashlib.sha1(json.dumps(entry, sort_keys=True, default=str).encode('utf-8')) \
+        .hexdigest()
+
+
+def parse_time(value):
+    """
+    Parses an "HH:MM" time of the day.
+    Args:
+    - value (str): The time.
+    Returns:
+    - datetime.time: The parsed time.
+    """
+    return datetime.strptime(str(value), '%H:%M').time()
+
+
+def int_values(options):
+    """
+    Converts the numeric option values to int.
+    Args:
+    - options (dict): The options.
+    Returns:
+    - dict: The options with integer values.
+    """
+    return {k: int(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else v
+            for k, v in options.items()}
+
+
+def freeze(value):
+    """
+    Makes a configuration value read-only: dicts become mapping proxies and lists tuples.
+    Args:
+    - value: The value.
+    Returns:
+    - The read-only value.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """
+    Converts a frozen configuration value back to plain dicts and lists.
+    Args:
+    - value: The frozen value.
+    Returns:
+    - The plain value.
+    """
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
 
 ## Example usage:
 #yaml_config = YamlLoader("search_config.yaml")